@@ -13,23 +13,40 @@
 
 import collections
 import datetime
+import importlib
 import os
 import subprocess
 import sys
 import re
 
-from botocore.credentials import JSONFileCache
-
-import botocore.auth
-import botocore.awsrequest
-import botocore.compat
-import botocore.hooks
-import botocore.session
+# Our hook is invoked for every git operation, so modules that are expensive to
+# import (botocore and our caching) are deferred until they're used.
 
 try:
-  from urlparse import urlparse  # python 2.x
+  from urllib import quote, unquote  # python 2.x
+  from urlparse import urlparse
 except ImportError:
-  from urllib.parse import urlparse  # python 3.x
+  from urllib.parse import quote, unquote, urlparse  # python 3.x
+
+
+# Subcommands of our console script, beyond its use as a git remote helper.
+
+COMMANDS = {
+    'agent': 'git_remote_codecommit.agent',
+    'credential': 'git_remote_codecommit.credential',
+    'mirror': 'git_remote_codecommit.mirror',
+    'proxy': 'git_remote_codecommit.proxy',
+    'throttle': 'git_remote_codecommit.throttle',
+}
+
+# Object filters a url's 'filter' option accepts, as with 'git clone --filter'.
+# Filters can be combined with 'combine:<filter>+<filter>'.
+
+FILTER_PATTERN = re.compile(r'^(blob:none|blob:limit=\d+[kmg]?|tree:\d+|object:type=(blob|tree|commit|tag)|sparse:oid=[^\s+]+)$')
+
+# Git protocol versions a url's 'protocol' option accepts.
+
+PROTOCOL_VERSIONS = ('0', '1', '2')
 
 
 class FormatError(Exception):
@@ -52,7 +69,11 @@ class CredentialsNotFound(Exception):
   pass
 
 
-class Context(collections.namedtuple('Context', ['session', 'repository', 'version', 'region', 'credentials'])):
+class TransportError(Exception):
+  pass
+
+
+class Context(collections.namedtuple('Context', ['session', 'repository', 'version', 'region', 'credentials', 'options'])):
   """
   Repository information the hook concerns, derived from git's remote url and
   the user's AWS profile.
@@ -62,6 +83,8 @@ class Context(collections.namedtuple('Context', ['session', 'repository', 'versi
   :var str version: protocol version for this hook
   :var str region: region the repository resides within
   :var botocore.credentials credentials: session credentials
+  :var dict options: transfer options of the url (see
+    :func:`~git_remote_codecommit.parse_options`), **None** if it has none
   """
 
   @staticmethod
@@ -79,7 +102,8 @@ class Context(collections.namedtuple('Context', ['session', 'repository', 'versi
     truncate the proceeding 'codecommit::' prefix for us.
 
     The '<profile>@' url is optional, using the aws sessions present profile
-    if not provided.
+    if not provided. Either form can end with transfer options such as
+    '?filter=blob:none&depth=50'.
 
     :param str remote_url: git remote url to parse
 
@@ -92,65 +116,187 @@ class Context(collections.namedtuple('Context', ['session', 'repository', 'versi
       * **RegionNotAvailable** if the url references a region that is not available
     """
 
-    url = urlparse(remote_url)
-    event_handler = botocore.hooks.HierarchicalEmitter()
-    profile = 'default'
-    repository = url.netloc
-    if not url.scheme or not url.netloc:
-      raise FormatError('The following URL is malformed: {}. A URL must be in one of the two following formats: codecommit://<profile>@<repository> or codecommit::<region>://<profile>@<repository>'.format(remote_url))
+    from git_remote_codecommit import cache, regions, trace
 
-    if '@' in url.netloc:
-      profile, repository = url.netloc.split('@', 1)
-      session = botocore.session.Session(profile = profile, event_hooks = event_handler)
+    with trace.phase('session'):
+      import botocore.hooks
+      import botocore.session
 
-      if profile not in session.available_profiles:
-        raise ProfileNotFound('The following profile was not found: {}. Available profiles are: {}. Either use one of the available profiles, or create an AWS CLI profile to use and then try again. For more information, see Configure an AWS CLI Profile in the AWS CLI User Guide.'.format(profile, ', '.join(session.available_profiles)))
-    else:
-      session = botocore.session.Session(event_hooks = event_handler)
+      from git_remote_codecommit import credential_cache
 
-    session.get_component('credential_provider').get_provider('assume-role').cache = JSONFileCache()
+      url = urlparse(remote_url)
+      event_handler = botocore.hooks.HierarchicalEmitter()
+      profile = 'default'
+      repository = url.netloc
+      if not url.scheme or not url.netloc:
+        raise FormatError('The following URL is malformed: {}. A URL must be in one of the two following formats: codecommit://<profile>@<repository> or codecommit::<region>://<profile>@<repository>'.format(remote_url))
 
-    try:
-      # when the aws cli is available support plugin authentication
+      options = parse_options(remote_url)
+
+      # Snapshot of how this profile resolved when our environment and AWS
+      # configuration were last the same, letting us skip re-deriving it.
+
+      snapshot = cache.get_profile(url.netloc.split('@', 1)[0] if '@' in url.netloc else None)
+
+      if '@' in url.netloc:
+        profile, repository = url.netloc.split('@', 1)
+        session = botocore.session.Session(profile = profile, event_hooks = event_handler)
+
+        if snapshot is None and profile not in session.available_profiles:
+          raise ProfileNotFound('The following profile was not found: {}. Available profiles are: {}. Either use one of the available profiles, or create an AWS CLI profile to use and then try again. For more information, see Configure an AWS CLI Profile in the AWS CLI User Guide.'.format(profile, ', '.join(session.available_profiles)))
+      else:
+        session = botocore.session.Session(event_hooks = event_handler)
+
+      session.get_component('credential_provider').get_provider('assume-role').cache = credential_cache.LockingJSONFileCache()
+      credential_cache.install(session)
+
+    with trace.phase('plugins'):
+      plugins = snapshot['plugins'] if snapshot else session.full_config.get('plugins', {})
+
+      if plugins:
+        try:
+          # when the aws cli is available support plugin authentication
 
-      import awscli.plugin
+          import awscli.plugin
 
-      awscli.plugin.load_plugins(
-          session.full_config.get('plugins', {}),
-          event_hooks = event_handler,
-          include_builtins = False,
-      )
+          awscli.plugin.load_plugins(
+              plugins,
+              event_hooks = event_handler,
+              include_builtins = False,
+          )
 
-      session.emit_first_non_none_response('session-initialized', session = session)
-    except ImportError:
-      pass
+          session.emit_first_non_none_response('session-initialized', session = session)
+        except ImportError:
+          pass
 
-    available_regions = [region for partition in session.get_available_partitions() for region in session.get_available_regions('codecommit', partition)]
+    with trace.phase('regions'):
+      if url.scheme == 'codecommit':
+        region = snapshot['region'] if snapshot else session.get_config_variable('region')
 
-    if url.scheme == 'codecommit':
-      region = session.get_config_variable('region')
+        if not region:
+          raise RegionNotFound('The following profile does not have an AWS Region: {}. You must set an AWS Region for this profile. For more information, see Configure An AWS CLI Profile in the AWS CLI User Guide.'.format(profile))
 
-      if not region:
-        raise RegionNotFound('The following profile does not have an AWS Region: {}. You must set an AWS Region for this profile. For more information, see Configure An AWS CLI Profile in the AWS CLI User Guide.'.format(profile))
+        if not regions.lookup(region):
+          raise RegionNotAvailable('The following AWS Region is not available for use with AWS CodeCommit: {}. For more information about CodeCommit\'s availability in AWS Regions, see the AWS CodeCommit User Guide. If an AWS Region is listed as supported but you receive this error, try updating your version of the AWS CLI or the AWS SDKs.'.format(region))
 
-      if region not in available_regions:
-        raise RegionNotAvailable('The following AWS Region is not available for use with AWS CodeCommit: {}. For more information about CodeCommit\'s availability in AWS Regions, see the AWS CodeCommit User Guide. If an AWS Region is listed as supported but you receive this error, try updating your version of the AWS CLI or the AWS SDKs.'.format(region))
+      elif re.match(r"^[a-z]{2}-\w*.*-\d{1}", url.scheme):
+        if regions.lookup(url.scheme):
+          region = url.scheme
 
-    elif re.match(r"^[a-z]{2}-\w*.*-\d{1}", url.scheme):
-      if url.scheme in available_regions:
-        region = url.scheme
+        else:
+          raise RegionNotAvailable('The following AWS Region is not available for use with AWS CodeCommit: {}. For more information about CodeCommit\'s availability in AWS Regions, see the AWS CodeCommit User Guide. If an AWS Region is listed as supported but you receive this error, try updating your version of the AWS CLI or the AWS SDKs.'.format(url.scheme))
 
       else:
-        raise RegionNotAvailable('The following AWS Region is not available for use with AWS CodeCommit: {}. For more information about CodeCommit\'s availability in AWS Regions, see the AWS CodeCommit User Guide. If an AWS Region is listed as supported but you receive this error, try updating your version of the AWS CLI or the AWS SDKs.'.format(url.scheme))
+        raise FormatError('The following URL is malformed: {}. A URL must be in one of the two following formats: codecommit://<profile>@<repository> or codecommit::<region>://<profile>@<repository>'.format(remote_url))
 
-    else:
-      raise FormatError('The following URL is malformed: {}. A URL must be in one of the two following formats: codecommit://<profile>@<repository> or codecommit::<region>://<profile>@<repository>'.format(remote_url))
-    credentials = session.get_credentials()
+    with trace.phase('credentials'):
+      credentials = _load_credentials(session, snapshot['method'] if snapshot else None)
 
     if not credentials:
       raise CredentialsNotFound('The following profile does not have credentials configured: {}. You must configure the access key and secret key for the profile. For more information, see Configure an AWS CLI Profile in the AWS CLI User Guide.'.format(profile))
 
-    return Context(session, repository, 'v1', region, credentials)
+    # credentials that didn't come from a provider (such as those botocore
+    # labels 'explicit') can't be resolved from one next time
+
+    if snapshot is None and getattr(credentials, 'method', 'explicit') != 'explicit':
+      cache.put_profile(url.netloc.split('@', 1)[0] if '@' in url.netloc else None, {
+          'region': session.get_config_variable('region'),
+          'plugins': plugins,
+          'method': credentials.method,
+      })
+
+    trace.record(profile = profile, repository = repository, region = region)
+    return Context(session, repository, 'v1', region, credentials, options)
+
+
+Context.__new__.__defaults__ = (None,)  # options
+
+
+def parse_options(remote_url):
+  """
+  Parses the transfer options of a remote url, which follow its repository as
+  a query string or fragment...
+
+  ::
+
+    codecommit://<profile>@<repository>?filter=blob:none&depth=50&protocol=2
+
+  * **filter**: objects to omit, as with 'git clone --filter'
+  * **depth**: number of commits to fetch from each tip, as with
+    'git clone --depth'
+  * **protocol**: git protocol version to negotiate (0, 1, or 2)
+  * **push-batch**: number of commits to push at a time along a branch's
+    history
+
+  :param str remote_url: git remote url to parse
+
+  :returns: **dict** mapping option names to their values (depth, protocol,
+    and push-batch as integers), or **None** if the url has no options
+
+  :raises: **FormatError** if an option is unrecognized, repeated, or has an
+    invalid value
+  """
+
+  url = urlparse(remote_url)
+  options = {}
+
+  for entry in '&'.join(part for part in (url.query, url.fragment) if part).split('&'):
+    if not entry:
+      continue
+
+    name, _, value = entry.partition('=')
+    name, value = unquote(name), unquote(value)
+
+    if name in options:
+      raise FormatError('The following URL provides its {} option more than once: {}'.format(name, remote_url))
+    elif name == 'filter':
+      if not all(FILTER_PATTERN.match(unquote(spec)) for spec in (value[8:].split('+') if value.startswith('combine:') else [value])):
+        raise FormatError('The following URL has an invalid filter: {}. Filters are the same as those of git clone, such as blob:none, blob:limit=1m, or tree:0.'.format(value))
+
+      options[name] = value
+    elif name == 'depth':
+      if not value.isdigit() or int(value) < 1:
+        raise FormatError('The following URL has an invalid depth: {}. Depth must be a positive number of commits.'.format(value))
+
+      options[name] = int(value)
+    elif name == 'push-batch':
+      if not value.isdigit() or int(value) < 1:
+        raise FormatError('The following URL has an invalid push-batch: {}. Batches must be a positive number of commits.'.format(value))
+
+      options[name] = int(value)
+    elif name == 'protocol':
+      if value not in PROTOCOL_VERSIONS:
+        raise FormatError('The following URL has an invalid protocol: {}. Protocol must be one of: {}.'.format(value, ', '.join(PROTOCOL_VERSIONS)))
+
+      options[name] = int(value)
+    else:
+      raise FormatError('The following URL has an unrecognized option: {}. Supported options are filter, depth, protocol, and push-batch, such as codecommit://<profile>@<repository>?filter=blob:none&depth=50&protocol=2'.format(name))
+
+  return options or None
+
+
+def _load_credentials(session, method = None):
+  """
+  Resolves a session's credentials. If we know which provider supplied them
+  last time we ask it directly, rather than each provider that precedes it
+  within botocore's chain. Should it no longer have credentials we fall back
+  to the full chain.
+  """
+
+  if method:
+    import botocore.exceptions
+
+    try:
+      provider = session.get_component('credential_provider').get_provider(method)
+    except botocore.exceptions.UnknownCredentialError:
+      provider = None
+
+    credentials = provider.load() if provider else None
+
+    if credentials:
+      return credentials
+
+  return session.get_credentials()
 
 
 def error(msg):
@@ -164,6 +310,9 @@ def main():
   CodeCommit repository.
   """
 
+  if len(sys.argv) >= 2 and sys.argv[1] in COMMANDS and not _invoked_by_git(sys.argv[1:]):
+    sys.exit(importlib.import_module(COMMANDS[sys.argv[1]]).main(sys.argv[2:]))
+
   if len(sys.argv) < 3:
     error('Too few arguments. This hook requires the git command and remote.')
 
@@ -172,20 +321,256 @@ def main():
 
   git_cmd, remote_url = sys.argv[1:3]
 
+  from git_remote_codecommit import agent, cache, static, throttle, trace
+
+  trace.start(remote = git_cmd, url = remote_url)
+
   try:
-    context = Context.from_url(remote_url)
-    authenticated_url = git_url(context.repository, context.version, context.region, context.credentials)
-    sys.exit(subprocess.call(['git', 'remote-http', git_cmd, authenticated_url]))
+    authenticated_url, context = None, None
+    options = parse_options(remote_url) or {}
+
+    if _env_flag('GIT_REMOTE_CODECOMMIT_PROXY'):
+      from git_remote_codecommit import proxy  # its server is costly to import, so only when used
+
+      with trace.phase('proxy'):
+        authenticated_url, source = proxy.git_url(remote_url), 'proxy'
+
+    if not authenticated_url:
+      with trace.phase('cache'):
+        authenticated_url, source = cache.get_url(remote_url), 'cache'
+
+    if not authenticated_url:
+      with trace.phase('agent'):
+        authenticated_url, source = agent.git_url(remote_url), 'agent'
+
+    if not authenticated_url:
+      with trace.phase('static'):
+        context, source = static.context(remote_url) if static.enabled() else None, 'static'
+
+      if not context:
+        context, source = Context.from_url(remote_url), 'resolved'
+
+      with trace.phase('sign'):
+        authenticated_url = git_url(context.repository, context.version, context.region, context.credentials)
+
+      with trace.phase('cache'):
+        cache.put_url(remote_url, authenticated_url, context.credentials)
+
+    if trace.enabled():
+      trace.record(source = source, **_describe(remote_url, authenticated_url))
+
+    transport = 'remote-http'
+    ref_cache = None
+
+    if os.environ.get('GIT_REMOTE_CODECOMMIT_REF_CACHE'):
+      from git_remote_codecommit import refs  # only needed when caching references
+
+      if refs.ttl():
+        described = _describe(remote_url, authenticated_url)
+        ref_cache = refs.RefCache(cache.fingerprint('refs', described['profile'], described['repository'], described['region']), refs.ttl())
+
+    # git's own transport fetches and pushes with the arguments git provides,
+    # so only ours can apply a url's filter or depth, push in batches, or
+    # answer from our cache of references
+
+    shaped = 'filter' in options or 'depth' in options or 'push-batch' in options or ref_cache is not None
+
+    if shaped or os.environ.get('GIT_REMOTE_CODECOMMIT_NATIVE') or os.environ.get('GIT_REMOTE_CODECOMMIT_PUSH_BATCH'):
+      from git_remote_codecommit import native  # its http and tls modules are costly to import
+
+      if shaped or native.enabled() or native.push_batch_size(options):
+        transport = 'native'
+
+    trace.record(transport = transport)
+
+    if options:
+      trace.record(options = options)
+
+    read_url = None
+
+    if transport == 'native' and source != 'proxy':
+      with trace.phase('endpoints'):
+        read_url = _read_url(remote_url, context)
+
+    seeding = None
+
+    if os.environ.get('GIT_REMOTE_CODECOMMIT_SEED_CACHE'):
+      from git_remote_codecommit import seed  # only needed when seeding clones
 
-  except (FormatError, ProfileNotFound, RegionNotFound, CredentialsNotFound, RegionNotAvailable) as exc:
+      if seed.enabled():
+        with trace.phase('seed'):
+          seeding = seed.prepare(remote_url, context.region if context else _describe(remote_url, authenticated_url)['region'])
+
+        trace.record(seeded = bool(seeding.refs) if seeding else None)
+
+    retry = None
+    resign = (lambda: authenticated_url) if source == 'proxy' else (lambda: _resign(remote_url, context))
+
+    if throttle.rate_limit() or throttle.retries():
+      described = _describe(remote_url, authenticated_url)
+      key = '{}@{}'.format(described['profile'], described['region'] or 'default')
+
+      with trace.phase('throttle'):
+        trace.record(throttle_wait = round(throttle.acquire(key), 3))
+
+      if throttle.retries():
+        retry = throttle.Retry(key, resign)
+
+    if transport == 'remote-http' and source == 'static' and not seeding and not retry and not trace.enabled() and os.name == 'posix':
+      # nothing remains for us to do, so rather than linger for the transfer
+      # git's transport replaces our process
+
+      os.execvp('git', _remote_http_args(git_cmd, authenticated_url, options))
+
+    try:
+      with trace.phase('child'):
+        if transport == 'native':
+          exit_code = native.run(authenticated_url, read_url = read_url, options = options, remote = git_cmd, retry = retry, resign = resign, ref_cache = ref_cache)
+        elif retry:
+          exit_code = throttle.relay(lambda url: _remote_http_args(git_cmd, url, options), authenticated_url, retry)
+        else:
+          exit_code = subprocess.call(_remote_http_args(git_cmd, authenticated_url, options))
+    finally:
+      if seeding:
+        seeding.finish()
+
+    if retry:
+      trace.record(retries = retry.attempts, retry_wait = round(retry.waited, 3))
+
+    trace.record(exit_code = exit_code)
+    sys.exit(exit_code)
+
+  except (FormatError, ProfileNotFound, RegionNotFound, CredentialsNotFound, RegionNotAvailable, TransportError) as exc:
+    trace.record(error = type(exc).__name__, exit_code = 1)
     error(str(exc))
+  finally:
+    trace.finish()
+
+
+def _env_flag(name, default = False):
+  """
+  Checks a boolean environment variable, which is enabled by '1', 'true',
+  'yes', or 'on' and disabled by '0', 'false', 'no', or 'off'.
+
+  :param str name: environment variable to check
+  :param bool default: result if the variable is unset, empty, or another
+    value
+
+  :returns: **bool** with the variable's value
+  """
+
+  value = os.environ.get(name, '').strip().lower()
+
+  if value in ('1', 'true', 'yes', 'on'):
+    return True
+  elif value in ('0', 'false', 'no', 'off'):
+    return False
+
+  return default
+
+
+def _invoked_by_git(args):
+  """
+  Checks if our arguments are those git invokes remote helpers with, a remote
+  and its url, rather than a subcommand such as 'mirror'. Git removes the
+  'codecommit::' prefix of the urls it provides us, so subcommand arguments
+  that retain it are never taken for a remote. Otherwise a subcommand given
+  a single url, such as 'mirror codecommit://profile@repository', is
+  indistinguishable from git so it must be preceded by a '--'.
+  """
+
+  return len(args) == 2 and '://' in args[1] and not args[1].startswith(('codecommit::', '-'))
+
+
+def _resign(remote_url, context = None):
+  """
+  Signs a remote's url anew, such as to retry a request that was throttled.
+  Urls we cache are replaced, so later invocations use it as well.
+  """
+
+  from git_remote_codecommit import cache, static
+
+  context = context or (static.context(remote_url) if static.enabled() else None) or Context.from_url(remote_url)
+  authenticated_url = git_url(context.repository, context.version, context.region, context.credentials)
+  cache.put_url(remote_url, authenticated_url, context.credentials)
+
+  return authenticated_url
+
+
+def _remote_http_args(git_cmd, authenticated_url, options):
+  """
+  Provides the command for git's own https transport. Its protocol version is
+  what it requests from CodeCommit, and if that's not v2 git falls back to
+  earlier protocols.
+  """
+
+  args = ['git']
+
+  if 'protocol' in options:
+    args += ['-c', 'protocol.version={}'.format(options['protocol'])]
+
+  return args + ['remote-http', git_cmd, authenticated_url]
+
+
+def _read_url(remote_url, context = None):
+  """
+  Provides a signed url of the fastest endpoint to fetch from, if that's not
+  our primary.
+  """
+
+  from git_remote_codecommit import endpoints
+
+  if not endpoints.configured():
+    return None
+
+  context = context or Context.from_url(remote_url)
+  endpoint = endpoints.read_endpoint(context.region)
+
+  if endpoint == endpoints.primary(context.region):
+    return None
+
+  return git_url(context.repository, context.version, endpoint.region, context.credentials, hostname = endpoint.hostname)
+
+
+def _describe(remote_url, authenticated_url):
+  """
+  Provides the profile, repository, and region a remote concerns, without
+  resolving its session.
+  """
+
+  url = urlparse(remote_url)
+  profile, repository = url.netloc.split('@', 1) if '@' in url.netloc else ('default', url.netloc)
+  region = url.scheme if url.scheme != 'codecommit' else None
+
+  if not region:
+    match = re.search(r'@git-codecommit\.([^.]+)\.', authenticated_url)
+    region = match.group(1) if match else None
+
+  return {'profile': profile, 'repository': repository, 'region': region}
+
 
 def website_domain_mapping(region):
-  if region in ['cn-north-1', 'cn-northwest-1']:
+  """
+  Provides the domain CodeCommit's endpoints reside within for a region.
+
+  :param str region: region the repository resides within
+
+  :returns: **str** with the region's dns suffix
+  """
+
+  from git_remote_codecommit import regions
+
+  partition = regions.lookup(region)
+
+  if partition:
+    return partition[1]
+  elif region.startswith('cn-'):
     return 'amazonaws.com.cn'
-  return 'amazonaws.com'
+  else:
+    return 'amazonaws.com'
 
-def git_url(repository, version, region, credentials):
+
+def git_url(repository, version, region, credentials, hostname = None):
   """
   Provides the signed url we can use for pushing and pulling from CodeCommit...
 
@@ -197,18 +582,42 @@ def git_url(repository, version, region, credentials):
   :param str version: protocol version for this hook
   :param str region: region the repository resides within
   :param botocore.credentials credentials: session credentials
+  :param str hostname: endpoint to use rather than the region's default
 
   :return: url we can push/pull from
   """
 
-  hostname = os.environ.get('CODE_COMMIT_ENDPOINT', 'git-codecommit.{}.{}'.format(region, website_domain_mapping(region)))
-  path = '/{}/repos/{}'.format(version, repository)
+  return git_urls([repository], version, region, credentials, hostname)[0]
+
+
+def git_urls(repositories, version, region, credentials, hostname = None):
+  """
+  Provides signed urls for several repositories within a region, all signed
+  at the same time. This is considerably faster than calling
+  :func:`~git_remote_codecommit.git_url` for each.
+
+  :param list repositories: repository names
+  :param str version: protocol version for this hook
+  :param str region: region the repositories reside within
+  :param botocore.credentials credentials: session credentials
+  :param str hostname: endpoint to use rather than the region's default
+
+  :return: **list** of urls we can push/pull from, in the same order as the
+    repositories
+  """
+
+  if hasattr(credentials, 'get_frozen_credentials'):
+    credentials = credentials.get_frozen_credentials()  # consistent even if refreshed mid-way
+
+  if hostname is None:
+    hostname = os.environ.get('CODE_COMMIT_ENDPOINT', 'git-codecommit.{}.{}'.format(region, website_domain_mapping(region)))
+  paths = ['/{}/repos/{}'.format(version, repository) for repository in repositories]
 
   token = '%' + credentials.token if credentials.token else ''
-  username = botocore.compat.quote(credentials.access_key + token, safe='')
-  signature = sign(hostname, path, region, credentials)
+  username = quote(credentials.access_key + token, safe='')
+  signatures = sign_many(hostname, paths, region, credentials)
 
-  return 'https://{}:{}@{}{}'.format(username, signature, hostname, path)
+  return ['https://{}:{}@{}{}'.format(username, signature, hostname, path) for path, signature in zip(paths, signatures)]
 
 
 def sign(hostname, path, region, credentials):
@@ -223,11 +632,23 @@ def sign(hostname, path, region, credentials):
   :return: signature for the url
   """
 
-  request = botocore.awsrequest.AWSRequest(method = 'GIT', url = 'https://{}{}'.format(hostname, path))
-  request.context['timestamp'] = datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+  return sign_many(hostname, [path], region, credentials)[0]
+
+
+def sign_many(hostname, paths, region, credentials):
+  """
+  Provides SigV4 signatures for several CodeCommit urls on the same host, all
+  signed with the same timestamp.
+
+  :param str hostname: aws hostname request is for
+  :param list paths: resources the requests are for
+  :param str region: region the repositories reside within
+  :param botocore.credentials credentials: session credentials
+
+  :return: **list** of signatures, in the same order as the paths
+  """
+
+  from git_remote_codecommit.signer import SIGNER
 
-  signer = botocore.auth.SigV4Auth(credentials, 'codecommit', region)
-  canonical_request = 'GIT\n{}\n\nhost:{}\n\nhost\n'.format(path, hostname)
-  string_to_sign = signer.string_to_sign(request, canonical_request)
-  signature = signer.signature(string_to_sign, request)
-  return "{}Z{}".format(request.context['timestamp'], signature)
+  timestamp = datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+  return [SIGNER.sign(hostname, path, region, credentials.secret_key, timestamp) for path in paths]
@@ -0,0 +1,266 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Long-lived process that keeps botocore sessions and credentials warm so our
+hook doesn't need to resolve them on every invocation. Hooks request signed
+urls over a unix socket that only the user can access...
+
+::
+
+  % git-remote-codecommit agent &
+
+Each request is a line of JSON with the remote url and a fingerprint of the
+caller's AWS configuration...
+
+::
+
+  {"remote_url": "codecommit://profile@repository", "fingerprint": "..."}
+
+... to which the agent replies with either a signed url or an error...
+
+::
+
+  {"url": "https://..."}
+  {"error": "ProfileNotFound", "message": "..."}
+
+Agents only serve callers whose environment and configuration files match
+their own. Otherwise, or if the agent is unavailable, hooks resolve
+credentials themselves.
+"""
+
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+
+import git_remote_codecommit
+
+from git_remote_codecommit import cache
+from git_remote_codecommit.pool import SessionPool
+
+try:
+  import socketserver  # python 3.x
+except ImportError:
+  import SocketServer as socketserver  # python 2.x
+
+# Errors we relay to hooks, which raise them as if they resolved the url
+# themselves.
+
+RELAYED_ERRORS = ('FormatError', 'ProfileNotFound', 'RegionNotFound', 'RegionNotAvailable', 'CredentialsNotFound')
+
+# Seconds a hook waits for the agent before resolving credentials itself.
+
+CLIENT_TIMEOUT = 5
+
+
+def socket_path():
+  """
+  Provides the unix socket our agent listens on. This is 'agent.sock' within
+  our cache directory, unless overridden by the
+  GIT_REMOTE_CODECOMMIT_AGENT_SOCKET environment variable.
+
+  :returns: **str** with the socket's path
+  """
+
+  return os.environ.get('GIT_REMOTE_CODECOMMIT_AGENT_SOCKET', cache.cache_dir('agent.sock'))
+
+
+def git_url(remote_url):
+  """
+  Requests a signed url from our agent.
+
+  :param str remote_url: git remote url
+
+  :returns: **str** with the signed url, or **None** if the agent is
+    unavailable or unable to serve us
+
+  :raises: the same exceptions as :func:`~git_remote_codecommit.Context.from_url`
+  """
+
+  path = socket_path()
+
+  if not os.path.exists(path):
+    return None
+
+  try:
+    response = request(path, {'remote_url': remote_url, 'fingerprint': cache.fingerprint()})
+  except (IOError, OSError, ValueError):
+    return None
+
+  if response.get('url'):
+    return response['url']
+  elif response.get('error') in RELAYED_ERRORS:
+    raise getattr(git_remote_codecommit, response['error'])(response.get('message', ''))
+  else:
+    return None
+
+
+def request(path, message, timeout = CLIENT_TIMEOUT):
+  """
+  Sends a message to our agent.
+
+  :param str path: agent's unix socket
+  :param dict message: request to send
+  :param float timeout: seconds to wait for the agent
+
+  :returns: **dict** with the agent's response
+
+  :raises:
+    * **IOError** if unable to communicate with the agent
+    * **ValueError** if the agent's response is malformed
+  """
+
+  client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  client.settimeout(timeout)
+
+  try:
+    client.connect(path)
+    client.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+    with client.makefile('rb') as response:
+      return json.loads(response.readline().decode('utf-8'))
+  finally:
+    client.close()
+
+
+class Agent(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+  """
+  Unix socket server that signs urls with sessions it keeps warm per profile.
+
+  :var float idle_timeout: seconds without requests until we shut down, no
+    timeout if zero
+  """
+
+  daemon_threads = True
+
+  def __init__(self, path, idle_timeout = 0):
+    directory = os.path.dirname(path)
+
+    if directory and not os.path.isdir(directory):
+      os.makedirs(directory, mode = 0o700, exist_ok = True)
+
+    if os.path.exists(path):
+      if _is_listening(path):
+        raise IOError('An agent is already listening on {}'.format(path))
+
+      os.remove(path)  # stale socket from an agent that has exited
+
+    previous_umask = os.umask(0o177)
+
+    try:
+      socketserver.UnixStreamServer.__init__(self, path, _Handler)
+    finally:
+      os.umask(previous_umask)
+
+    os.chmod(path, 0o600)
+
+    self.idle_timeout = idle_timeout
+    self.last_request = time.time()
+    self._pool = SessionPool()
+    self._fingerprint = cache.fingerprint()
+    self._lock = threading.Lock()
+
+  def git_url(self, remote_url, fingerprint):
+    """
+    Signs a url for the given remote.
+
+    :param str remote_url: git remote url
+    :param str fingerprint: caller's configuration fingerprint
+
+    :returns: **str** with the signed url, or **None** if the caller's
+      configuration differs from ours
+    """
+
+    with self._lock:
+      self.last_request = time.time()
+      current_fingerprint = cache.fingerprint()
+
+      if current_fingerprint != self._fingerprint:
+        self._pool.clear()  # our configuration files changed
+        self._fingerprint = current_fingerprint
+
+      if fingerprint != current_fingerprint:
+        return None
+
+    return self._pool.git_url(remote_url)
+
+  def service_actions(self):
+    if self.idle_timeout and time.time() - self.last_request > self.idle_timeout:
+      threading.Thread(target = self.shutdown).start()
+
+  def server_close(self):
+    socketserver.UnixStreamServer.server_close(self)
+    cache.remove(self.server_address)
+
+
+def _is_listening(path):
+  client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+  try:
+    client.connect(path)
+    return True
+  except (IOError, OSError):
+    return False
+  finally:
+    client.close()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+  def handle(self):
+    line = self.rfile.readline()
+
+    if not line:
+      return  # connection closed without a request, such as a liveness check
+
+    try:
+      message = json.loads(line.decode('utf-8'))
+      url = self.server.git_url(message.get('remote_url'), message.get('fingerprint'))
+      response = {'url': url} if url else {'error': 'ConfigurationMismatch'}
+    except ValueError:
+      response = {'error': 'MalformedRequest'}
+    except Exception as exc:
+      response = {'error': type(exc).__name__, 'message': str(exc)}
+
+    self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+def main(args):
+  """
+  Runs our agent until it's interrupted or idle.
+
+  :param list args: command line arguments
+
+  :returns: **int** exit code
+  """
+
+  parser = argparse.ArgumentParser(prog = 'git-remote-codecommit agent', description = 'Keeps AWS credentials warm for git-remote-codecommit.')
+  parser.add_argument('--socket', default = socket_path(), help = 'unix socket to listen on (default: %(default)s)')
+  parser.add_argument('--idle-timeout', type = float, default = 0, help = 'seconds without requests until the agent exits')
+  options = parser.parse_args(args)
+
+  try:
+    agent = Agent(options.socket, options.idle_timeout)
+  except (IOError, OSError) as exc:
+    git_remote_codecommit.error(str(exc))
+
+  try:
+    agent.serve_forever(poll_interval = 1)
+  except KeyboardInterrupt:
+    pass
+  finally:
+    agent.server_close()
+
+  return 0
@@ -0,0 +1,316 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+On-disk state shared between invocations of the hook. Entries are JSON
+documents written atomically (temporary file and rename) so concurrent hooks
+can safely read and replace them.
+"""
+
+import calendar
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+CACHE_DIR = os.path.expanduser(os.path.join('~', '.aws', 'codecommit', 'cache'))
+
+# Environment variables that influence how a profile resolves its region and
+# credentials. Any change to these must result in a different cache key.
+
+FINGERPRINT_ENV = (
+    'AWS_PROFILE',
+    'AWS_DEFAULT_PROFILE',
+    'AWS_REGION',
+    'AWS_DEFAULT_REGION',
+    'AWS_CONFIG_FILE',
+    'AWS_SHARED_CREDENTIALS_FILE',
+    'AWS_ACCESS_KEY_ID',
+    'AWS_SECRET_ACCESS_KEY',
+    'AWS_SESSION_TOKEN',
+    'AWS_SECURITY_TOKEN',
+    'AWS_ROLE_ARN',
+    'AWS_WEB_IDENTITY_TOKEN_FILE',
+    'AWS_CONTAINER_CREDENTIALS_RELATIVE_URI',
+    'AWS_CONTAINER_CREDENTIALS_FULL_URI',
+    'CODE_COMMIT_ENDPOINT',
+)
+
+# Seconds before a signature expires that we stop handing it out, so git has
+# time to make its requests.
+
+EXPIRY_MARGIN = 30
+
+# Seconds after signing that CodeCommit stops accepting a signature, as with
+# other SigV4 requests.
+
+SIGNATURE_LIFETIME = 900
+
+
+def cache_dir(*parts):
+  """
+  Provides a path within our cache directory. This is
+  ~/.aws/codecommit/cache unless overridden by the
+  GIT_REMOTE_CODECOMMIT_CACHE_DIR environment variable.
+
+  :param list parts: path components within the cache directory
+
+  :returns: **str** with the absolute path
+  """
+
+  return os.path.join(os.environ.get('GIT_REMOTE_CODECOMMIT_CACHE_DIR', CACHE_DIR), *parts)
+
+
+def read_json(path):
+  """
+  Reads a cache entry.
+
+  :param str path: file to read
+
+  :returns: deserialized content, or **None** if the file is absent or corrupt
+  """
+
+  try:
+    with open(path) as cache_file:
+      return json.load(cache_file)
+  except (IOError, OSError, ValueError):
+    return None
+
+
+def write_json(path, value):
+  """
+  Atomically replaces a cache entry. Files are only readable by the user
+  since entries can include credentials.
+
+  :param str path: file to write
+  :param object value: JSON serializable content
+  """
+
+  directory = os.path.dirname(path)
+
+  if not os.path.isdir(directory):
+    os.makedirs(directory, mode = 0o700, exist_ok = True)
+
+  fd, temp_path = tempfile.mkstemp(dir = directory, suffix = '.tmp')
+
+  try:
+    with os.fdopen(fd, 'w') as temp_file:
+      json.dump(value, temp_file)
+
+    os.replace(temp_path, path)
+  except BaseException:
+    remove(temp_path)
+    raise
+
+
+def remove(path):
+  """
+  Deletes a cache entry, ignoring entries that are already gone.
+
+  :param str path: file to remove
+  """
+
+  try:
+    os.remove(path)
+  except OSError:
+    pass
+
+
+def fingerprint(*values):
+  """
+  Digest of the environment and AWS configuration files that a profile
+  resolves from, combined with the given values.
+
+  :param list values: additional JSON serializable values to include
+
+  :returns: **str** hex digest that changes if any input does
+  """
+
+  files = []
+
+  for path in (os.environ.get('AWS_CONFIG_FILE', '~/.aws/config'), os.environ.get('AWS_SHARED_CREDENTIALS_FILE', '~/.aws/credentials')):
+    path = os.path.expanduser(path)
+
+    try:
+      stat = os.stat(path)
+      files.append([path, stat.st_mtime_ns, stat.st_size])
+    except OSError:
+      files.append([path, None, None])
+
+  env = [[name, os.environ.get(name)] for name in FINGERPRINT_ENV]
+  content = json.dumps([list(values), files, env])
+  return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def url_cache_ttl():
+  """
+  Provides the number of seconds a signed url may be reused for, as configured
+  by the GIT_REMOTE_CODECOMMIT_URL_CACHE environment variable.
+
+  :returns: **int** with the time to live, zero if caching is disabled
+  """
+
+  try:
+    return max(0, int(os.environ.get('GIT_REMOTE_CODECOMMIT_URL_CACHE', 0)))
+  except ValueError:
+    return 0
+
+
+def signature_time(url):
+  """
+  Provides when a url from git_url() was signed.
+
+  :param str url: signed url
+
+  :returns: **float** unix timestamp, or **None** if the url isn't signed
+  """
+
+  try:
+    password = url.split('://', 1)[1].rsplit('@', 1)[0].split(':', 1)[1]
+    return calendar.timegm(time.strptime(password.split('Z', 1)[0], '%Y%m%dT%H%M%S'))
+  except (IndexError, ValueError):
+    return None
+
+
+def get_url(remote_url, ttl = None):
+  """
+  Provides a previously signed url for this remote if it remains valid.
+  Expired entries are evicted.
+
+  :param str remote_url: git remote url
+  :param int ttl: time to live of the caller's urls, rather than that of
+    GIT_REMOTE_CODECOMMIT_URL_CACHE
+
+  :returns: **str** with the signed url, or **None** if unavailable
+  """
+
+  if not (ttl or url_cache_ttl()):
+    return None
+
+  path = cache_dir('urls', fingerprint(remote_url) + '.json')
+  entry = read_json(path)
+
+  if not isinstance(entry, dict) or 'url' not in entry:
+    return None
+
+  if entry.get('expires', 0) - EXPIRY_MARGIN <= time.time():
+    remove(path)
+    return None
+
+  return entry['url']
+
+
+def put_url(remote_url, url, credentials = None, ttl = None):
+  """
+  Caches a signed url until its signature or credentials expire, whichever
+  comes first. This is a no-op if url caching is disabled, and caching is best
+  effort so failures to write are ignored.
+
+  :param str remote_url: git remote url
+  :param str url: signed url for the remote
+  :param botocore.credentials credentials: credentials the url was signed with
+  :param int ttl: seconds to cache the url for, rather than that of
+    GIT_REMOTE_CODECOMMIT_URL_CACHE
+  """
+
+  ttl = ttl or url_cache_ttl()
+  signed_at = signature_time(url)
+
+  if not ttl or signed_at is None:
+    return
+
+  expires = signed_at + min(ttl, SIGNATURE_LIFETIME)
+  expiry_time = getattr(credentials, '_expiry_time', None)
+
+  if expiry_time is not None:
+    expires = min(expires, calendar.timegm(expiry_time.utctimetuple()))
+
+  if expires - EXPIRY_MARGIN <= time.time():
+    return
+
+  try:
+    _evict_expired(cache_dir('urls'))
+    write_json(cache_dir('urls', fingerprint(remote_url) + '.json'), {'url': url, 'expires': expires})
+  except (IOError, OSError):
+    pass  # unable to cache, later invocations simply sign their own
+
+
+def remove_url(remote_url):
+  """
+  Discards the url we cached for a remote, such as after it was rejected.
+
+  :param str remote_url: git remote url
+  """
+
+  remove(cache_dir('urls', fingerprint(remote_url) + '.json'))
+
+
+def _evict_expired(directory):
+  try:
+    filenames = os.listdir(directory)
+  except OSError:
+    return
+
+  now = time.time()
+
+  for filename in filenames:
+    if not filename.endswith('.json'):
+      continue  # skip other hooks' in-progress writes
+
+    path = os.path.join(directory, filename)
+    entry = read_json(path)
+
+    if not isinstance(entry, dict) or entry.get('expires', 0) <= now:
+      remove(path)
+
+
+def get_profile(profile):
+  """
+  Provides the snapshot of how a profile last resolved, if neither our
+  environment nor AWS configuration files have changed since.
+
+  :param str profile: profile name, **None** for the session's default
+
+  :returns: **dict** snapshot from :func:`~git_remote_codecommit.cache.put_profile`,
+    or **None** if unavailable
+  """
+
+  entry = read_json(_profile_path(profile))
+
+  if isinstance(entry, dict) and isinstance(entry.get('snapshot'), dict) and entry.get('fingerprint') == fingerprint('profile', profile):
+    return entry['snapshot']
+
+  return None
+
+
+def put_profile(profile, snapshot):
+  """
+  Records how a profile resolved, replacing any prior snapshot of it. Caching
+  is best effort so failures to write are ignored.
+
+  :param str profile: profile name, **None** for the session's default
+  :param dict snapshot: JSON serializable metadata of the profile
+  """
+
+  try:
+    write_json(_profile_path(profile), {'fingerprint': fingerprint('profile', profile), 'snapshot': snapshot})
+  except (IOError, OSError):
+    pass
+
+
+def _profile_path(profile):
+  # one entry per profile, so changes to our configuration replace rather
+  # than accumulate snapshots
+
+  return cache_dir('profiles', hashlib.sha256(json.dumps(profile).encode('utf-8')).hexdigest() + '.json')
@@ -0,0 +1,166 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Git credential helper for plain https remotes of CodeCommit, for tools that
+can't use our 'codecommit::' remotes...
+
+::
+
+  % git config --global credential.https://git-codecommit.us-east-1.amazonaws.com.helper '!git-remote-codecommit credential --profile demo-profile'
+  % git config --global credential.https://git-codecommit.us-east-1.amazonaws.com.useHttpPath true
+
+Git then asks us for the username and password of each request, which are
+those of the url :func:`~git_remote_codecommit.git_url` would sign for the
+region and repository the request is for. Signatures are reused until they
+near expiry, and discarded if CodeCommit rejects them.
+
+Signatures cover the repository, so this requires git's useHttpPath option.
+"""
+
+import argparse
+import os
+import re
+import sys
+
+import git_remote_codecommit
+
+from git_remote_codecommit import agent, cache, static
+
+try:
+  from urllib import unquote  # python 2.x
+  from urlparse import urlparse
+except ImportError:
+  from urllib.parse import unquote, urlparse  # python 3.x
+
+# Seconds we reuse a signature for, unless GIT_REMOTE_CODECOMMIT_URL_CACHE
+# provides otherwise.
+
+DEFAULT_TTL = 300
+
+HOST_PATTERN = re.compile(r'^git-codecommit\.([a-z0-9-]+)\.')
+PATH_PATTERN = re.compile(r'^/?(v1)/repos/([^/]+?)/?$')
+
+
+def remote_url(attributes, profile = None):
+  """
+  Provides the remote url of a credential request, such as
+  'us-east-1://profile@repository'.
+
+  :param dict attributes: attributes of git's request
+  :param str profile: profile to sign with, the default if **None**
+
+  :returns: **str** with the remote url, or **None** if the request isn't
+    for a CodeCommit repository
+
+  :raises: **FormatError** if the request lacks its repository
+  """
+
+  host = HOST_PATTERN.match(attributes.get('host', ''))
+
+  if attributes.get('protocol') != 'https' or not host or attributes['host'] != _hostname(host.group(1)):
+    return None
+
+  path = PATH_PATTERN.match(attributes.get('path', ''))
+
+  if not path:
+    raise git_remote_codecommit.FormatError('git-remote-codecommit credential requires the repository of each request. Please enable this with: git config --global credential.https://{}.useHttpPath true'.format(attributes['host']))
+
+  return '{}://{}{}'.format(host.group(1), profile + '@' if profile else '', path.group(2))
+
+
+def git_url(remote_url):
+  """
+  Provides the signed url of a remote, reusing one we signed recently. If
+  our cache is unavailable we simply sign a new one.
+
+  :param str remote_url: git remote url
+
+  :returns: **str** with the signed url
+  """
+
+  ttl = cache.url_cache_ttl() or DEFAULT_TTL
+  authenticated_url = cache.get_url(remote_url, ttl) or agent.git_url(remote_url)
+
+  if not authenticated_url:
+    context = (static.context(remote_url) if static.enabled() else None) or git_remote_codecommit.Context.from_url(remote_url)
+    authenticated_url = git_remote_codecommit.git_url(context.repository, context.version, context.region, context.credentials)
+    cache.put_url(remote_url, authenticated_url, context.credentials, ttl)
+
+  return authenticated_url
+
+
+def read_attributes(stdin):
+  """
+  Reads a credential request from git, which is 'key=value' lines terminated
+  by a blank line.
+
+  :param file stdin: input to read from
+
+  :returns: **dict** with the request's attributes
+  """
+
+  attributes = {}
+
+  for line in stdin:
+    line = line.rstrip('\n')
+
+    if not line:
+      break
+
+    key, _, value = line.partition('=')
+    attributes[key] = value
+
+  return attributes
+
+
+def _hostname(region):
+  # the endpoint git_url() signs for
+
+  return os.environ.get('CODE_COMMIT_ENDPOINT', 'git-codecommit.{}.{}'.format(region, git_remote_codecommit.website_domain_mapping(region)))
+
+
+def main(args):
+  """
+  Answers one of git's credential requests.
+
+  :param list args: command line arguments
+
+  :returns: **int** exit code
+  """
+
+  parser = argparse.ArgumentParser(prog = 'git-remote-codecommit credential', description = 'Git credential helper for https remotes of CodeCommit.')
+  parser.add_argument('--profile', help = 'AWS profile to sign with (default: your default profile)')
+  parser.add_argument('operation', help = 'credential operation (get, store, or erase)')
+  options = parser.parse_args(args)
+
+  attributes = read_attributes(sys.stdin)
+
+  if options.operation not in ('get', 'erase'):
+    return 0  # we already reuse our signatures, so have nothing to store
+
+  try:
+    url = remote_url(attributes, options.profile)
+
+    if not url:
+      return 0  # not ours, so left to git's other helpers
+    elif options.operation == 'get':
+      authenticated_url = urlparse(git_url(url))
+      sys.stdout.write('username={}\npassword={}\n'.format(unquote(authenticated_url.username), authenticated_url.password))
+    else:
+      cache.remove_url(url)
+
+    return 0
+  except (git_remote_codecommit.FormatError, git_remote_codecommit.ProfileNotFound, git_remote_codecommit.RegionNotFound, git_remote_codecommit.CredentialsNotFound, git_remote_codecommit.RegionNotAvailable) as exc:
+    sys.stderr.write('%s\n' % exc)
+    return 1
@@ -0,0 +1,324 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+On-disk caching of credentials that are expensive to obtain. Botocore only
+caches assumed roles between processes, so without this profiles that use
+SSO, web identities, or a credential_process would exchange tokens or run
+their process on every git invocation.
+
+Entries are keyed on the profile's provider configuration (along with the
+environment variables that feed into it), so changing a profile never
+serves credentials for its former identity. Credentials are used until
+they're within botocore's refresh window of expiring.
+
+Concurrent processes (such as fetches of many submodules) often find the
+same credentials expired at once. Rather than each calling AWS, the first
+to do so holds an advisory lock until it has cached new credentials, and
+the rest wait on that lock then read its result.
+"""
+
+import calendar
+import hashlib
+import json
+import os
+import threading
+import time
+
+import botocore.credentials
+import botocore.exceptions
+import botocore.utils
+
+from git_remote_codecommit import cache
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None  # windows, where we refresh without coordinating
+
+# Providers whose credential fetchers accept a cache.
+
+FETCHER_PROVIDERS = ('sso', 'assume-role-with-web-identity')
+
+# Environment variables that alter the identity a profile's provider
+# resolves.
+
+PROVIDER_ENV = (
+    'AWS_ROLE_ARN',
+    'AWS_ROLE_SESSION_NAME',
+    'AWS_WEB_IDENTITY_TOKEN_FILE',
+    'AWS_REGION',
+    'AWS_DEFAULT_REGION',
+    'AWS_ENDPOINT_URL',
+    'AWS_ENDPOINT_URL_SSO',
+    'AWS_ENDPOINT_URL_STS',
+)
+
+# Seconds before credentials expire that we obtain new ones. This matches
+# botocore's credential fetchers, so credentials we provide aren't
+# immediately refreshed.
+
+EXPIRY_WINDOW = botocore.credentials.CachedCredentialFetcher.DEFAULT_EXPIRY_WINDOW_SECONDS
+
+# Seconds we wait for another process to refresh credentials before doing so
+# ourselves.
+
+LOCK_TIMEOUT = 15
+
+
+class LockingJSONFileCache(botocore.utils.JSONFileCache):
+  """
+  Credential cache that refreshes each entry in only one process at a time.
+
+  Credential fetchers check if we have an entry, and if not obtain new
+  credentials then store them. When an entry is absent, unreadable, or
+  within our expiry window we take its lock before reporting it as absent,
+  and hold that lock until new credentials are stored or
+  :func:`~git_remote_codecommit.credential_cache.LockingJSONFileCache.release`
+  is called. Processes that wait on the lock then find the entry present.
+
+  Should a refresh fail its lock is held until our next check, or our
+  process exits, so others proceed on their own after **LOCK_TIMEOUT**.
+
+  :param str working_dir: directory entries are stored within
+  """
+
+  def __init__(self, working_dir = botocore.utils.JSONFileCache.CACHE_DIR):
+    super(LockingJSONFileCache, self).__init__(working_dir)
+    self._held = threading.local()
+
+  def __contains__(self, cache_key):
+    self.release()
+    path = self._convert_cache_key(cache_key)
+
+    if _is_fresh(path):
+      return True
+
+    lock_file = _lock(path)
+
+    if lock_file and _is_fresh(path):
+      lock_file.close()  # another process refreshed it while we waited
+      return True
+
+    self._held.lock_file = lock_file
+    return False
+
+  def __setitem__(self, cache_key, value):
+    try:
+      if not os.path.isdir(self._working_dir):
+        os.makedirs(self._working_dir, mode = 0o700, exist_ok = True)
+
+      super(LockingJSONFileCache, self).__setitem__(cache_key, value)
+    finally:
+      self.release()
+
+  def release(self):
+    """
+    Releases the lock we took for a refresh, if any.
+    """
+
+    lock_file = getattr(self._held, 'lock_file', None)
+    self._held.lock_file = None
+
+    if lock_file:
+      lock_file.close()
+
+
+class ProviderCache(LockingJSONFileCache):
+  """
+  Credential cache within our cache directory whose entries are specific to
+  a provider's configuration.
+
+  :param str method: provider the cache is for
+  :param func config: provides the JSON serializable configuration entries
+    are keyed on
+  """
+
+  def __init__(self, method, config):
+    super(ProviderCache, self).__init__(cache.cache_dir('credentials'))
+    self._method = method
+    self._config = config
+    self._namespace = None
+
+  def __setitem__(self, cache_key, value):
+    super(ProviderCache, self).__setitem__(cache_key, value)
+    _evict_expired(self._working_dir)
+
+  def _convert_cache_key(self, cache_key):
+    # configuration is only read once a provider uses us, since that's when
+    # we know it's valid
+
+    if self._namespace is None:
+      self._namespace = json.dumps([self._method, self._config(), [[name, os.environ.get(name)] for name in PROVIDER_ENV]], sort_keys = True, default = str)
+
+    digest = hashlib.sha256(json.dumps([self._namespace, cache_key]).encode('utf-8')).hexdigest()
+    return os.path.join(self._working_dir, digest + '.json')
+
+
+class CachingProcessProvider(botocore.credentials.ProcessProvider):
+  """
+  Provider for a profile's credential_process that reuses the credentials it
+  last printed until they near expiry. Credentials without an expiration
+  aren't cached since we can't tell when they change.
+
+  :var ProviderCache cache: where credentials are cached
+  """
+
+  def __init__(self, profile_name, load_config, cache = None):
+    super(CachingProcessProvider, self).__init__(profile_name, load_config)
+    self.cache = cache if cache is not None else {}
+
+  def _retrieve_credentials_using(self, credential_process):
+    try:
+      if self.METHOD in self.cache:
+        try:
+          entry = self.cache[self.METHOD]
+
+          if _seconds_remaining(entry) > EXPIRY_WINDOW:
+            return entry
+        except KeyError:
+          pass  # removed since we checked
+
+      credentials = super(CachingProcessProvider, self)._retrieve_credentials_using(credential_process)
+
+      if credentials.get('expiry_time'):
+        try:
+          self.cache[self.METHOD] = credentials
+        except (IOError, OSError, ValueError):
+          pass  # caching is best effort
+
+      return credentials
+    finally:
+      if isinstance(self.cache, LockingJSONFileCache):
+        self.cache.release()  # credentials that aren't cached don't release our lock
+
+
+def install(session):
+  """
+  Caches the credentials of a session's SSO, web identity, and
+  credential_process providers on disk.
+
+  :param botocore.session.Session session: session to cache credentials of
+  """
+
+  resolver = session.get_component('credential_provider')
+  profile = session.get_config_variable('profile') or 'default'
+
+  for method in FETCHER_PROVIDERS:
+    provider = _provider(resolver, method)
+
+    if provider is not None:
+      provider.cache = ProviderCache(method, lambda method = method: _profile_config(session, profile, method))
+
+  provider = _provider(resolver, CachingProcessProvider.METHOD)
+
+  if type(provider) is botocore.credentials.ProcessProvider:
+    process_cache = ProviderCache(CachingProcessProvider.METHOD, lambda: _profile_config(session, profile, CachingProcessProvider.METHOD))
+    resolver.providers[resolver.providers.index(provider)] = CachingProcessProvider(profile, lambda: session.full_config, process_cache)
+
+
+def _provider(resolver, method):
+  try:
+    return resolver.get_provider(method)
+  except botocore.exceptions.UnknownCredentialError:
+    return None
+
+
+def _profile_config(session, profile, method):
+  """
+  Configuration a provider resolves its credentials from.
+  """
+
+  full_config = session.full_config
+  profile_config = full_config.get('profiles', {}).get(profile, {})
+  sso_session = full_config.get('sso_sessions', {}).get(profile_config.get('sso_session')) if method == 'sso' else None
+
+  return [profile, profile_config, sso_session]
+
+
+def _is_fresh(path):
+  """
+  Checks if a cached entry has credentials that are outside our expiry
+  window.
+  """
+
+  return _seconds_remaining(cache.read_json(path)) > EXPIRY_WINDOW
+
+
+def _lock(path):
+  """
+  Takes the exclusive lock for refreshing an entry, waiting up to
+  **LOCK_TIMEOUT** for another process to release it.
+
+  :returns: **file** holding the lock, or **None** if it's unavailable
+  """
+
+  if fcntl is None:
+    return None
+
+  lock_path = cache.cache_dir('locks', hashlib.sha256(os.path.abspath(path).encode('utf-8')).hexdigest() + '.lock')
+
+  try:
+    if not os.path.isdir(os.path.dirname(lock_path)):
+      os.makedirs(os.path.dirname(lock_path), mode = 0o700, exist_ok = True)
+
+    lock_file = open(lock_path, 'a')
+  except (IOError, OSError):
+    return None
+
+  deadline = time.time() + LOCK_TIMEOUT
+
+  while True:
+    try:
+      fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+      return lock_file
+    except (IOError, OSError):
+      if time.time() >= deadline:
+        lock_file.close()
+        return None
+
+      time.sleep(0.05)
+
+
+def _seconds_remaining(entry):
+  """
+  Provides the number of seconds until a cached entry expires, which is
+  negative if it's absent, unrecognized, or has already expired.
+  """
+
+  if not isinstance(entry, dict):
+    return -1
+
+  credentials = entry.get('Credentials')
+  expiration = entry.get('expiry_time') or (credentials.get('Expiration') if isinstance(credentials, dict) else None)
+
+  try:
+    expiry_time = botocore.utils.parse_timestamp(expiration)
+  except (TypeError, ValueError):
+    return -1
+
+  return calendar.timegm(expiry_time.utctimetuple()) - time.time()
+
+
+def _evict_expired(directory):
+  try:
+    filenames = os.listdir(directory)
+  except OSError:
+    return
+
+  for filename in filenames:
+    if filename.endswith('.json'):
+      path = os.path.join(directory, filename)
+
+      if _seconds_remaining(cache.read_json(path)) <= 0:
+        cache.remove(path)
@@ -0,0 +1,231 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Selection of the endpoint reads are served from. Besides a repository's
+primary endpoint, the GIT_REMOTE_CODECOMMIT_READ_ENDPOINTS environment
+variable can list other candidates...
+
+::
+
+  % export GIT_REMOTE_CODECOMMIT_READ_ENDPOINTS=us-west-2,vpce-0123-abcd.git-codecommit.us-east-1.vpce.amazonaws.com
+
+Entries without a dot are regions with a replica of the repository, and
+others are hostnames (such as interface VPC endpoints) within the primary's
+region. We measure how long each takes to connect and complete a TLS
+handshake, cache those measurements on disk, and read from whichever healthy
+candidate is fastest. Pushes always go to the primary.
+"""
+
+import collections
+import os
+import socket
+import ssl
+import threading
+import time
+
+import git_remote_codecommit
+
+from git_remote_codecommit import cache, regions
+
+# Seconds we reuse measurements for, unless overridden by the
+# GIT_REMOTE_CODECOMMIT_ENDPOINT_TTL environment variable.
+
+DEFAULT_TTL = 300
+
+# Seconds to wait for an endpoint before considering it unhealthy.
+
+MEASURE_TIMEOUT = 2
+
+Endpoint = collections.namedtuple('Endpoint', ['hostname', 'region'])
+
+_lock = threading.Lock()
+
+
+def configured():
+  """
+  Checks if candidate read endpoints are configured.
+
+  :returns: **True** if GIT_REMOTE_CODECOMMIT_READ_ENDPOINTS lists candidates,
+    **False** otherwise
+  """
+
+  return bool(os.environ.get('GIT_REMOTE_CODECOMMIT_READ_ENDPOINTS', '').strip())
+
+
+def primary(region):
+  """
+  Provides the endpoint a region's repositories are pushed to.
+
+  :param str region: region the repository resides within
+
+  :returns: **Endpoint** of the repository's primary
+  """
+
+  return Endpoint(os.environ.get('CODE_COMMIT_ENDPOINT', 'git-codecommit.{}.{}'.format(region, git_remote_codecommit.website_domain_mapping(region))), region)
+
+
+def candidates(region):
+  """
+  Provides the endpoints reads of a region's repositories may be served by,
+  starting with its primary.
+
+  :param str region: region the repository resides within
+
+  :returns: **list** of **Endpoint**
+  """
+
+  endpoints = [primary(region)]
+
+  for entry in os.environ.get('GIT_REMOTE_CODECOMMIT_READ_ENDPOINTS', '').split(','):
+    entry = entry.strip()
+
+    if not entry:
+      continue
+    elif '.' in entry:
+      endpoint = Endpoint(entry, region)
+    elif regions.lookup(entry):
+      endpoint = Endpoint('git-codecommit.{}.{}'.format(entry, git_remote_codecommit.website_domain_mapping(entry)), entry)
+    else:
+      continue  # region without CodeCommit
+
+    if endpoint not in endpoints:
+      endpoints.append(endpoint)
+
+  return endpoints
+
+
+def read_endpoint(region):
+  """
+  Provides the fastest healthy endpoint for reading a region's repositories.
+  If none are healthy this is the primary.
+
+  :param str region: region the repository resides within
+
+  :returns: **Endpoint** to read from
+  """
+
+  endpoints = candidates(region)
+
+  if len(endpoints) == 1:
+    return endpoints[0]
+
+  measured = latencies([endpoint.hostname for endpoint in endpoints])
+  healthy = [endpoint for endpoint in endpoints if measured.get(endpoint.hostname) is not None]
+
+  return min(healthy, key = lambda endpoint: measured[endpoint.hostname]) if healthy else endpoints[0]
+
+
+def latencies(hostnames):
+  """
+  Provides the connect and TLS handshake time of endpoints, measuring those
+  we lack a recent measurement of. Endpoints are measured in parallel.
+
+  :param list hostnames: endpoint hostnames, optionally with a port
+
+  :returns: **dict** mapping hostnames to their latency in seconds, or
+    **None** if unhealthy
+  """
+
+  with _lock:
+    path = cache.cache_dir('endpoints.json')
+    entries = cache.read_json(path)
+    entries = entries if isinstance(entries, dict) else {}
+    now = time.time()
+    ttl = _ttl()
+
+    stale = [hostname for hostname in hostnames if not isinstance(entries.get(hostname), dict) or now - entries[hostname].get('measured', 0) > ttl]
+
+    if stale:
+      measurements = {}
+      threads = [threading.Thread(target = lambda hostname: measurements.__setitem__(hostname, measure(hostname)), args = (hostname,)) for hostname in stale]
+
+      for thread in threads:
+        thread.start()
+
+      for thread in threads:
+        thread.join()
+
+      for hostname, latency in measurements.items():
+        entries[hostname] = {'latency': latency, 'measured': now}
+
+      _save(path, entries, now, ttl)
+
+    return dict((hostname, entries[hostname].get('latency')) for hostname in hostnames)
+
+
+def mark_unhealthy(hostname):
+  """
+  Records that an endpoint failed, so it isn't selected again until it's
+  remeasured.
+
+  :param str hostname: endpoint hostname
+  """
+
+  with _lock:
+    path = cache.cache_dir('endpoints.json')
+    entries = cache.read_json(path)
+    entries = entries if isinstance(entries, dict) else {}
+    now = time.time()
+
+    entries[hostname] = {'latency': None, 'measured': now}
+    _save(path, entries, now, _ttl())
+
+
+def measure(hostname, timeout = MEASURE_TIMEOUT):
+  """
+  Times connecting to an endpoint and completing a TLS handshake.
+
+  :param str hostname: endpoint hostname, optionally with a port
+  :param float timeout: seconds to wait for the endpoint
+
+  :returns: **float** with the latency in seconds, or **None** if the
+    endpoint is unreachable
+  """
+
+  host, _, port = hostname.partition(':')
+
+  # we only time the handshake, certificates are verified by the requests
+  # that follow
+
+  context = ssl.create_default_context()
+  context.check_hostname = False
+  context.verify_mode = ssl.CERT_NONE
+
+  start_time = time.monotonic()
+
+  try:
+    with socket.create_connection((host, int(port or 443)), timeout = timeout) as connection:
+      with context.wrap_socket(connection, server_hostname = host):
+        return time.monotonic() - start_time
+  except (IOError, OSError, ValueError):
+    return None
+
+
+def _ttl():
+  try:
+    return max(0, float(os.environ.get('GIT_REMOTE_CODECOMMIT_ENDPOINT_TTL', DEFAULT_TTL)))
+  except ValueError:
+    return DEFAULT_TTL
+
+
+def _save(path, entries, now, ttl):
+  # measurements are only useful until they expire, so drop those rather
+  # than accumulate every endpoint we've ever seen
+
+  entries = dict((hostname, entry) for hostname, entry in entries.items() if isinstance(entry, dict) and now - entry.get('measured', 0) <= ttl)
+
+  try:
+    cache.write_json(path, entries)
+  except (IOError, OSError):
+    pass  # unable to cache, we'll simply remeasure next time
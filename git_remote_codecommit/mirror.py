@@ -0,0 +1,243 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Mirrors many CodeCommit repositories in parallel...
+
+::
+
+  % git-remote-codecommit mirror --manifest repositories.txt --directory /srv/mirrors
+
+Remotes are provided as arguments or a manifest with one remote per line, in
+the same formats git accepts...
+
+::
+
+  # comments and blank lines are ignored
+  codecommit::us-east-1://profile@MyRepository
+  codecommit://profile@MyOtherRepository
+
+Git invokes us with a remote and its url, so a single argument that's a
+remote without the 'codecommit::' prefix can't be told apart from git
+mirroring a remote named 'mirror'. Such a remote needs that prefix, or to
+follow a '--'...
+
+::
+
+  % git-remote-codecommit mirror -- codecommit://profile@MyRepository
+
+Sessions are resolved once per profile and region, and shared by all of their
+repositories. Mirrors reside at '<region>/<repository>.git' within our
+directory, or '<region>/<profile>/<repository>.git' for remotes with a
+profile, so like named repositories of other regions or accounts don't
+collide. Repositories that aren't yet mirrored are cloned, and otherwise
+fetched. Remotes listed more than once are mirrored one at a time.
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import git_remote_codecommit
+
+from git_remote_codecommit.pool import SessionPool
+
+try:
+  from urllib.parse import urlparse  # python 3.x
+except ImportError:
+  from urlparse import urlparse  # python 2.x
+
+PREFIX = 'codecommit::'
+
+
+class GitError(Exception):
+  pass
+
+
+Result = collections.namedtuple('Result', ['remote', 'path', 'success', 'runtime', 'message'])
+
+
+def main(args):
+  """
+  Mirrors the repositories our arguments specify.
+
+  :param list args: command line arguments
+
+  :returns: **int** exit code, non-zero if any repository failed
+  """
+
+  parser = argparse.ArgumentParser(prog = 'git-remote-codecommit mirror', description = 'Clones or fetches mirrors of many CodeCommit repositories in parallel.')
+  parser.add_argument('remotes', nargs = '*', metavar = 'REMOTE', help = 'repository remote, such as codecommit::us-east-1://profile@repository')
+  parser.add_argument('--manifest', help = 'file with one remote per line')
+  parser.add_argument('--directory', default = '.', help = 'directory mirrors reside within (default: current directory)')
+  parser.add_argument('--jobs', type = int, default = 4, help = 'number of repositories to mirror concurrently (default: %(default)s)')
+  options = parser.parse_args(args)
+
+  remotes = list(options.remotes)
+
+  if options.manifest:
+    with open(options.manifest) as manifest:
+      remotes += read_manifest(manifest)
+
+  if not remotes:
+    parser.error('no remotes were provided')
+  elif options.jobs < 1:
+    parser.error('--jobs must be at least one')
+
+  start_time = time.time()
+  results = mirror(remotes, options.directory, options.jobs, report)
+  runtime = time.time() - start_time
+  failures = len([result for result in results if not result.success])
+
+  sys.stderr.write('Mirrored {} of {} repositories in {:.1f}s ({:.2f} repositories/s), {} failed\n'.format(len(results) - failures, len(results), runtime, len(results) / runtime if runtime else 0, failures))
+  return 1 if failures else 0
+
+
+def read_manifest(manifest):
+  """
+  Reads the remotes from a manifest.
+
+  :param file manifest: file with one remote per line
+
+  :returns: **list** of remotes
+  """
+
+  remotes = []
+
+  for line in manifest:
+    line = line.strip()
+
+    if line and not line.startswith('#'):
+      remotes.append(line)
+
+  return remotes
+
+
+def mirror(remotes, directory, jobs, on_result = None):
+  """
+  Clones or fetches mirrors of the given remotes.
+
+  :param list remotes: repository remotes
+  :param str directory: directory mirrors reside within
+  :param int jobs: number of repositories to mirror concurrently
+  :param functor on_result: called with each **Result** as it completes
+
+  :returns: **list** of **Result** for each remote
+  """
+
+  pool = SessionPool()
+  results = []
+  lock = threading.Lock()
+  path_locks = collections.defaultdict(threading.Lock)
+
+  def path_lock(path):
+    with lock:
+      return path_locks[path]
+
+  def process(remote):
+    result = _mirror_remote(remote, directory, pool, path_lock)
+
+    with lock:
+      results.append(result)
+
+      if on_result:
+        on_result(result, len(results), len(remotes))
+
+    return result
+
+  with concurrent.futures.ThreadPoolExecutor(max_workers = jobs) as executor:
+    for _ in executor.map(process, remotes):
+      pass
+
+  return results
+
+
+def report(result, completed, total):
+  """
+  Writes a line of progress to stderr.
+  """
+
+  status = 'ok' if result.success else 'failed'
+  line = '[{}/{}] {} {} ({:.1f}s)'.format(completed, total, status, result.remote, result.runtime)
+
+  if result.message:
+    line += ': ' + result.message
+
+  sys.stderr.write(line + '\n')
+  sys.stderr.flush()
+
+
+def mirror_path(directory, remote_url, context):
+  """
+  Provides where a remote is mirrored.
+
+  :param str directory: directory mirrors reside within
+  :param str remote_url: remote url without its 'codecommit::' prefix
+  :param Context context: resolved context of the remote
+
+  :returns: **str** with the path of the remote's mirror
+  """
+
+  netloc = urlparse(remote_url).netloc
+
+  if '@' in netloc:
+    return os.path.join(directory, context.region, netloc.split('@', 1)[0], context.repository + '.git')
+
+  return os.path.join(directory, context.region, context.repository + '.git')
+
+
+def _mirror_remote(remote, directory, pool, path_lock):
+  start_time = time.time()
+  remote_url = remote[len(PREFIX):] if remote.startswith(PREFIX) else remote
+  path = None
+
+  try:
+    context = pool.context(remote_url)
+    path = mirror_path(directory, remote_url, context)
+
+    # remotes listed more than once would otherwise clone or fetch into the
+    # same mirror concurrently
+
+    with path_lock(path):
+      # signed just before use so slow mirrors don't outlive their signature
+
+      url = git_remote_codecommit.git_url(context.repository, context.version, context.region, context.credentials)
+
+      try:
+        if os.path.isdir(path):
+          _git('--git-dir', path, 'fetch', '--prune', '--quiet', url, '+refs/*:refs/*')
+        else:
+          _git('clone', '--mirror', '--quiet', url, path)
+          _git('--git-dir', path, 'remote', 'set-url', 'origin', PREFIX + remote_url)
+      except GitError as exc:
+        raise GitError(str(exc).replace(url, PREFIX + remote_url))  # don't report our signature
+
+    return Result(remote, path, True, time.time() - start_time, None)
+  except Exception as exc:
+    # one repository's failure, even if unexpected, shouldn't end the others
+
+    return Result(remote, path, False, time.time() - start_time, str(exc) or type(exc).__name__)
+
+
+def _git(*args):
+  process = subprocess.Popen(('git',) + args, stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True)
+  _, stderr = process.communicate()
+
+  if process.returncode:
+    lines = [line for line in stderr.splitlines() if line.strip()]
+    raise GitError(lines[-1] if lines else 'git {} failed with exit code {}'.format(args[0], process.returncode))
@@ -0,0 +1,1006 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Speaks git's remote helper protocol directly against CodeCommit's smart-HTTP
+endpoint, rather than delegating to 'git remote-http'. This lets us reuse a
+single keep-alive connection for every request of an operation.
+
+Protocol v2 fetches are relayed through 'stateless-connect'. Otherwise, much
+like git's own remote-curl, we run 'git fetch-pack' or 'git send-pack' in
+their --stateless-rpc mode and carry each of their requests over HTTP. Pack
+data is streamed in both directions rather than buffered.
+
+Reads can be served by a different endpoint than pushes (see
+:mod:`~git_remote_codecommit.endpoints`). If that endpoint fails we fall back
+to the primary.
+
+A url's filter and depth options (see :func:`~git_remote_codecommit.parse_options`)
+apply to every fetch git doesn't provide its own for. Git runs protocol v2
+fetches itself, so these fetches (and those of urls that request an earlier
+protocol) are made with 'git fetch-pack' instead.
+
+Branches with long histories can be pushed in batches of commits, configured
+by a url's push-batch option or the GIT_REMOTE_CODECOMMIT_PUSH_BATCH
+environment variable. Each batch is a separately signed push of an
+intermediate commit along the branch's first-parent history, so no pack is
+larger than a batch. The server's refs record how far we got, so pushing
+again after an interruption resumes from the last batch it accepted.
+
+This is enabled through the GIT_REMOTE_CODECOMMIT_NATIVE environment variable.
+As with git's own https transport, the GIT_SSL_CAINFO and GIT_SSL_NO_VERIFY
+environment variables configure how certificates are verified.
+"""
+
+import base64
+import os
+import ssl
+import subprocess
+import sys
+
+import git_remote_codecommit
+
+from git_remote_codecommit import TransportError
+
+try:
+  import httplib as http_client  # python 2.x
+  from urllib import unquote
+  from urlparse import urlparse
+except ImportError:
+  import http.client as http_client  # python 3.x
+  from urllib.parse import unquote, urlparse
+
+CAPABILITIES = ('stateless-connect', 'fetch', 'push', 'option')
+
+# Requests larger than this are sent with chunked transfer encoding rather
+# than buffered to provide a content length.
+
+LARGE_REQUEST = 1024 * 1024
+READ_SIZE = 64 * 1024
+
+FLUSH_PKT = b'0000'
+DELIM_PKT = b'0001'
+RESPONSE_END_PKT = b'0002'
+
+# Options git may provide to us, and whether they're a flag, integer or
+# repeatable list.
+
+BOOLEAN_OPTIONS = ('progress', 'followtags', 'thin', 'dry-run', 'check-connectivity', 'cloning', 'update-shallow', 'deepen-relative', 'atomic', 'from-promisor', 'refetch', 'force-if-includes')
+VALUE_OPTIONS = ('verbosity', 'depth', 'deepen-since', 'filter', 'pushcert')
+LIST_OPTIONS = ('deepen-not', 'push-option', 'cas')
+
+
+def push_batch_size(url_options = None):
+  """
+  Provides the number of commits to push at a time, as configured by a url's
+  push-batch option or the GIT_REMOTE_CODECOMMIT_PUSH_BATCH environment
+  variable.
+
+  :param dict url_options: transfer options of the remote's url
+
+  :returns: **int** with the batch size, zero if pushes aren't batched
+  """
+
+  if url_options and url_options.get('push-batch'):
+    return url_options['push-batch']
+
+  try:
+    return max(0, int(os.environ.get('GIT_REMOTE_CODECOMMIT_PUSH_BATCH', 0)))
+  except ValueError:
+    return 0
+
+
+def enabled():
+  """
+  Checks if the GIT_REMOTE_CODECOMMIT_NATIVE environment variable requests
+  that we speak git's protocol ourselves.
+
+  :returns: **True** if native mode is enabled, **False** otherwise
+  """
+
+  return git_remote_codecommit._env_flag('GIT_REMOTE_CODECOMMIT_NATIVE')
+
+
+def run(authenticated_url, stdin = None, stdout = None, read_url = None, options = None, remote = None, retry = None, resign = None, ref_cache = None):
+  """
+  Serves git's remote helper commands until it closes our input.
+
+  :param str authenticated_url: signed url from git_url()
+  :param file stdin: binary stream git writes commands to
+  :param file stdout: binary stream git reads our responses from
+  :param str read_url: signed url of another endpoint to fetch from
+  :param dict options: transfer options of the remote's url
+  :param str remote: name of the remote we're serving, **None** if it's
+    anonymous
+  :param git_remote_codecommit.throttle.Retry retry: retries of throttled
+    requests to our primary endpoint
+  :param func resign: provides a newly signed url for our primary endpoint
+  :param git_remote_codecommit.refs.RefCache ref_cache: cache of the
+    references we fetch
+
+  :returns: **int** exit code for the hook
+
+  :raises: **TransportError** if CodeCommit's responses are unusable
+  """
+
+  stdin = stdin if stdin is not None else _binary(sys.stdin)
+  stdout = stdout if stdout is not None else _binary(sys.stdout)
+  helper = Helper(Connection(authenticated_url, retry), stdin, stdout, Connection(read_url) if read_url else None, options, remote, resign, ref_cache)
+
+  try:
+    return helper.serve()
+  finally:
+    helper.connection.close()
+    helper.read_connection.close()
+
+
+class HTTPError(TransportError):
+  """
+  Unsuccessful response from CodeCommit.
+
+  :var int status: response status
+  """
+
+  def __init__(self, message, status):
+    super(HTTPError, self).__init__(message)
+    self.status = status
+
+
+class Connection(object):
+  """
+  Keep-alive connection to a git repository's smart-HTTP endpoint.
+
+  :var str url: repository url, without credentials
+  :var str hostname: endpoint's hostname, including its port if not the
+    default
+  :var str authenticated_url: signed url our requests are authenticated with
+  :var git_remote_codecommit.throttle.Retry retry: retries of requests that
+    are throttled, or whose signature expired
+  """
+
+  def __init__(self, authenticated_url, retry = None):
+    url = urlparse(authenticated_url)
+
+    self.hostname = url.hostname if url.port is None else '{}:{}'.format(url.hostname, url.port)
+    self.url = '{}://{}{}'.format(url.scheme, self.hostname, url.path)
+    self._scheme = url.scheme
+    self._host = url.hostname
+    self._port = url.port
+    self._path = url.path.rstrip('/')
+    self._connection = None
+    self.retry = retry
+    self.authorize(authenticated_url)
+
+  def get(self, resource, headers = None):
+    """
+    Issues a GET request. This is retried once if our keep-alive connection
+    was closed by the server.
+
+    :param str resource: path relative to the repository, such as 'info/refs'
+    :param dict headers: additional request headers
+
+    :returns: **http.client.HTTPResponse** with a 200 status
+
+    :raises: **TransportError** if the request fails
+    """
+
+    for attempt in (1, 2):
+      try:
+        return self._send('GET', resource, None, headers)
+      except (http_client.BadStatusLine, IOError, OSError) as exc:
+        self.close()
+
+        if attempt == 2:
+          raise TransportError("unable to access '{}': {}".format(self.url, exc))
+
+  def post(self, service, body, headers = None):
+    """
+    Issues a POST request to a git service.
+
+    :param str service: service name such as 'git-upload-pack'
+    :param bytes,iterable body: request body, iterables are sent chunked
+    :param dict headers: additional request headers
+
+    :returns: **http.client.HTTPResponse** with a 200 status
+
+    :raises: **TransportError** if the request fails
+    """
+
+    request_headers = {
+        'Content-Type': 'application/x-{}-request'.format(service),
+        'Accept': 'application/x-{}-result'.format(service),
+    }
+
+    request_headers.update(headers or {})
+
+    try:
+      return self._send('POST', service, body, request_headers)
+    except (http_client.HTTPException, IOError, OSError) as exc:
+      self.close()
+      raise TransportError("unable to access '{}': {}".format(self.url, exc))
+
+  def close(self):
+    if self._connection:
+      self._connection.close()
+      self._connection = None
+
+  def authorize(self, authenticated_url):
+    """
+    Authenticates our following requests with a signed url.
+
+    :param str authenticated_url: signed url of our endpoint
+    """
+
+    url = urlparse(authenticated_url)
+    credentials = '{}:{}'.format(unquote(url.username or ''), unquote(url.password or ''))
+
+    self.authenticated_url = authenticated_url
+    self._authorization = 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+
+  def _send(self, method, resource, body, headers):
+    """
+    Issues a request, retrying it with a new signature if it's throttled.
+    Streamed requests can't be repeated, so only buffered ones are retried.
+    """
+
+    while True:
+      try:
+        return self._request(method, resource, body, headers)
+      except HTTPError as exc:
+        retry_url = self.retry(exc.status, self.authenticated_url) if self.retry and (body is None or isinstance(body, bytes)) else None
+
+        if not retry_url:
+          raise
+
+        self.authorize(retry_url)
+
+  def _request(self, method, resource, body, headers):
+    if self._connection is None:
+      if self._scheme == 'https':
+        self._connection = http_client.HTTPSConnection(self._host, self._port, context = ssl_context())
+      else:
+        self._connection = http_client.HTTPConnection(self._host, self._port)
+
+    request_headers = {
+        'Authorization': self._authorization,
+        'User-Agent': 'git-remote-codecommit',
+        'Pragma': 'no-cache',
+    }
+
+    request_headers.update(headers or {})
+
+    if isinstance(body, bytes) or body is None:
+      self._connection.request(method, '{}/{}'.format(self._path, resource), body, request_headers)
+    else:
+      request_headers['Transfer-Encoding'] = 'chunked'
+      self._connection.request(method, '{}/{}'.format(self._path, resource), chunked(body), request_headers)
+
+    response = self._connection.getresponse()
+
+    if response.status != 200:
+      response.read()
+      raise HTTPError("unable to access '{}': The requested URL returned error: {}".format(self.url, response.status), response.status)
+
+    return response
+
+
+class Helper(object):
+  """
+  Implementation of git's remote helper protocol.
+
+  :var Connection connection: connection to CodeCommit
+  :var Connection read_connection: connection fetches are made through, this
+    is our primary connection unless reads are served elsewhere
+  :var dict options: options git has provided us, defaulting to the filter
+    and depth of our url
+  :var dict url_options: transfer options of our url
+  :var str remote: name of the remote we're serving, **None** if it's
+    anonymous
+  :var func resign: provides a newly signed url for our connection
+  :var int push_batch: commits to push at a time, zero if pushes aren't
+    batched
+  :var git_remote_codecommit.refs.RefCache ref_cache: cache of the references
+    we fetch, **None** if they aren't cached
+  """
+
+  def __init__(self, connection, stdin, stdout, read_connection = None, url_options = None, remote = None, resign = None, ref_cache = None):
+    self.connection = connection
+    self.read_connection = read_connection or connection
+    self.url_options = url_options or {}
+    self.remote = remote
+    self.resign = resign
+    self.push_batch = push_batch_size(self.url_options)
+    self.ref_cache = ref_cache
+    self.options = {'progress': True, 'thin': True, 'verbosity': '1'}
+    self.options.update((name, str(self.url_options[name])) for name in ('depth', 'filter') if name in self.url_options)
+    self._stdin = stdin
+    self._stdout = stdout
+    self._advertisements = {}
+
+  def serve(self):
+    """
+    Responds to git's commands until it closes our input.
+
+    :returns: **int** exit code for the hook
+    """
+
+    while True:
+      line = self._readline()
+
+      if line is None or line == '':
+        return 0
+      elif line == 'capabilities':
+        self._write(''.join('{}\n'.format(capability) for capability in self.capabilities()) + '\n')
+      elif line.startswith('option '):
+        self._write(self.set_option(*(line[7:].split(' ', 1) + [''])[:2]) + '\n')
+      elif line in ('list', 'list for-push'):
+        self._write(self.list(line == 'list for-push'))
+      elif line.startswith('fetch '):
+        self._write(self.fetch(self._batch(line)))
+      elif line.startswith('push '):
+        self._write(self.push(self._batch(line)))
+      elif line.startswith('stateless-connect '):
+        return self.stateless_connect(line.split(' ', 1)[1])
+      else:
+        raise TransportError('unsupported remote helper command: {}'.format(line))
+
+  def capabilities(self):
+    """
+    Provides the remote helper capabilities we advertise. Without
+    'stateless-connect' git falls back to protocol v0, asking us to fetch.
+
+    :returns: **list** of capabilities
+    """
+
+    if self.url_options.get('protocol', 2) < 2 or 'filter' in self.url_options or 'depth' in self.url_options:
+      return [capability for capability in CAPABILITIES if capability != 'stateless-connect']
+
+    return list(CAPABILITIES)
+
+  def set_option(self, name, value):
+    """
+    Records an option git has provided for the following commands.
+
+    :param str name: option name
+    :param str value: option value
+
+    :returns: **str** with our response to git
+    """
+
+    if name in BOOLEAN_OPTIONS:
+      if value not in ('true', 'false'):
+        return 'error invalid value for {}: {}'.format(name, value)
+
+      self.options[name] = value == 'true'
+    elif name in VALUE_OPTIONS:
+      self.options[name] = value
+    elif name in LIST_OPTIONS:
+      self.options.setdefault(name, []).append(value)
+    else:
+      return 'unsupported'
+
+    return 'ok'
+
+  def list(self, for_push):
+    """
+    Lists the references of the repository.
+
+    :param bool for_push: lists the references for a push if **True**, or a
+      fetch otherwise
+
+    :returns: **str** with our response to git
+    """
+
+    service = 'git-receive-pack' if for_push else 'git-upload-pack'
+    advertisement = self.advertisement(service)
+    refs, symrefs = parse_advertisement(advertisement)
+    lines = []
+
+    for oid, name in refs:
+      if name in symrefs:
+        lines.append('@{} {}\n'.format(symrefs[name], name))
+      else:
+        lines.append('{} {}\n'.format(oid, name))
+
+    return ''.join(lines) + '\n'
+
+  def advertisement(self, service, headers = None):
+    """
+    Provides the reference advertisement of a service, without its
+    '# service=' preamble.
+
+    :param str service: service name such as 'git-upload-pack'
+    :param dict headers: additional request headers
+
+    :returns: **bytes** with the advertisement
+    """
+
+    if service not in self._advertisements:
+      resource = 'info/refs?service={}'.format(service)
+      content = self._cached(service, resource, None, headers)
+
+      if content is None:
+        try:
+          response = self._connection_for(service).get(resource, headers)
+        except TransportError:
+          if self._connection_for(service) is self.connection:
+            raise
+
+          self._read_failed()
+          response = self.connection.get(resource, headers)
+
+        content = response.read()
+        self._cache(service, resource, content, None, headers)
+
+      self._advertisements[service] = strip_service_header(content, service)
+
+    return self._advertisements[service]
+
+  def fetch(self, requests):
+    """
+    Fetches objects through 'git fetch-pack'.
+
+    :param list requests: '<oid> <refname>' lines git requested
+
+    :returns: **str** with our response to git
+    """
+
+    args = ['git', 'fetch-pack', '--stateless-rpc', '--stdin', '--lock-pack']
+
+    for option, flag in (('followtags', '--include-tag'), ('thin', '--thin'), ('check-connectivity', '--check-self-contained-and-connected'), ('cloning', '--cloning'), ('update-shallow', '--update-shallow'), ('from-promisor', '--from-promisor'), ('refetch', '--refetch')):
+      if self.options.get(option):
+        args.append(flag)
+
+    if not self.options.get('progress'):
+      args.append('--no-progress')
+
+    if int(self.options.get('verbosity', 1)) >= 3:
+      args += ['-v', '-v']
+
+    if self.options.get('depth'):
+      args.append('--depth={}'.format(self.options['depth']))
+
+      if self.options.get('deepen-relative'):
+        args.append('--deepen-relative')
+
+    if self.options.get('deepen-since'):
+      args.append('--shallow-since={}'.format(self.options['deepen-since']))
+
+    args += ['--shallow-exclude={}'.format(value) for value in self.options.get('deepen-not', [])]
+
+    if self.options.get('filter'):
+      args.append('--filter={}'.format(self.options['filter']))
+
+      if self.options['filter'] == self.url_options.get('filter'):
+        _record_promisor(self.remote, self.options['filter'])
+
+        if '--from-promisor' not in args:
+          args.append('--from-promisor')
+
+    args.append(self.read_connection.url)
+    preamble = b''.join(pkt_line('{}\n'.format(request[6:])) for request in requests) + FLUSH_PKT
+    result = self.rpc('git-upload-pack', args, preamble, self.advertisement('git-upload-pack'))
+
+    return result.decode('utf-8') + '\n'
+
+  def push(self, requests):
+    """
+    Pushes references through 'git send-pack'.
+
+    :param list requests: 'push <refspec>' lines git requested
+
+    :returns: **str** with our response to git
+    """
+
+    failures = ''
+
+    try:
+      # leases and atomic pushes concern the whole push, so they can't be split
+
+      if self.push_batch and not any(self.options.get(option) for option in ('dry-run', 'atomic', 'cas')):
+        requests, failures = self.push_batches(requests)
+
+      return failures + (self._send_pack(requests) if requests else '') + '\n'
+    finally:
+      if self.ref_cache and not self.options.get('dry-run'):
+        self.ref_cache.invalidate()
+
+  def push_batches(self, requests):
+    """
+    Pushes the history of each branch in batches, leaving only the final
+    commit of each to push.
+
+    :param list requests: 'push <refspec>' lines git requested
+
+    :returns: **tuple** of the form (requests, failures), with the requests
+      that remain and our response for branches whose batch was rejected
+    """
+
+    refs, _ = parse_advertisement(self.advertisement('git-receive-pack'))
+    remote_oids = set(oid for oid, _ in refs)
+    remaining, failures = [], []
+
+    for request in requests:
+      force = '+' if request[5:].startswith('+') else ''
+      src, _, dst = request[5 + len(force):].partition(':')
+      points = _batch_points(src, remote_oids, self.push_batch) if src and dst.startswith('refs/heads/') else []
+
+      for number, (point, commits, total) in enumerate(points, 1):
+        if self.options.get('progress'):
+          sys.stderr.write('Pushing batch {} of {} to {} ({} of {} commits)\n'.format(number, len(points) + 1, dst, commits, total))
+
+        # send-pack reports on every ref of the remote, not just those we push
+
+        result = self._send_pack(['push {}{}:{}'.format(force, point, dst)])
+        status = [line for line in result.splitlines(True) if line.split()[1:2] == [dst]]
+
+        if status != ['ok {}\n'.format(dst)]:
+          failures += status or ['error {} batch rejected\n'.format(dst)]
+          break
+
+        remote_oids.add(point)
+      else:
+        remaining.append(request)
+
+    return remaining, ''.join(failures)
+
+  def _send_pack(self, requests):
+    """
+    Runs 'git send-pack' for the given requests. Pushes that follow another
+    are signed anew, since a branch's batches can outlast a signature.
+    """
+
+    if self.resign and 'git-receive-pack' not in self._advertisements:
+      self.connection.authorize(self.resign())
+
+    args = ['git', 'send-pack', '--stateless-rpc', '--helper-status']
+
+    for option, flag in (('thin', '--thin'), ('dry-run', '--dry-run'), ('atomic', '--atomic'), ('force-if-includes', '--force-if-includes')):
+      if self.options.get(option):
+        args.append(flag)
+
+    if self.options.get('pushcert') in ('true', 'if-asked'):
+      args.append('--signed={}'.format('yes' if self.options['pushcert'] == 'true' else 'if-asked'))
+
+    verbosity = int(self.options.get('verbosity', 1))
+
+    if verbosity == 0:
+      args.append('--quiet')
+    elif verbosity > 1:
+      args.append('--verbose')
+
+    args += ['--push-option={}'.format(value) for value in self.options.get('push-option', [])]
+    args.append('--progress' if self.options.get('progress') else '--no-progress')
+    args += self.options.get('cas', [])
+    args += [self.connection.url, '--stdin']
+
+    preamble = b''.join(pkt_line('{}\n'.format(request[5:])) for request in requests) + FLUSH_PKT
+    result = self.rpc('git-receive-pack', args, preamble, self.advertisement('git-receive-pack'))
+    self._advertisements.pop('git-receive-pack', None)
+
+    return result.decode('utf-8')
+
+  def rpc(self, service, args, preamble, advertisement):
+    """
+    Runs a git command in its --stateless-rpc mode, carrying each request it
+    makes to CodeCommit.
+
+    Such commands write each request as pkt-lines wrapping the raw request,
+    terminated by a flush-pkt. Once finished they write a flush-pkt followed
+    by their results.
+
+    :param str service: service name such as 'git-upload-pack'
+    :param list args: command to run
+    :param bytes preamble: input for the command ahead of the advertisement
+    :param bytes advertisement: reference advertisement from the service
+
+    :returns: **bytes** with the command's results
+    """
+
+    client = subprocess.Popen(args, stdin = subprocess.PIPE, stdout = subprocess.PIPE)
+
+    try:
+      client.stdin.write(preamble + advertisement)
+      client.stdin.flush()
+
+      while True:
+        first = read_pkt(client.stdout)
+
+        if first is None or first == FLUSH_PKT:
+          break
+
+        response = self._connection_for(service).post(service, request_body(first, client.stdout))
+
+        while True:
+          data = response.read(READ_SIZE)
+
+          if not data:
+            break
+
+          client.stdin.write(data)
+
+        client.stdin.flush()
+
+      client.stdin.close()
+      result = client.stdout.read()
+    except TransportError:
+      client.kill()
+      raise
+    finally:
+      exit_code = client.wait()
+
+    if exit_code:
+      raise TransportError('{} failed with exit code {}'.format(args[1], exit_code))
+
+    return result
+
+  def stateless_connect(self, service):
+    """
+    Relays protocol v2 requests from git, terminating each response with a
+    response-end pkt.
+
+    :param str service: service name such as 'git-upload-pack'
+
+    :returns: **int** exit code for the hook
+    """
+
+    headers = {'Git-Protocol': 'version=2'}
+    advertisement = self.advertisement(service, headers)
+
+    if not advertisement.startswith(pkt_line('version 2\n')):
+      self._write('fallback\n')
+      return self.serve()
+
+    self._write('\n')
+    self._stdout.write(advertisement)
+    self._stdout.flush()
+
+    while True:
+      first = read_pkt(self._stdin)
+
+      if first is None:
+        return 0
+
+      body = [first]
+
+      while body[-1] != FLUSH_PKT:
+        pkt = read_pkt(self._stdin)
+
+        if pkt is None:
+          raise TransportError('git closed the connection mid-request')
+
+        body.append(pkt)
+
+      body = b''.join(body)
+
+      # only reference listings are cached, so transfers remain streamed
+
+      listing = self.ref_cache and service == 'git-upload-pack' and body.startswith(pkt_line('command=ls-refs\n'))
+      cached = self._cached(service, service, body, headers) if listing else None
+
+      if cached is not None:
+        self._stdout.write(cached)
+      elif listing:
+        content = self._connection_for(service).post(service, body, headers).read()
+        self._cache(service, service, content, body, headers)
+        self._stdout.write(content)
+      else:
+        response = self._connection_for(service).post(service, body, headers)
+
+        while True:
+          data = response.read(READ_SIZE)
+
+          if not data:
+            break
+
+          self._stdout.write(data)
+
+      self._stdout.write(RESPONSE_END_PKT)
+      self._stdout.flush()
+
+  def _cached(self, service, resource, body, headers):
+    """
+    Provides our cached response to a request for the references we fetch,
+    refreshing it in the background if it's becoming stale.
+    """
+
+    if not self.ref_cache or service != 'git-upload-pack':
+      return None
+
+    content = self.ref_cache.get(resource, body, headers)
+
+    if content is not None:
+      self.ref_cache.revalidate(self.connection.authenticated_url)
+
+    return content
+
+  def _cache(self, service, resource, content, body, headers):
+    if self.ref_cache and service == 'git-upload-pack':
+      self.ref_cache.put(resource, content, body, headers)
+
+  def _connection_for(self, service):
+    return self.read_connection if service == 'git-upload-pack' else self.connection
+
+  def _read_failed(self):
+    """
+    Stops reading from an endpoint that failed, in this and later
+    invocations until it's remeasured.
+    """
+
+    from git_remote_codecommit import endpoints
+
+    endpoints.mark_unhealthy(self.read_connection.hostname)
+    self.read_connection.close()
+    self.read_connection = self.connection
+
+  def _batch(self, line):
+    """
+    Reads the remainder of a batched command, which git terminates with a
+    blank line.
+    """
+
+    lines = [line]
+
+    while True:
+      line = self._readline()
+
+      if not line:
+        return lines
+
+      lines.append(line)
+
+  def _readline(self):
+    line = self._stdin.readline()
+    return line.decode('utf-8').rstrip('\n') if line else None
+
+  def _write(self, content):
+    self._stdout.write(content.encode('utf-8'))
+    self._stdout.flush()
+
+
+def _batch_points(src, remote_oids, batch_size):
+  """
+  Provides the intermediate commits to push a branch's history through, each
+  a batch of commits past the last along its first-parent history. Commits
+  the remote already has, or we lack, are excluded.
+
+  :returns: **list** of (commit, commits pushed, total commits) tuples
+  """
+
+  process = subprocess.Popen(['git', 'rev-list', '--first-parent', '--reverse', '--ignore-missing', '--stdin', src], stdin = subprocess.PIPE, stdout = subprocess.PIPE, universal_newlines = True)
+  commits = process.communicate(''.join('^{}\n'.format(oid) for oid in sorted(remote_oids)))[0].split()
+
+  if process.returncode:
+    return []  # not a commit, so pushed as usual
+
+  return [(commits[index - 1], index, len(commits)) for index in range(batch_size, len(commits), batch_size)]
+
+
+def _record_promisor(remote, filter_spec):
+  """
+  Configures our repository to lazily fetch objects a filter omits from the
+  remote, as 'git clone --filter' does. Git only accepts partial packs from
+  such remotes.
+  """
+
+  if not remote or '://' in remote:
+    return  # anonymous remotes have nowhere to record this
+
+  with open(os.devnull, 'wb') as devnull:
+    for key, value in (('core.repositoryformatversion', '1'), ('extensions.partialclone', remote), ('remote.{}.promisor'.format(remote), 'true'), ('remote.{}.partialclonefilter'.format(remote), filter_spec)):
+      subprocess.call(['git', 'config', key, value], stdout = devnull, stderr = devnull)
+
+
+def pkt_line(content):
+  """
+  Encodes content as a git pkt-line.
+
+  :param str,bytes content: content of the line
+
+  :returns: **bytes** with the encoded pkt-line
+  """
+
+  if not isinstance(content, bytes):
+    content = content.encode('utf-8')
+
+  return '{:04x}'.format(len(content) + 4).encode('ascii') + content
+
+
+def read_pkt(stream):
+  """
+  Reads a pkt-line from a stream.
+
+  :param file stream: binary stream to read from
+
+  :returns: **bytes** with the raw pkt-line (including its length), or
+    **None** if the stream has ended
+
+  :raises: **TransportError** if the stream isn't pkt-line encoded
+  """
+
+  header = _read_exactly(stream, 4)
+
+  if not header:
+    return None
+
+  try:
+    length = int(header, 16)
+  except ValueError:
+    raise TransportError('invalid pkt-line header: {!r}'.format(header))
+
+  if length < 4:
+    return header  # flush, delimiter, or response-end pkt
+
+  content = _read_exactly(stream, length - 4)
+
+  if len(content) != length - 4:
+    raise TransportError('truncated pkt-line')
+
+  return header + content
+
+
+def request_body(first, stream):
+  """
+  Unwraps a request written by a --stateless-rpc command, whose content is
+  carried within pkt-lines and terminated by a flush-pkt. Small requests are
+  provided as bytes, and larger ones as an iterable so they can be streamed.
+
+  :param bytes first: first pkt-line of the request
+  :param file stream: binary stream with the remainder of the request
+
+  :returns: **bytes** or iterable with the request body
+  """
+
+  buffered = [first[4:]]
+  size = len(buffered[0])
+  pkt = first
+
+  while size <= LARGE_REQUEST:
+    pkt = read_pkt(stream)
+
+    if pkt is None or pkt == FLUSH_PKT:
+      return b''.join(buffered)
+
+    buffered.append(pkt[4:])
+    size += len(pkt) - 4
+
+  def stream_remainder():
+    yield b''.join(buffered)
+
+    while True:
+      pkt = read_pkt(stream)
+
+      if pkt is None or pkt == FLUSH_PKT:
+        return
+
+      yield pkt[4:]
+
+  return stream_remainder()
+
+
+def chunked(body):
+  """
+  Applies chunked transfer encoding to a streamed request body. We do this
+  ourselves since http.client's encode_chunked argument requires python 3.6.
+
+  :param iterable body: content of the request
+
+  :returns: iterable with the encoded content
+  """
+
+  for data in body:
+    if data:
+      yield '{:x}\r\n'.format(len(data)).encode('ascii') + data + b'\r\n'
+
+  yield b'0\r\n\r\n'
+
+
+def strip_service_header(advertisement, service):
+  """
+  Removes the '# service=' pkt-line and flush-pkt smart-HTTP servers preface
+  version 0 and 1 advertisements with.
+
+  :param bytes advertisement: body of an info/refs response
+  :param str service: service name such as 'git-upload-pack'
+
+  :returns: **bytes** with the advertisement's remaining content
+  """
+
+  header = pkt_line('# service={}\n'.format(service))
+
+  if advertisement.startswith(header):
+    advertisement = advertisement[len(header):]
+
+    if advertisement.startswith(FLUSH_PKT):
+      advertisement = advertisement[4:]
+  elif not advertisement.startswith(pkt_line('version 2\n')):
+    raise TransportError('invalid reference advertisement from {}'.format(service))
+
+  return advertisement
+
+
+def parse_advertisement(advertisement):
+  """
+  Parses a version 0 or 1 reference advertisement.
+
+  :param bytes advertisement: advertisement without its service preamble
+
+  :returns: **tuple** of the form (refs, symrefs), where refs is a list of
+    (oid, refname) tuples and symrefs maps symbolic references to their target
+  """
+
+  refs, symrefs = [], {}
+  offset = 0
+
+  while offset + 4 <= len(advertisement):
+    length = int(advertisement[offset:offset + 4], 16)
+
+    if length < 4:
+      break
+
+    line = advertisement[offset + 4:offset + length].decode('utf-8').rstrip('\n')
+    offset += length
+
+    if line.startswith('version '):
+      continue
+
+    if '\0' in line:
+      line, capabilities = line.split('\0', 1)
+
+      for capability in capabilities.split(' '):
+        if capability.startswith('symref='):
+          source, target = capability[7:].split(':', 1)
+          symrefs[source] = target
+
+    oid, name = line.split(' ', 1)
+
+    if name != 'capabilities^{}':
+      refs.append((oid, name))
+
+  return refs, symrefs
+
+
+def _read_exactly(stream, size):
+  chunks = []
+
+  while size > 0:
+    chunk = stream.read(size)
+
+    if not chunk:
+      break
+
+    chunks.append(chunk)
+    size -= len(chunk)
+
+  return b''.join(chunks)
+
+
+def ssl_context():
+  """
+  Provides the context https connections are made with, honoring the same
+  environment variables as git's own https transport.
+
+  :returns: **ssl.SSLContext** for our connections
+  """
+
+  if os.environ.get('GIT_SSL_NO_VERIFY'):
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+  return ssl.create_default_context(cafile = os.environ.get('GIT_SSL_CAINFO') or None)
+
+
+def _binary(stream):
+  return getattr(stream, 'buffer', stream)
@@ -0,0 +1,270 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Thread-safe pool of resolved sessions for long-running processes that sign
+many urls, such as services that hand out clone urls...
+
+::
+
+  from git_remote_codecommit.pool import SessionPool
+
+  pool = SessionPool()
+  url = pool.git_url('codecommit::us-east-1://profile@MyRepository')
+
+  # or within a coroutine
+  url = await pool.git_url_async('codecommit::us-east-1://profile@MyRepository')
+
+Building a botocore session and resolving its credentials is by far the most
+expensive part of signing a url, so we do so once per profile and region
+and reuse it for every repository. Concurrent requests for a profile we
+haven't resolved wait on a single resolution. Sessions are evicted when
+least recently used beyond our size limit, or after a maximum age so
+configuration changes are eventually picked up.
+
+Credentials that expire (such as those from assumed roles or SSO) are
+refreshed in the background once they're within a margin of expiring, so
+requests don't block on AWS. Only credentials that are about to expire are
+refreshed while the caller waits.
+"""
+
+import calendar
+import collections
+import threading
+import time
+
+import git_remote_codecommit
+
+from git_remote_codecommit import cache
+
+try:
+  from urlparse import urlparse  # python 2.x
+except ImportError:
+  from urllib.parse import urlparse  # python 3.x
+
+# Number of sessions we retain.
+
+MAX_SIZE = 128
+
+# Seconds we reuse a session for before resolving it anew.
+
+MAX_AGE = 3600
+
+# Seconds before credentials expire that we refresh them in the background.
+# This matches botocore's own advisory refresh window.
+
+REFRESH_MARGIN = 15 * 60
+
+# Seconds between attempts to refresh a session's credentials in the
+# background.
+
+REFRESH_INTERVAL = 30
+
+
+class SessionPool(object):
+  """
+  Thread-safe cache of resolved contexts per profile and region.
+
+  :var int max_size: maximum number of sessions we retain
+  :var float max_age: seconds a session is reused for, no limit if zero
+  :var float refresh_margin: seconds before credentials expire that we
+    refresh them in the background
+  """
+
+  def __init__(self, max_size = MAX_SIZE, max_age = MAX_AGE, refresh_margin = REFRESH_MARGIN):
+    self.max_size = max_size
+    self.max_age = max_age
+    self.refresh_margin = refresh_margin
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  def context(self, remote_url):
+    """
+    Provides the context of a remote, resolving its session only if we lack
+    one for its profile and region.
+
+    :param str remote_url: git remote url
+
+    :returns: :class:`~git_remote_codecommit.Context` of the remote
+
+    :raises: the same exceptions as :func:`~git_remote_codecommit.Context.from_url`
+    """
+
+    key, repository = _key(remote_url)
+    options = git_remote_codecommit.parse_options(remote_url)
+    entry = self._entry(key)
+
+    with entry.lock:
+      if entry.context is None:
+        try:
+          entry.context = git_remote_codecommit.Context.from_url(remote_url)
+        except Exception:
+          self._discard(key, entry)  # errors aren't cached, so fixes apply immediately
+          raise
+
+      remaining = _seconds_remaining(entry.context.credentials)
+
+      if remaining is not None and remaining <= cache.EXPIRY_MARGIN:
+        entry.context.credentials.get_frozen_credentials()  # too close to expiry to sign with, refresh now
+      elif remaining is not None and remaining <= self.refresh_margin and time.time() >= entry.next_refresh:
+        entry.next_refresh = time.time() + REFRESH_INTERVAL
+        threading.Thread(target = _refresh, args = (entry,), name = 'SessionPool refresh').start()
+
+    return entry.context._replace(repository = repository, options = options)
+
+  def git_url(self, remote_url):
+    """
+    Signs a url for the given remote.
+
+    :param str remote_url: git remote url
+
+    :returns: **str** with the signed url
+
+    :raises: the same exceptions as :func:`~git_remote_codecommit.Context.from_url`
+    """
+
+    context = self.context(remote_url)
+    return git_remote_codecommit.git_url(context.repository, context.version, context.region, context.credentials)
+
+  def git_url_async(self, remote_url, loop = None):
+    """
+    Asyncio counterpart of :func:`~git_remote_codecommit.pool.SessionPool.git_url`.
+    Remotes whose session we have are signed immediately, and others are
+    resolved within the loop's default executor so we don't block it.
+
+    :param str remote_url: git remote url
+    :param asyncio.AbstractEventLoop loop: event loop to use, the current one
+      if **None**
+
+    :returns: **asyncio.Future** for the signed url
+    """
+
+    import asyncio
+
+    loop = loop or asyncio.get_event_loop()
+
+    if self._is_ready(remote_url):
+      future = loop.create_future()
+
+      try:
+        future.set_result(self.git_url(remote_url))
+      except Exception as exc:
+        future.set_exception(exc)
+
+      return future
+
+    return loop.run_in_executor(None, self.git_url, remote_url)
+
+  def clear(self):
+    """
+    Discards all of our sessions, such as when our AWS configuration changes.
+    """
+
+    with self._lock:
+      self._entries.clear()
+
+  def __len__(self):
+    with self._lock:
+      return len(self._entries)
+
+  def _entry(self, key):
+    """
+    Provides the entry of a profile and region, creating it if absent or
+    expired, and evicting the least recently used beyond our size limit.
+    """
+
+    with self._lock:
+      entry = self._entries.get(key)
+
+      if entry is not None and self.max_age and time.time() - entry.created > self.max_age:
+        del self._entries[key]
+        entry = None
+
+      if entry is None:
+        entry = _Entry()
+        self._entries[key] = entry
+
+        while len(self._entries) > max(1, self.max_size):
+          self._entries.popitem(last = False)
+      else:
+        self._entries.move_to_end(key)
+
+      return entry
+
+  def _discard(self, key, entry):
+    with self._lock:
+      if self._entries.get(key) is entry:
+        del self._entries[key]
+
+  def _is_ready(self, remote_url):
+    """
+    Checks if we can sign a url for this remote without blocking.
+    """
+
+    try:
+      key, _ = _key(remote_url)
+    except git_remote_codecommit.FormatError:
+      return True  # raises immediately
+
+    with self._lock:
+      entry = self._entries.get(key)
+
+    if entry is None or entry.context is None or (self.max_age and time.time() - entry.created > self.max_age):
+      return False
+
+    remaining = _seconds_remaining(entry.context.credentials)
+    return remaining is None or remaining > cache.EXPIRY_MARGIN
+
+
+class _Entry(object):
+  def __init__(self):
+    self.context = None
+    self.created = time.time()
+    self.next_refresh = 0
+    self.lock = threading.Lock()
+
+
+def _key(remote_url):
+  """
+  Provides the profile and region a remote's session is keyed on, along with
+  its repository.
+  """
+
+  url = urlparse(remote_url or '')
+  profile, repository = url.netloc.split('@', 1) if '@' in url.netloc else (None, url.netloc)
+
+  if not url.scheme or not repository:
+    raise git_remote_codecommit.FormatError('The following URL is malformed: {}. A URL must be in one of the two following formats: codecommit://<profile>@<repository> or codecommit::<region>://<profile>@<repository>'.format(remote_url))
+
+  return (url.scheme, profile), repository
+
+
+def _seconds_remaining(credentials):
+  """
+  Provides the number of seconds until credentials expire, or **None** if
+  they don't.
+  """
+
+  expiry_time = getattr(credentials, '_expiry_time', None)
+
+  if expiry_time is None or not hasattr(credentials, 'get_frozen_credentials'):
+    return None
+
+  return calendar.timegm(expiry_time.utctimetuple()) - time.time()
+
+
+def _refresh(entry):
+  try:
+    entry.context.credentials.get_frozen_credentials()  # botocore refreshes within its advisory window
+  except Exception:
+    pass  # retried later, and botocore refreshes on use regardless
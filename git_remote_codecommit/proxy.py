@@ -0,0 +1,599 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Localhost proxy that signs git's smart-HTTP requests on their way to
+CodeCommit. Rather than a url with a single signature, git is handed a url of
+this proxy...
+
+::
+
+  http://127.0.0.1:<port>/<remote token>/<remote>
+
+... and each request it makes is signed anew with fresh credentials, so long
+operations don't outlive their signature. Requests from every git process
+share a pool of keep-alive connections to CodeCommit, and bodies are streamed
+in both directions rather than buffered. Fetches are sent to the fastest read
+endpoint (see :mod:`~git_remote_codecommit.endpoints`), and pushes to the
+primary.
+
+This is enabled through the GIT_REMOTE_CODECOMMIT_PROXY environment variable.
+Hooks start a proxy in the background if one isn't already running, and it
+exits once idle. Its port and secret are recorded in a state file only the
+user can read. Every request must be prefixed with an HMAC of its remote keyed
+by that secret, so the urls git is given (and which others may see in its
+arguments) only authorize requests for their own remote. As with our agent, a
+proxy only serves hooks whose environment and AWS configuration match its own.
+"""
+
+import argparse
+import base64
+import binascii
+import hashlib
+import hmac
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import git_remote_codecommit
+
+from git_remote_codecommit import agent, cache, endpoints, native
+from git_remote_codecommit.pool import SessionPool
+
+try:
+  import httplib as http_client  # python 2.x
+  from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+  from urllib import quote, unquote
+  from urlparse import urlparse
+except ImportError:
+  import http.client as http_client  # python 3.x
+  from http.server import BaseHTTPRequestHandler, HTTPServer
+  from urllib.parse import quote, unquote, urlparse
+
+try:
+  import socketserver  # python 3.x
+except ImportError:
+  import SocketServer as socketserver  # python 2.x
+
+# Seconds without requests until a proxy we started exits.
+
+IDLE_TIMEOUT = 300
+
+# Seconds a hook waits for a proxy to start or respond before signing urls
+# itself.
+
+START_TIMEOUT = 5
+CLIENT_TIMEOUT = 5
+
+# Request bodies up to this size are buffered so they can be retried on a
+# fresh connection if a pooled one was closed by CodeCommit. Larger bodies are
+# streamed.
+
+LARGE_REQUEST = 1024 * 1024
+READ_SIZE = 64 * 1024
+
+# Idle upstream connections we retain per endpoint.
+
+MAX_IDLE_CONNECTIONS = 8
+
+# Headers that concern a single hop, so aren't relayed.
+
+HOP_HEADERS = ('connection', 'keep-alive', 'proxy-authorization', 'proxy-authenticate', 'te', 'trailer', 'transfer-encoding', 'upgrade', 'content-length', 'authorization', 'host', 'expect')
+
+
+def enabled():
+  """
+  Checks if the GIT_REMOTE_CODECOMMIT_PROXY environment variable requests that
+  git's requests go through our signing proxy.
+
+  :returns: **True** if the proxy is enabled, **False** otherwise
+  """
+
+  return git_remote_codecommit._env_flag('GIT_REMOTE_CODECOMMIT_PROXY')
+
+
+def state_path():
+  """
+  Provides the state file of the proxy for our environment and configuration.
+
+  :returns: **str** with the file's path
+  """
+
+  return cache.cache_dir('proxy', cache.fingerprint() + '.json')
+
+
+def remote_token(secret, remote_url):
+  """
+  Provides the token that authorizes requests for a remote.
+
+  :param str secret: secret of the proxy
+  :param str remote_url: git remote url
+
+  :returns: **str** with the hex encoded HMAC of the remote
+  """
+
+  return hmac.new(secret.encode('utf-8'), remote_url.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def git_url(remote_url):
+  """
+  Provides a url of our proxy for the given remote, starting a proxy if one
+  isn't running.
+
+  :param str remote_url: git remote url
+
+  :returns: **str** with the proxy's url for this remote, or **None** if the
+    proxy is unavailable
+
+  :raises: the same exceptions as :func:`~git_remote_codecommit.Context.from_url`
+  """
+
+  path = state_path()
+  state = cache.read_json(path)
+
+  for attempt in (1, 2):
+    if isinstance(state, dict):
+      try:
+        return _resolve(state, remote_url)
+      except (IOError, OSError, ValueError, KeyError, http_client.HTTPException):
+        pass  # proxy has exited or is unresponsive
+
+    if attempt == 1:
+      state = start(path)
+
+  return None
+
+
+def start(path, timeout = START_TIMEOUT):
+  """
+  Starts a detached proxy that records itself within the given state file.
+
+  :param str path: state file for the proxy
+  :param float timeout: seconds to wait for the proxy to start
+
+  :returns: **dict** with the proxy's state, or **None** if it failed to start
+  """
+
+  process = subprocess.Popen(
+      [sys.executable, '-m', 'git_remote_codecommit.proxy', '--state', path, '--idle-timeout', str(IDLE_TIMEOUT)],
+      stdin = subprocess.DEVNULL,
+      stdout = subprocess.DEVNULL,
+      stderr = subprocess.DEVNULL,
+      close_fds = True,
+      start_new_session = True,
+  )
+
+  deadline = time.time() + timeout
+
+  while time.time() < deadline and process.poll() is None:
+    state = cache.read_json(path)
+
+    if isinstance(state, dict) and state.get('pid') == process.pid:
+      return state
+
+    time.sleep(0.02)
+
+  return None
+
+
+def _resolve(state, remote_url):
+  """
+  Asks a proxy to resolve the context of a remote, so configuration errors are
+  reported to the hook rather than within git's requests. Errors we don't
+  relay result in **None**, so the hook can resolve the remote itself to
+  report them.
+  """
+
+  base_path = '/{}/{}'.format(remote_token(state['token'], remote_url), quote(remote_url, safe = ''))
+  connection = http_client.HTTPConnection('127.0.0.1', state['port'], timeout = CLIENT_TIMEOUT)
+
+  try:
+    connection.request('GET', base_path + '/')
+    response = connection.getresponse()
+    body = response.read()
+  finally:
+    connection.close()
+
+  if response.status == 200:
+    return 'http://127.0.0.1:{}{}'.format(state['port'], base_path)
+  elif response.status == 400:
+    import json
+
+    error = json.loads(body.decode('utf-8'))
+
+    if error.get('error') in agent.RELAYED_ERRORS:
+      raise getattr(git_remote_codecommit, error['error'])(error.get('message', ''))
+
+    return None
+
+  raise IOError('proxy responded with status {}'.format(response.status))
+
+
+class ConnectionPool(object):
+  """
+  Keep-alive connections to an upstream endpoint, shared between threads.
+  """
+
+  def __init__(self, scheme, host, port, max_idle = MAX_IDLE_CONNECTIONS):
+    self._scheme = scheme
+    self._host = host
+    self._port = port
+    self._max_idle = max_idle
+    self._idle = []
+    self._lock = threading.Lock()
+
+  def acquire(self):
+    """
+    Provides an idle connection, or a new one if none are available.
+
+    :returns: tuple of the form (connection, reused)
+    """
+
+    with self._lock:
+      if self._idle:
+        return self._idle.pop(), True
+
+    if self._scheme == 'https':
+      return http_client.HTTPSConnection(self._host, self._port, context = native.ssl_context()), False
+    else:
+      return http_client.HTTPConnection(self._host, self._port), False
+
+  def release(self, connection):
+    """
+    Returns a connection whose response has been fully read to the pool.
+    """
+
+    with self._lock:
+      if len(self._idle) < self._max_idle:
+        self._idle.append(connection)
+        return
+
+    connection.close()
+
+  def close(self):
+    with self._lock:
+      idle, self._idle = self._idle, []
+
+    for connection in idle:
+      connection.close()
+
+
+class Proxy(socketserver.ThreadingMixIn, HTTPServer):
+  """
+  HTTP server that signs and relays git's requests to CodeCommit.
+
+  :var str token: secret that the path of every request must be prefixed
+    with an HMAC by, see :func:`~git_remote_codecommit.proxy.remote_token`
+  :var float idle_timeout: seconds without requests until we shut down, no
+    timeout if zero
+  """
+
+  daemon_threads = True
+
+  def __init__(self, port = 0, idle_timeout = 0, token = None):
+    HTTPServer.__init__(self, ('127.0.0.1', port), _Handler)
+
+    self.token = token or binascii.hexlify(os.urandom(16)).decode('ascii')
+    self.idle_timeout = idle_timeout
+    self.last_request = time.time()
+    self._active = 0
+    self._sessions = SessionPool()
+    self._pools = {}
+    self._lock = threading.Lock()
+
+  def git_url(self, remote_url, read = False):
+    """
+    Signs a url for the given remote with fresh credentials.
+
+    :param str remote_url: git remote url
+    :param bool read: provides a url of the fastest read endpoint if **True**,
+      and the primary otherwise
+
+    :returns: **str** with the signed url
+    """
+
+    context = self._sessions.context(remote_url)
+
+    if read and endpoints.configured():
+      endpoint = endpoints.read_endpoint(context.region)
+
+      if endpoint != endpoints.primary(context.region):
+        return git_remote_codecommit.git_url(context.repository, context.version, endpoint.region, context.credentials, hostname = endpoint.hostname)
+
+    return git_remote_codecommit.git_url(context.repository, context.version, context.region, context.credentials)
+
+  def pool(self, scheme, host, port):
+    """
+    Provides the connection pool of an upstream endpoint.
+    """
+
+    with self._lock:
+      key = (scheme, host, port)
+
+      if key not in self._pools:
+        self._pools[key] = ConnectionPool(scheme, host, port)
+
+      return self._pools[key]
+
+  def activity(self, delta):
+    with self._lock:
+      self._active += delta
+      self.last_request = time.time()
+
+  def service_actions(self):
+    with self._lock:
+      idle = self.idle_timeout and not self._active and time.time() - self.last_request > self.idle_timeout
+
+    if idle:
+      threading.Thread(target = self.shutdown).start()
+
+  def server_close(self):
+    HTTPServer.server_close(self)
+
+    for pool in list(self._pools.values()):
+      pool.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  def log_message(self, *args):
+    pass
+
+  def do_GET(self):
+    self._relay()
+
+  def do_POST(self):
+    self._relay()
+
+  def _relay(self):
+    self.server.activity(1)
+
+    try:
+      self._relay_request()
+    finally:
+      self.server.activity(-1)
+
+  def _relay_request(self):
+    # paths are of the form /<remote token>/<quoted remote>/<resource>
+
+    parts = self.path.split('/', 3)
+    remote_url = unquote(parts[2]) if len(parts) >= 3 else ''
+
+    if len(parts) < 3 or not hmac.compare_digest(parts[1].encode('utf-8'), remote_token(self.server.token, remote_url).encode('utf-8')):
+      self._discard_body()
+      return self._respond(403)
+
+    resource = parts[3] if len(parts) > 3 else ''
+    read = resource.startswith('git-upload-pack') or 'service=git-upload-pack' in resource
+
+    try:
+      url = urlparse(self.server.git_url(remote_url, read))
+    except Exception as exc:
+      import json
+
+      self._discard_body()
+      return self._respond(400, json.dumps({'error': type(exc).__name__, 'message': str(exc)}).encode('utf-8'), 'application/json')
+
+    if not resource:
+      self._discard_body()
+      return self._respond(200)  # hook checking that the remote resolves
+
+    headers = dict((name, value) for name, value in self.headers.items() if name.lower() not in HOP_HEADERS)
+
+    body = self._request_body(headers)
+
+    try:
+      connection, response, pool = self._send(url, resource, body, headers)
+    except (http_client.HTTPException, IOError, OSError) as exc:
+      if not read or not (body is None or isinstance(body, bytes)):
+        self.close_connection = True
+        return self._respond(502, str(exc).encode('utf-8'), 'text/plain')
+
+      # read endpoint failed, so fall back to the primary
+
+      endpoints.mark_unhealthy(headers['Host'])
+      url = urlparse(self.server.git_url(remote_url))
+
+      try:
+        connection, response, pool = self._send(url, resource, body, headers)
+      except (http_client.HTTPException, IOError, OSError) as exc:
+        self.close_connection = True
+        return self._respond(502, str(exc).encode('utf-8'), 'text/plain')
+
+    try:
+      self._relay_response(response)
+    except (IOError, OSError):
+      connection.close()
+      self.close_connection = True
+      return
+
+    if response.will_close:
+      connection.close()
+    else:
+      pool.release(connection)
+
+  def _send(self, url, resource, body, headers):
+    """
+    Sends a request upstream, signed by the credentials of the given url.
+    Requests on a pooled connection that CodeCommit already closed are retried
+    once, if their body was buffered.
+
+    :returns: tuple of the form (connection, response, pool)
+    """
+
+    credentials = '{}:{}'.format(unquote(url.username or ''), unquote(url.password or ''))
+    headers['Authorization'] = 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+    headers['Host'] = url.hostname if url.port is None else '{}:{}'.format(url.hostname, url.port)
+
+    path = '{}/{}'.format(url.path.rstrip('/'), resource)
+    pool = self.server.pool(url.scheme, url.hostname, url.port)
+
+    while True:
+      connection, reused = pool.acquire()
+
+      try:
+        if isinstance(body, bytes) or body is None or 'Content-Length' in headers:
+          connection.request(self.command, path, body, headers)
+        else:
+          headers['Transfer-Encoding'] = 'chunked'
+          connection.request(self.command, path, native.chunked(body), headers)
+
+        return connection, connection.getresponse(), pool
+      except (http_client.HTTPException, IOError, OSError):
+        connection.close()
+
+        if not reused or not isinstance(body, bytes):
+          raise
+
+  def _request_body(self, headers):
+    """
+    Provides the body of git's request, as bytes if small or an iterable to
+    stream it.
+    """
+
+    if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+      return self._read_chunked()
+
+    length = int(self.headers.get('Content-Length') or 0)
+
+    if self.command != 'POST' and not length:
+      return None
+    elif length <= LARGE_REQUEST:
+      return self.rfile.read(length)
+
+    headers['Content-Length'] = str(length)
+    return self._read_length(length)
+
+  def _read_length(self, length):
+    while length > 0:
+      data = self.rfile.read(min(READ_SIZE, length))
+
+      if not data:
+        raise IOError('git closed the connection mid-request')
+
+      length -= len(data)
+      yield data
+
+  def _read_chunked(self):
+    while True:
+      size = int(self.rfile.readline().split(b';', 1)[0].strip(), 16)
+
+      if not size:
+        while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+          pass  # trailers
+
+        return
+
+      for data in self._read_length(size):
+        yield data
+
+      self.rfile.readline()
+
+  def _discard_body(self):
+    body = self._request_body({})
+
+    if body is not None and not isinstance(body, bytes):
+      for _ in body:
+        pass
+
+  def _relay_response(self, response):
+    # CodeCommit challenges unsigned requests, but git has no credentials to
+    # offer us so we respond as a refusal rather than prompt the user
+
+    self.send_response(403 if response.status == 401 else response.status, response.reason)
+
+    for name, value in response.getheaders():
+      if name.lower() not in HOP_HEADERS and name.lower() != 'www-authenticate':
+        self.send_header(name, value)
+
+    length = response.getheader('Content-Length')
+
+    if length is not None and response.getheader('Transfer-Encoding') is None:
+      self.send_header('Content-Length', length)
+      self.end_headers()
+
+      while True:
+        data = response.read(READ_SIZE)
+
+        if not data:
+          break
+
+        self.wfile.write(data)
+    else:
+      self.send_header('Transfer-Encoding', 'chunked')
+      self.end_headers()
+
+      while True:
+        data = response.read1(READ_SIZE) if hasattr(response, 'read1') else response.read(READ_SIZE)
+
+        if not data:
+          break
+
+        self.wfile.write('{:x}\r\n'.format(len(data)).encode('ascii') + data + b'\r\n')
+
+      self.wfile.write(b'0\r\n\r\n')
+
+    self.wfile.flush()
+
+  def _respond(self, status, body = b'', content_type = None):
+    self.send_response(status)
+
+    if content_type:
+      self.send_header('Content-Type', content_type)
+
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+
+def main(args):
+  """
+  Runs our proxy until it's interrupted or idle.
+
+  :param list args: command line arguments
+
+  :returns: **int** exit code
+  """
+
+  parser = argparse.ArgumentParser(prog = 'git-remote-codecommit proxy', description = 'Signs and relays git requests to CodeCommit.')
+  parser.add_argument('--state', default = state_path(), help = 'file to record our port and token within (default: %(default)s)')
+  parser.add_argument('--port', type = int, default = 0, help = 'localhost port to listen on (default: any available)')
+  parser.add_argument('--idle-timeout', type = float, default = 0, help = 'seconds without requests until the proxy exits')
+  options = parser.parse_args(args)
+
+  try:
+    proxy = Proxy(options.port, options.idle_timeout)
+  except (IOError, OSError) as exc:
+    git_remote_codecommit.error(str(exc))
+
+  state = {'pid': os.getpid(), 'port': proxy.server_address[1], 'token': proxy.token}
+  cache.write_json(options.state, state)
+
+  try:
+    proxy.serve_forever(poll_interval = 1)
+  except KeyboardInterrupt:
+    pass
+  finally:
+    proxy.server_close()
+
+    if cache.read_json(options.state) == state:
+      cache.remove(options.state)
+
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
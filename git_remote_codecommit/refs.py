@@ -0,0 +1,266 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Short lived cache of the references a repository advertises, so polling it
+with 'git ls-remote' or no-op fetches doesn't download every reference each
+time. This is enabled through the GIT_REMOTE_CODECOMMIT_REF_CACHE environment
+variable, the number of seconds an advertisement is reused for...
+
+::
+
+  % export GIT_REMOTE_CODECOMMIT_REF_CACHE=30
+
+Advertisements are kept per region, repository, and identity. Once one is
+halfway to expiring, the invocation that uses it refreshes it in a detached
+process so later invocations continue to be answered without waiting on
+CodeCommit. Pushes through us discard the repository's advertisements.
+
+Only the references of fetches are cached. Requests that transfer objects,
+and everything about pushes, always go to CodeCommit.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+from git_remote_codecommit import TransportError, cache
+
+
+def ttl():
+  """
+  Provides the number of seconds advertisements are reused for, as configured
+  by the GIT_REMOTE_CODECOMMIT_REF_CACHE environment variable.
+
+  :returns: **int** with the time to live, zero if caching is disabled
+  """
+
+  try:
+    return max(0, int(os.environ.get('GIT_REMOTE_CODECOMMIT_REF_CACHE', 0)))
+  except ValueError:
+    return 0
+
+
+class RefCache(object):
+  """
+  Responses to a repository's reference requests, shared by invocations
+  until they expire.
+
+  :var str key: identifies the repository and identity we're of
+  :var int ttl: seconds responses are reused for
+  :var str path: file our responses are kept in
+  """
+
+  def __init__(self, key, ttl):
+    self.key = key
+    self.ttl = ttl
+    self.path = cache.cache_dir('refs', key + '.json')
+    self._stale = False
+
+  def get(self, resource, body = None, headers = None):
+    """
+    Provides the cached response to a request, noting if it's due to be
+    refreshed.
+
+    :param str resource: path of the request, such as 'info/refs'
+    :param bytes body: content of a POST, **None** for a GET
+    :param dict headers: additional request headers
+
+    :returns: **bytes** with the response, or **None** if it isn't cached
+    """
+
+    entry = _read(self.path)['responses'].get(_request_id(resource, body, headers))
+
+    if not isinstance(entry, dict):
+      return None
+
+    try:
+      age = time.time() - entry['time']
+      response = base64.b64decode(entry['response'])
+    except (KeyError, TypeError, ValueError):
+      return None
+
+    if not 0 <= age < self.ttl:
+      return None
+    elif age >= self.ttl / 2.0:
+      self._stale = True
+
+    return response
+
+  def put(self, resource, response, body = None, headers = None):
+    """
+    Caches the response to a request.
+
+    :param str resource: path of the request, such as 'info/refs'
+    :param bytes response: content of the response
+    :param bytes body: content of a POST, **None** for a GET
+    :param dict headers: additional request headers
+    """
+
+    content = _read(self.path)
+    content['responses'][_request_id(resource, body, headers)] = _entry(resource, response, body, headers)
+    _write(self.path, content)
+
+  def invalidate(self):
+    """
+    Discards our responses, such as after a push changes the references
+    they list.
+    """
+
+    cache.remove(self.path)
+
+  def revalidate(self, authenticated_url):
+    """
+    Refreshes our responses in a detached process if any we've provided are
+    halfway to expiring, and others aren't already doing so.
+
+    :param str authenticated_url: signed url of the repository
+    """
+
+    if not self._stale:
+      return
+
+    self._stale = False
+    content = _read(self.path)
+
+    if time.time() - content.get('refreshing', 0) < self.ttl / 2.0:
+      return
+
+    content['refreshing'] = time.time()
+    _write(self.path, content)
+
+    # the signed url is provided through stdin so it isn't visible to others
+    # listing our processes
+
+    try:
+      process = subprocess.Popen(
+          [sys.executable, '-m', 'git_remote_codecommit.refs', self.key],
+          stdin = subprocess.PIPE,
+          stdout = subprocess.DEVNULL,
+          stderr = subprocess.DEVNULL,
+          close_fds = True,
+          start_new_session = True,
+      )
+
+      process.stdin.write(authenticated_url.encode('utf-8'))
+      process.stdin.close()
+    except (IOError, OSError):
+      pass  # unable to refresh, responses will be fetched once they expire
+
+
+def refresh(key, authenticated_url):
+  """
+  Repeats each request we have a response cached for, replacing them.
+
+  :param str key: identifies the repository and identity to refresh
+  :param str authenticated_url: signed url of the repository
+
+  :returns: **int** with the number of responses refreshed
+  """
+
+  from git_remote_codecommit import native  # its http and tls modules are costly to import
+
+  path = cache.cache_dir('refs', key + '.json')
+  connection = native.Connection(authenticated_url)
+  refreshed = {}
+
+  try:
+    for request_id, entry in _read(path)['responses'].items():
+      try:
+        resource, headers = entry['resource'], entry['headers']
+        body = base64.b64decode(entry['body']) if entry['body'] is not None else None
+      except (KeyError, TypeError, ValueError):
+        continue
+
+      if body is None:
+        response = connection.get(resource, headers)
+      else:
+        response = connection.post(resource, body, headers)
+
+      refreshed[request_id] = _entry(resource, response.read(), body, headers)
+  finally:
+    connection.close()
+
+  # a push discards our responses while we refresh them, in which case ours
+  # may predate it
+
+  content = _read(path)
+
+  if not content['responses']:
+    return 0
+
+  content['responses'].update(refreshed)
+  content.pop('refreshing', None)
+  _write(path, content)
+
+  return len(refreshed)
+
+
+def _request_id(resource, body, headers):
+  request = [resource, body.decode('latin-1') if body is not None else None, sorted((headers or {}).items())]
+  return hashlib.sha256(json.dumps(request).encode('utf-8')).hexdigest()
+
+
+def _entry(resource, response, body, headers):
+  return {
+      'resource': resource,
+      'body': base64.b64encode(body).decode('ascii') if body is not None else None,
+      'headers': headers or {},
+      'response': base64.b64encode(response).decode('ascii'),
+      'time': time.time(),
+  }
+
+
+def _read(path):
+  content = cache.read_json(path)
+
+  if not isinstance(content, dict) or not isinstance(content.get('responses'), dict):
+    return {'responses': {}}
+
+  return content
+
+
+def _write(path, content):
+  try:
+    cache.write_json(path, content)
+  except (IOError, OSError):
+    pass  # unable to cache, we'll simply ask CodeCommit next time
+
+
+def main(args):
+  """
+  Refreshes the cached responses of a repository, reading its signed url from
+  stdin.
+
+  :param list args: command line arguments
+
+  :returns: **int** exit code
+  """
+
+  if len(args) != 1:
+    sys.stderr.write('usage: python -m git_remote_codecommit.refs <key>\n')
+    return 1
+
+  try:
+    refresh(args[0], sys.stdin.readline().strip())
+    return 0
+  except (TransportError, IOError, OSError):
+    return 1  # responses are fetched normally once they expire
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,125 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Compact index of the regions CodeCommit is available within. Botocore's
+endpoint data is large, so rather than parse it on every invocation we
+generate a small region => (partition, dns suffix) mapping on first use and
+cache it on disk until botocore is upgraded.
+"""
+
+import importlib.util
+import os
+import re
+
+from git_remote_codecommit import cache
+
+# Revision of our index's format. Bump this if its structure changes.
+
+INDEX_VERSION = 1
+
+_index = None
+
+
+def lookup(region):
+  """
+  Provides the partition information for a region.
+
+  :param str region: region to look up
+
+  :returns: **tuple** of the form (partition, dns_suffix), or **None** if
+    CodeCommit isn't available within the region
+  """
+
+  entry = index().get(region)
+  return tuple(entry) if entry else None
+
+
+def index():
+  """
+  Provides our region index, loading it from disk or generating it from
+  botocore's endpoint data if absent or stale.
+
+  :returns: **dict** mapping regions to a [partition, dns_suffix] list
+  """
+
+  global _index
+
+  if _index is None:
+    path = cache.cache_dir('regions.json')
+    key = _index_key()
+    content = cache.read_json(path)
+
+    if isinstance(content, dict) and content.get('key') == key and isinstance(content.get('regions'), dict):
+      _index = content['regions']
+    else:
+      _index = generate()
+
+      try:
+        cache.write_json(path, {'key': key, 'regions': _index})
+      except (IOError, OSError):
+        pass  # unable to cache, we'll simply regenerate it next time
+
+  return _index
+
+
+def generate():
+  """
+  Builds our region index from botocore's endpoint data. This is expensive,
+  so callers should usually use :func:`~git_remote_codecommit.regions.index`
+  instead.
+
+  :returns: **dict** mapping regions to a [partition, dns_suffix] list
+  """
+
+  import botocore.loaders
+  import botocore.regions
+
+  endpoints = botocore.loaders.create_loader(os.environ.get('AWS_DATA_PATH')).load_data('endpoints')
+  resolver = botocore.regions.EndpointResolver(endpoints)
+  regions = {}
+
+  for partition in endpoints['partitions']:
+    for region in resolver.get_available_endpoints('codecommit', partition['partition']):
+      regions[region] = [partition['partition'], partition['dnsSuffix']]
+
+  return regions
+
+
+def _index_key():
+  """
+  Inputs our index is derived from. If any of these change our index must be
+  regenerated.
+  """
+
+  return [INDEX_VERSION, _botocore_version(), os.environ.get('AWS_DATA_PATH')]
+
+
+def _botocore_version():
+  """
+  Reads botocore's version without importing it, which is comparatively slow.
+  """
+
+  spec = importlib.util.find_spec('botocore')
+
+  try:
+    with open(spec.origin) as init_file:
+      match = re.search(r"^__version__ = ['\"]([^'\"]+)['\"]", init_file.read(), re.MULTILINE)
+
+    if match:
+      return match.group(1)
+  except (AttributeError, IOError, OSError, TypeError):
+    pass
+
+  import botocore
+  return botocore.__version__
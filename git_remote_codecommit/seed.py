@@ -0,0 +1,375 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Shared cache of git bundles that seed clones, so hosts that repeatedly clone
+the same repositories (such as CI runners) only download what changed. This
+is enabled by the GIT_REMOTE_CODECOMMIT_SEED_CACHE environment variable...
+
+::
+
+  % export GIT_REMOTE_CODECOMMIT_SEED_CACHE=/var/cache/codecommit-seeds
+
+When git invokes us for a repository without any references (a clone) and we
+have a bundle of that region's repository, we unbundle it and point temporary
+refs/codecommit-seed/* references at its tips. Git then advertises those
+commits to CodeCommit, which sends only the objects we lack. The temporary
+references are removed once git's transport finishes.
+
+Bundles are refreshed in the background from completed clones once they're
+older than GIT_REMOTE_CODECOMMIT_SEED_CACHE_TTL seconds. Refreshes are
+serialized with file locks, written atomically, and the least recently used
+bundles are evicted when the cache exceeds GIT_REMOTE_CODECOMMIT_SEED_CACHE_SIZE
+megabytes.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import git_remote_codecommit
+
+from git_remote_codecommit import cache
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None  # file locks are unavailable on windows
+
+try:
+  from urllib.parse import quote, urlparse
+except ImportError:
+  from urllib import quote
+  from urlparse import urlparse
+
+# Seconds a bundle is used for until it's refreshed, unless overridden by the
+# GIT_REMOTE_CODECOMMIT_SEED_CACHE_TTL environment variable.
+
+DEFAULT_TTL = 3600
+
+# Megabytes our bundles can occupy, unless overridden by the
+# GIT_REMOTE_CODECOMMIT_SEED_CACHE_SIZE environment variable.
+
+DEFAULT_SIZE = 10240
+
+# Seconds a refresh waits for the git process that invoked us to finish.
+
+REFRESH_TIMEOUT = 3600
+
+SEED_REFS = 'refs/codecommit-seed/'
+
+
+def enabled():
+  """
+  Checks if the GIT_REMOTE_CODECOMMIT_SEED_CACHE environment variable enables
+  our seed cache. Values other than booleans name its directory.
+
+  :returns: **True** if clones should be seeded, **False** otherwise
+  """
+
+  return fcntl is not None and git_remote_codecommit._env_flag('GIT_REMOTE_CODECOMMIT_SEED_CACHE', default = bool(os.environ.get('GIT_REMOTE_CODECOMMIT_SEED_CACHE', '').strip()))
+
+
+def seed_dir():
+  """
+  Provides the directory our bundles reside within. This is the
+  GIT_REMOTE_CODECOMMIT_SEED_CACHE environment variable if it names a
+  directory, or 'seeds' within our cache directory if it's simply 'true'.
+
+  :returns: **str** with the absolute path
+  """
+
+  if git_remote_codecommit._env_flag('GIT_REMOTE_CODECOMMIT_SEED_CACHE'):
+    return cache.cache_dir('seeds')
+
+  return os.path.abspath(os.path.expanduser(os.environ.get('GIT_REMOTE_CODECOMMIT_SEED_CACHE', '').strip()))
+
+
+def bundle_path(region, repository):
+  """
+  Provides the bundle that seeds clones of a repository.
+
+  :param str region: region the repository resides within
+  :param str repository: repository name
+
+  :returns: **str** with the bundle's path
+  """
+
+  return os.path.join(seed_dir(), quote(region, safe = ''), quote(repository, safe = '') + '.bundle')
+
+
+class Seeding(object):
+  """
+  Seed applied to the repository git invoked us for.
+
+  :var str git_dir: repository we're seeding
+  :var str bundle: bundle it's seeded from
+  :var list refs: temporary references we created
+  """
+
+  def __init__(self, git_dir, bundle, refs):
+    self.git_dir = git_dir
+    self.bundle = bundle
+    self.refs = refs
+
+  def finish(self):
+    """
+    Removes our temporary references, and refreshes our bundle in the
+    background if it's absent or stale.
+    """
+
+    if self.refs:
+      commands = ''.join('delete {}\n'.format(ref) for ref in self.refs)
+      _git(self.git_dir, 'update-ref', '--stdin', input = commands)
+
+    if _is_stale(self.bundle):
+      refresh(self.git_dir, self.bundle, os.getppid())
+
+
+def prepare(remote_url, region = None):
+  """
+  Seeds the repository git invoked us for if it lacks any references and we
+  have a bundle of it.
+
+  :param str remote_url: remote url that was provided to the hook
+  :param str region: region the repository resides within, this requires
+    resolving the remote's session if **None**
+
+  :returns: :class:`~git_remote_codecommit.seed.Seeding` to finish after git's
+    transport, or **None** if this isn't a clone
+  """
+
+  git_dir = os.environ.get('GIT_DIR')
+
+  if not git_dir or _git(git_dir, 'for-each-ref', '--count=1') != '':
+    return None  # outside a repository, or not a clone
+
+  url = urlparse(remote_url)
+  repository = url.netloc.split('@', 1)[-1]
+  bundle = bundle_path(region or git_remote_codecommit.Context.from_url(remote_url).region, repository)
+
+  if not os.path.exists(bundle):
+    return Seeding(git_dir, bundle, [])
+
+  tips = set()
+
+  for line in (_git(git_dir, 'bundle', 'unbundle', bundle) or '').splitlines():
+    tips.add(line.split()[0])
+
+  refs = ['{}{}'.format(SEED_REFS, tip) for tip in sorted(tips)]
+
+  if refs and _git(git_dir, 'update-ref', '--stdin', input = ''.join('create {} {}\n'.format(ref, ref[len(SEED_REFS):]) for ref in refs)) is None:
+    refs = []  # unbundle failed partway, so seed nothing
+
+  # access time tracks when bundles were last used, leaving their modification
+  # time to indicate when they were last refreshed
+
+  try:
+    os.utime(bundle, (time.time(), os.stat(bundle).st_mtime))
+  except OSError:
+    pass
+
+  return Seeding(git_dir, bundle, refs)
+
+
+def refresh(git_dir, bundle, wait_pid = None):
+  """
+  Starts a detached process that replaces a bundle with the content of a
+  repository.
+
+  :param str git_dir: repository to bundle
+  :param str bundle: bundle to replace
+  :param int wait_pid: process to wait for before bundling, such as the git
+    clone that's populating the repository
+  """
+
+  args = [sys.executable, '-m', 'git_remote_codecommit.seed', '--git-dir', os.path.abspath(git_dir), '--bundle', bundle]
+
+  if wait_pid:
+    args += ['--wait-pid', str(wait_pid)]
+
+  try:
+    subprocess.Popen(
+        args,
+        stdin = subprocess.DEVNULL,
+        stdout = subprocess.DEVNULL,
+        stderr = subprocess.DEVNULL,
+        close_fds = True,
+        start_new_session = True,
+    )
+  except (IOError, OSError):
+    pass  # unable to refresh, the next clone will try again
+
+
+def create(git_dir, bundle):
+  """
+  Replaces a bundle with the content of a repository, then evicts the least
+  recently used bundles if our cache is too large. Concurrent refreshes of
+  the same bundle are skipped.
+
+  :param str git_dir: repository to bundle
+  :param str bundle: bundle to replace
+
+  :returns: **True** if the bundle was replaced, **False** otherwise
+  """
+
+  directory = os.path.dirname(bundle)
+  os.makedirs(directory, mode = 0o700, exist_ok = True)
+
+  with open(bundle + '.lock', 'a') as lock_file:
+    try:
+      fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except (IOError, OSError):
+      return False  # another process is refreshing this bundle
+
+    if not _is_stale(bundle) or not _git(git_dir, 'for-each-ref', '--count=1'):
+      return False
+
+    temporary_path = '{}.{}.tmp'.format(bundle, os.getpid())
+
+    try:
+      if _git(git_dir, 'bundle', 'create', '-q', temporary_path, '--all') is None:
+        return False
+
+      os.replace(temporary_path, bundle)
+    finally:
+      if os.path.exists(temporary_path):
+        os.remove(temporary_path)
+
+  evict(bundle)
+  return True
+
+
+def evict(keep = None):
+  """
+  Removes the least recently used bundles until our cache is within its size
+  limit.
+
+  :param str keep: bundle to retain regardless of the limit
+  """
+
+  bundles = []
+
+  for root, _, filenames in os.walk(seed_dir()):
+    for filename in filenames:
+      if filename.endswith('.bundle'):
+        path = os.path.join(root, filename)
+
+        try:
+          stat = os.stat(path)
+        except OSError:
+          continue
+
+        bundles.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+
+  total = sum(size for _, size, _ in bundles)
+
+  for _, size, path in sorted(bundles):
+    if total <= _size_limit():
+      break
+    elif path == keep:
+      continue
+
+    with open(path + '.lock', 'a') as lock_file:
+      try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+      except (IOError, OSError):
+        continue  # being refreshed
+
+      try:
+        os.remove(path)
+        total -= size
+      except OSError:
+        pass
+
+
+def _is_stale(bundle):
+  try:
+    return time.time() - os.stat(bundle).st_mtime > _ttl()
+  except OSError:
+    return True
+
+
+def _ttl():
+  try:
+    return max(0, float(os.environ.get('GIT_REMOTE_CODECOMMIT_SEED_CACHE_TTL', DEFAULT_TTL)))
+  except ValueError:
+    return DEFAULT_TTL
+
+
+def _size_limit():
+  try:
+    return max(0, float(os.environ.get('GIT_REMOTE_CODECOMMIT_SEED_CACHE_SIZE', DEFAULT_SIZE))) * 1024 * 1024
+  except ValueError:
+    return DEFAULT_SIZE * 1024 * 1024
+
+
+def _git(git_dir, *args, **kwargs):
+  """
+  Runs a git command within a repository.
+
+  :returns: **str** with its stdout, or **None** if it failed
+  """
+
+  env = dict(os.environ, GIT_DIR = git_dir)
+
+  try:
+    process = subprocess.run(('git',) + args, input = kwargs.get('input'), stdout = subprocess.PIPE, stderr = subprocess.DEVNULL, env = env, universal_newlines = True)
+  except (IOError, OSError):
+    return None
+
+  return process.stdout if process.returncode == 0 else None
+
+
+def _running(pid):
+  try:
+    os.kill(pid, 0)
+    return True
+  except OSError:
+    return False
+
+
+def main(args):
+  """
+  Refreshes a bundle from a repository.
+
+  :param list args: command line arguments
+
+  :returns: **int** exit code
+  """
+
+  parser = argparse.ArgumentParser(prog = 'python -m git_remote_codecommit.seed', description = 'Refreshes a bundle that seeds clones.')
+  parser.add_argument('--git-dir', required = True, help = 'repository to bundle')
+  parser.add_argument('--bundle', required = True, help = 'bundle to replace')
+  parser.add_argument('--wait-pid', type = int, help = 'process to wait for before bundling')
+  options = parser.parse_args(args)
+
+  # git writes a clone's references after its transport finishes, so wait
+  # for it to complete
+
+  if options.wait_pid:
+    deadline = time.time() + REFRESH_TIMEOUT
+
+    while _running(options.wait_pid) and time.time() < deadline:
+      time.sleep(0.1)
+
+  try:
+    return 0 if create(options.git_dir, options.bundle) else 1
+  except (IOError, OSError):
+    return 1
+
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,106 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+SigV4 signing of CodeCommit urls. This produces the same signatures as
+botocore's SigV4Auth, but caches the signing key derived from each secret
+(an HMAC chain of date => region => service => 'aws4_request') so signing
+many urls doesn't repeat the derivation.
+"""
+
+import hashlib
+import hmac
+import threading
+
+SERVICE = 'codecommit'
+
+# Maximum number of derived keys we retain for the present day.
+
+MAX_KEYS = 256
+
+
+class Signer(object):
+  """
+  Thread-safe SigV4 signer for CodeCommit urls. Derived keys are only valid
+  for a single day, so our cache is emptied when the date we sign for changes.
+  """
+
+  def __init__(self):
+    self._keys = {}
+    self._date = None
+    self._lock = threading.Lock()
+
+  def sign(self, hostname, path, region, secret_key, timestamp):
+    """
+    Provides a SigV4 signature for a CodeCommit url.
+
+    :param str hostname: aws hostname request is for
+    :param str path: resource the request is for
+    :param str region: region the repository resides within
+    :param str secret_key: secret access key to sign with
+    :param str timestamp: UTC time of the request (YYYYMMDDTHHMMSS)
+
+    :return: signature for the url
+    """
+
+    date = timestamp[:8]
+    canonical_request = 'GIT\n{}\n\nhost:{}\n\nhost\n'.format(path, hostname)
+
+    string_to_sign = '\n'.join((
+        'AWS4-HMAC-SHA256',
+        timestamp,
+        '{}/{}/{}/aws4_request'.format(date, region, SERVICE),
+        hashlib.sha256(canonical_request.encode('utf-8')).hexdigest(),
+    ))
+
+    signature = hmac.new(self.signing_key(secret_key, date, region), string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+    return '{}Z{}'.format(timestamp, signature)
+
+  def signing_key(self, secret_key, date, region):
+    """
+    Provides the key derived from a secret for signing requests on a given
+    day within a region.
+
+    :param str secret_key: secret access key
+    :param str date: UTC date (YYYYMMDD)
+    :param str region: region the request is for
+
+    :returns: **bytes** with the derived key
+    """
+
+    cache_key = (hashlib.sha256(secret_key.encode('utf-8')).digest(), region)
+
+    with self._lock:
+      if date != self._date:
+        self._keys.clear()
+        self._date = date
+
+      key = self._keys.get(cache_key)
+
+    if key is None:
+      key = ('AWS4' + secret_key).encode('utf-8')
+
+      for part in (date, region, SERVICE, 'aws4_request'):
+        key = hmac.new(key, part.encode('utf-8'), hashlib.sha256).digest()
+
+      with self._lock:
+        if date == self._date:
+          if len(self._keys) >= MAX_KEYS:
+            self._keys.clear()
+
+          self._keys[cache_key] = key
+
+    return key
+
+
+SIGNER = Signer()
@@ -0,0 +1,237 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Resolution of static credentials without botocore. Most remotes are signed
+with credentials from environment variables or keys within the AWS
+configuration files, which we can read with the standard library far faster
+than botocore can build a session.
+
+We follow botocore's precedence...
+
+* Environment variables, unless the url names a profile.
+* Roles, web identities, SSO, logins, credential processes, and plugins,
+  which we leave to botocore.
+* Keys within the shared credentials file.
+* Keys within the config file.
+
+Anything else, including every error, is left to
+:func:`~git_remote_codecommit.Context.from_url` so it behaves exactly as it
+always has.
+"""
+
+import collections
+import os
+import re
+
+import git_remote_codecommit
+
+from git_remote_codecommit import regions
+
+try:
+  import configparser  # python 3.x
+except ImportError:
+  import ConfigParser as configparser  # python 2.x
+
+try:
+  from urlparse import urlparse  # python 2.x
+except ImportError:
+  from urllib.parse import urlparse  # python 3.x
+
+# Profile attributes that mean botocore must provide credentials, as they
+# take precedence over (or replace) static keys.
+
+DELEGATED_PREFIXES = ('role_', 'source_profile', 'credential_', 'web_identity_', 'sso_', 'login_')
+
+# Session tokens in the order botocore checks them.
+
+TOKENS = ('aws_security_token', 'aws_session_token')
+ENV_TOKENS = ('AWS_SECURITY_TOKEN', 'AWS_SESSION_TOKEN')
+
+StaticCredentials = collections.namedtuple('StaticCredentials', ['access_key', 'secret_key', 'token', 'method'])
+
+
+def enabled():
+  """
+  Checks if the GIT_REMOTE_CODECOMMIT_FAST_PATH environment variable leaves
+  static credentials to us. This is the default.
+
+  :returns: **True** if static credentials are resolved without botocore,
+    **False** otherwise
+  """
+
+  return git_remote_codecommit._env_flag('GIT_REMOTE_CODECOMMIT_FAST_PATH', default = True)
+
+
+def context(remote_url):
+  """
+  Resolves a remote whose credentials are static, without botocore.
+
+  :param str remote_url: git remote url
+
+  :returns: :class:`~git_remote_codecommit.Context` without a session, or
+    **None** if the remote needs botocore
+  """
+
+  url = urlparse(remote_url)
+
+  if not url.scheme or not url.netloc:
+    return None
+
+  try:
+    options = git_remote_codecommit.parse_options(remote_url)
+  except git_remote_codecommit.FormatError:
+    return None  # botocore's path reports this
+
+  if '@' in url.netloc:
+    profile, repository = url.netloc.split('@', 1)
+    explicit = True
+  else:
+    profile = os.environ.get('AWS_DEFAULT_PROFILE') or os.environ.get('AWS_PROFILE') or 'default'
+    repository, explicit = url.netloc, False
+
+  try:
+    config = _read(os.environ.get('AWS_CONFIG_FILE', '~/.aws/config'))
+    credentials_file = _read(os.environ.get('AWS_SHARED_CREDENTIALS_FILE', '~/.aws/credentials'))
+  except ValueError:
+    return None  # unparsable, botocore reports this
+
+  profiles = _profiles(config)
+
+  if profiles is None or any(config.get('plugins', {}).values()):
+    return None
+
+  config_profile = profiles.get(profile, {})
+  merged = dict(config_profile)
+  merged.update(credentials_file.get(profile, {}))
+
+  if profile not in profiles and profile not in credentials_file and (explicit or profile != 'default'):
+    return None  # botocore reports missing profiles
+
+  region = _region(url.scheme, merged)
+
+  if not region:
+    return None
+
+  credentials = None
+
+  if not explicit:
+    credentials = _env_credentials()
+
+    if credentials is False:
+      return None
+
+  if credentials is None:
+    if any(key.startswith(DELEGATED_PREFIXES) for key in merged) or (not explicit and os.environ.get('AWS_WEB_IDENTITY_TOKEN_FILE')):
+      return None
+
+    credentials = _profile_credentials(credentials_file.get(profile, {}), 'shared-credentials-file')
+
+    if credentials is None:
+      credentials = _profile_credentials(config_profile, 'config-file')
+
+  if not credentials:
+    return None
+
+  return git_remote_codecommit.Context(None, repository, 'v1', region, credentials, options)
+
+
+def _read(path):
+  """
+  Parses an AWS configuration file as botocore does.
+
+  :returns: **dict** of sections to their attributes, empty if the file is
+    absent
+
+  :raises: **ValueError** if the file is malformed
+  """
+
+  path = os.path.expanduser(os.path.expandvars(path))
+
+  if not os.path.isfile(path):
+    return {}
+
+  parser = configparser.RawConfigParser()
+
+  try:
+    parser.read([path])
+  except (configparser.Error, UnicodeDecodeError) as exc:
+    raise ValueError(str(exc))
+
+  return dict((section, dict(parser.items(section))) for section in parser.sections())
+
+
+def _profiles(config):
+  """
+  Provides the profiles of a config file, or **None** if their names need
+  botocore's parsing.
+  """
+
+  profiles = {}
+
+  for section, attributes in config.items():
+    if section.startswith('profile'):
+      parts = section.split()
+
+      if len(parts) != 2 or parts[0] != 'profile' or '"' in section or "'" in section:
+        return None
+
+      profiles[parts[1]] = attributes
+    elif section == 'default':
+      profiles[section] = attributes
+
+  return profiles
+
+
+def _region(scheme, profile):
+  if scheme == 'codecommit':
+    region = os.environ['AWS_DEFAULT_REGION'] if 'AWS_DEFAULT_REGION' in os.environ else profile.get('region')
+  elif re.match(r"^[a-z]{2}-\w*.*-\d{1}", scheme):
+    region = scheme
+  else:
+    return None
+
+  return region if region and regions.lookup(region) else None
+
+
+def _env_credentials():
+  """
+  Provides credentials from our environment, **None** if absent, or **False**
+  if they need botocore (such as partial or expiring credentials).
+  """
+
+  access_key = os.environ.get('AWS_ACCESS_KEY_ID', '')
+
+  if not access_key:
+    return None
+
+  secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY', '')
+
+  if not secret_key or os.environ.get('AWS_CREDENTIAL_EXPIRATION'):
+    return False
+
+  token = next((os.environ[name] for name in ENV_TOKENS if os.environ.get(name)), None)
+  return StaticCredentials(access_key, secret_key, token, 'env')
+
+
+def _profile_credentials(profile, method):
+  if 'aws_access_key_id' not in profile:
+    return None
+
+  access_key, secret_key = profile['aws_access_key_id'], profile.get('aws_secret_access_key')
+
+  if not access_key or not secret_key:
+    return False  # partial credentials, botocore reports this
+
+  token = next((profile[name] for name in TOKENS if name in profile), None)
+  return StaticCredentials(access_key, secret_key, token, method)
@@ -0,0 +1,553 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Client-side rate limiting, and retries of transfers that CodeCommit
+throttles.
+
+When many hosts share an account (such as a CI fleet at its peak) CodeCommit
+throttles their requests, failing whole operations. The
+GIT_REMOTE_CODECOMMIT_RATE_LIMIT environment variable caps how many
+invocations per second begin a transfer for each profile and region. This is
+a token bucket that processes share through a small lock-protected state
+file, so invocations beyond the limit wait their turn rather than adding to
+the overload.
+
+With GIT_REMOTE_CODECOMMIT_RETRIES, requests that are throttled (or whose
+signature has expired) are retried after a jittered exponential backoff,
+each time with a new signature. Our native transport retries the individual
+request. Git's own transport can't be resumed, so we relay git's commands to
+it and, should it fail before responding to git's last command, replay them
+to another. Output git has already read must be reproduced exactly,
+otherwise the failure stands.
+
+State files also accumulate how often invocations waited and were
+throttled, which 'git-remote-codecommit throttle' reports.
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+
+from git_remote_codecommit import cache
+
+try:
+  import fcntl
+except ImportError:
+  fcntl = None  # windows, where processes don't share their buckets
+
+# Response statuses CodeCommit throttles requests with.
+
+THROTTLED_STATUSES = (429, 503)
+
+# Seconds after signing that CodeCommit rejecting a url as forbidden is
+# attributed to its signature having expired.
+
+SIGNATURE_AGE = 300
+
+# Bounds of the exponential backoff between retries, in seconds.
+
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 20
+
+READ_SIZE = 64 * 1024
+
+# How git's transports (and ours) report an unsuccessful response.
+
+ERROR_PATTERN = re.compile(r'returned error: (\d{3})')
+
+
+class Retry(object):
+  """
+  Retry budget of a remote's operation, which all of its requests share.
+
+  :var str key: profile and region the remote's requests are limited by
+  :var func resign: provides a newly signed url for the remote
+  :var int limit: maximum number of retries
+  :var int attempts: retries so far
+  :var float waited: seconds we've spent waiting to retry
+  """
+
+  def __init__(self, key, resign, limit = None):
+    self.key = key
+    self.resign = resign
+    self.limit = retries() if limit is None else limit
+    self.attempts = 0
+    self.waited = 0.0
+
+  def __call__(self, status, url):
+    """
+    Waits to retry a request that CodeCommit rejected.
+
+    :param int status: response status of the request
+    :param str url: signed url the request was made with
+
+    :returns: **str** with a newly signed url to retry with, or **None** if
+      the request shouldn't be retried
+    """
+
+    if status in THROTTLED_STATUSES:
+      record(self.key, throttled = 1)
+
+    if self.attempts >= self.limit or not retryable(status, cache.signature_time(url)):
+      return None
+
+    self.attempts += 1
+    delay = backoff(self.attempts)
+    sys.stderr.write('CodeCommit responded with {}, retrying in {:.1f}s ({} of {})\n'.format(status, delay, self.attempts, self.limit))
+
+    time.sleep(delay)
+    self.waited += delay + acquire(self.key)
+    record(self.key, retries = 1)
+
+    return self.resign()
+
+
+def rate_limit():
+  """
+  Provides the rate invocations are limited to, as configured by the
+  GIT_REMOTE_CODECOMMIT_RATE_LIMIT (invocations per second) and
+  GIT_REMOTE_CODECOMMIT_RATE_BURST (invocations that can begin at once)
+  environment variables.
+
+  :returns: **tuple** of the form (rate, burst), or **None** if invocations
+    are unlimited
+  """
+
+  try:
+    rate = float(os.environ.get('GIT_REMOTE_CODECOMMIT_RATE_LIMIT', 0))
+  except ValueError:
+    return None
+
+  if rate <= 0:
+    return None
+
+  try:
+    burst = float(os.environ.get('GIT_REMOTE_CODECOMMIT_RATE_BURST', 0))
+  except ValueError:
+    burst = 0
+
+  return rate, burst if burst >= 1 else max(1.0, rate)
+
+
+def retries():
+  """
+  Provides the number of times an operation may be retried, as configured by
+  the GIT_REMOTE_CODECOMMIT_RETRIES environment variable.
+
+  :returns: **int** with the retry budget, zero if retries are disabled
+  """
+
+  try:
+    return max(0, int(os.environ.get('GIT_REMOTE_CODECOMMIT_RETRIES', 0)))
+  except ValueError:
+    return 0
+
+
+def retryable(status, signed_at = None):
+  """
+  Checks if a request rejected with the given status might succeed if
+  retried.
+
+  :param int status: response status
+  :param float signed_at: when the request's url was signed
+
+  :returns: **True** if the request was throttled or its signature has likely
+    expired, **False** otherwise
+  """
+
+  if status in THROTTLED_STATUSES:
+    return True
+
+  return status == 403 and signed_at is not None and time.time() - signed_at >= SIGNATURE_AGE
+
+
+def backoff(attempt):
+  """
+  Provides how long to wait ahead of a retry. This is exponential with full
+  jitter, so clients that were throttled together don't retry together.
+
+  :param int attempt: retry number, starting with one
+
+  :returns: **float** with the seconds to wait
+  """
+
+  return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def acquire(key):
+  """
+  Takes a token from the bucket of the given profile and region, waiting until
+  one is available. Tokens are reserved in the order they're requested, so
+  waiting invocations proceed in turn.
+
+  :param str key: profile and region being limited
+
+  :returns: **float** with the seconds we waited
+  """
+
+  limit = rate_limit()
+
+  if not limit:
+    return 0.0
+
+  rate, burst = limit
+
+  try:
+    with _state(key) as state:
+      now = time.time()
+      tokens, updated = _number(state.get('tokens'), burst), _number(state.get('updated'), now)
+      tokens = min(burst, tokens + max(0.0, now - updated) * rate) - 1
+      wait = -tokens / rate if tokens < 0 else 0.0
+
+      state.update(tokens = tokens, updated = now)
+      _add(state, 'invocations', 1)
+
+      if wait:
+        _add(state, 'waits', 1)
+        _add(state, 'wait_seconds', wait)
+        state['max_wait'] = max(wait, _number(state.get('max_wait'), 0.0))
+  except (IOError, OSError):
+    return 0.0  # limiting is best effort
+
+  if wait:
+    time.sleep(wait)
+
+  return wait
+
+
+def record(key, **counts):
+  """
+  Adds to the statistics of a profile and region.
+
+  :param str key: profile and region the statistics are for
+  :param dict counts: amounts to add to each statistic
+  """
+
+  try:
+    with _state(key) as state:
+      for name, value in counts.items():
+        _add(state, name, value)
+  except (IOError, OSError):
+    pass
+
+
+def stats():
+  """
+  Provides the statistics we've accumulated.
+
+  :returns: **dict** mapping each profile and region to its statistics
+  """
+
+  directory = cache.cache_dir('throttle')
+  results = {}
+
+  try:
+    filenames = sorted(os.listdir(directory))
+  except OSError:
+    return results
+
+  for filename in filenames:
+    state = cache.read_json(os.path.join(directory, filename)) if filename.endswith('.json') else None
+
+    if isinstance(state, dict) and state.get('key'):
+      results[state['key']] = dict((name, value) for name, value in state.items() if name not in ('key', 'tokens', 'updated'))
+
+  return results
+
+
+def relay(command, url, retry, stdin = None, stdout = None, stderr = None):
+  """
+  Runs git's https transport, relaying git's commands to it. Should the
+  transport fail because CodeCommit throttled it we replay those commands to
+  another with a new signature.
+
+  :param func command: provides the transport's command for a signed url
+  :param str url: signed url to begin with
+  :param Retry retry: budget for our retries
+  :param file stdin: binary stream git writes commands to
+  :param file stdout: binary stream git reads responses from
+  :param file stderr: binary stream for the transport's errors
+
+  :returns: **int** exit code of the transport
+  """
+
+  session = _Relay(_binary(stdin or sys.stdin), _binary(stdout or sys.stdout), _binary(stderr or sys.stderr))
+
+  thread = threading.Thread(target = session.read_input, name = 'relay input')
+  thread.daemon = True
+  thread.start()
+
+  exit_code, status, held = session.run(command(url))
+
+  # git's transport can exit successfully after a failed request, in which case
+  # it's quit while git is still awaiting its response
+
+  while status is not None and (exit_code or not session.closed):
+    retry_url = retry(status, url)
+
+    if not retry_url:
+      break
+
+    url = retry_url
+    retry_code, status, retry_held = session.run(command(url))
+
+    if retry_code is None:
+      break  # its output differed from what git has read, so our original failure stands
+
+    exit_code, held = retry_code, retry_held
+
+  for line in held:
+    session.stderr.write(line)
+
+  session.stderr.flush()
+  return exit_code
+
+
+class _Relay(object):
+  """
+  Commands from git, and our responses, across each transport we run.
+  """
+
+  def __init__(self, stdin, stdout, stderr):
+    self.stdin = stdin
+    self.stdout = stdout
+    self.stderr = stderr
+    self.closed = False  # git has closed our input
+    self._lock = threading.Lock()
+    self._commands = []
+    self._answered = False  # we've responded since git's last command
+    self._transport = None
+    self._delivered = 0
+    self._digest = hashlib.sha256()
+
+  def read_input(self):
+    """
+    Records git's commands, and forwards them to our present transport.
+    """
+
+    while True:
+      data = _read(self.stdin)
+
+      with self._lock:
+        if data:
+          self._commands.append(data)
+          self._answered = False
+        else:
+          self.closed = True
+
+        self._forward([data] if data else [])
+
+      if not data:
+        return
+
+  def run(self, args):
+    """
+    Runs a transport, replaying git's commands to it. Any output we
+    previously provided git must be reproduced exactly, and only subsequent
+    output is relayed.
+
+    :param list args: transport's command
+
+    :returns: **tuple** of the form (exit code, status, held), where status
+      is the retryable response status the transport reported (if it failed
+      before responding to git's last command) and held are the error lines
+      that reported it. The exit code is **None** if the transport's output
+      differed from what git has read.
+    """
+
+    transport = subprocess.Popen(args, stdin = subprocess.PIPE, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+    errors = _Errors(transport.stderr, self.stderr)
+    errors.start()
+
+    def replay():
+      with self._lock:
+        self._transport = transport
+        self._forward(self._commands)
+
+    replay_thread = threading.Thread(target = replay, name = 'relay replay')
+    replay_thread.daemon = True
+    replay_thread.start()
+
+    expected, target = self._delivered, self._digest.digest()
+    replayed = hashlib.sha256()
+    diverged = False
+
+    while True:
+      data = _read(transport.stdout)
+
+      if not data:
+        break
+
+      if expected:
+        prefix, data = data[:expected], data[expected:]
+        replayed.update(prefix)
+        expected -= len(prefix)
+
+        if not expected and replayed.digest() != target:
+          diverged = True
+          break
+
+      if data:
+        with self._lock:
+          self._answered = True
+
+        self.stdout.write(data)
+        self.stdout.flush()
+        self._delivered += len(data)
+        self._digest.update(data)
+
+    if diverged or expected:
+      transport.kill()
+
+    exit_code = transport.wait()
+    errors.join()
+
+    if diverged or expected:
+      return None, None, []
+
+    # git has read part of a response, which we can't take back
+
+    return exit_code, None if self._answered else errors.status, errors.held
+
+  def _forward(self, chunks):
+    # our lock is held, and transports that exited are ignored
+
+    if self._transport is None:
+      return
+
+    try:
+      for chunk in chunks:
+        self._transport.stdin.write(chunk)
+
+      self._transport.stdin.flush()
+
+      if self.closed:
+        self._transport.stdin.close()
+    except (IOError, OSError, ValueError):
+      pass
+
+
+class _Errors(threading.Thread):
+  """
+  Relays a transport's stderr, holding back lines that report a retryable
+  response.
+
+  :var int status: retryable response status the transport reported
+  :var list held: lines we held back
+  """
+
+  def __init__(self, source, destination):
+    super(_Errors, self).__init__(name = 'relay errors')
+    self.daemon = True
+    self.status = None
+    self.held = []
+    self._source = source
+    self._destination = destination
+
+  def run(self):
+    pending = b''
+
+    while True:
+      data = _read(self._source)
+
+      if not data:
+        break
+
+      # progress is updated with carriage returns, so lines end with either
+
+      lines = (pending + data).splitlines(True)
+      pending = lines.pop() if not lines[-1].endswith((b'\r', b'\n')) else b''
+
+      for line in lines:
+        self._relay(line)
+
+    if pending:
+      self._relay(pending)
+
+  def _relay(self, line):
+    match = ERROR_PATTERN.search(line.decode('utf-8', 'replace'))
+
+    if match and (int(match.group(1)) in THROTTLED_STATUSES or int(match.group(1)) == 403):
+      self.status = int(match.group(1))
+      self.held.append(line)
+    else:
+      self._destination.write(line)
+      self._destination.flush()
+
+
+@contextlib.contextmanager
+def _state(key):
+  """
+  Holds the lock of a profile and region's state, providing it for
+  modification.
+  """
+
+  path = cache.cache_dir('throttle', hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+  if not os.path.isdir(os.path.dirname(path)):
+    os.makedirs(os.path.dirname(path), mode = 0o700, exist_ok = True)
+
+  with open(path[:-5] + '.lock', 'a') as lock_file:
+    if fcntl:
+      fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+    state = cache.read_json(path)
+    state = state if isinstance(state, dict) else {}
+    state['key'] = key
+
+    yield state
+    cache.write_json(path, state)
+
+
+def _add(state, name, value):
+  state[name] = _number(state.get(name), 0) + value
+
+
+def _number(value, default):
+  return value if isinstance(value, (int, float)) and not isinstance(value, bool) else default
+
+
+def _read(stream):
+  try:
+    return stream.read1(READ_SIZE) if hasattr(stream, 'read1') else stream.read(READ_SIZE)
+  except (IOError, OSError, ValueError):
+    return b''
+
+
+def _binary(stream):
+  return getattr(stream, 'buffer', stream)
+
+
+def main(args):
+  """
+  Reports the statistics of our rate limiting and retries.
+
+  :param list args: command line arguments
+
+  :returns: **int** exit code
+  """
+
+  parser = argparse.ArgumentParser(prog = 'git-remote-codecommit throttle', description = 'Reports how often invocations waited on our rate limit, or were throttled by CodeCommit, for each profile and region.')
+  parser.parse_args(args)
+
+  print(json.dumps(stats(), indent = 2, sort_keys = True))
+  return 0
@@ -0,0 +1,135 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Opt-in tracing of where each invocation of the hook spends its time. When the
+GIT_REMOTE_CODECOMMIT_TRACE environment variable names a file we append a
+JSON record to it for every invocation...
+
+::
+
+  {"timestamp": "2018-10-17T03:48:12Z", "pid": 1234, "remote": "origin",
+   "url": "codecommit://demo-profile@MyRepository",
+   "profile": "demo-profile", "repository": "MyRepository",
+   "region": "us-east-1", "source": "resolved", "transport": "remote-http",
+   "exit_code": 0, "phases": {"session": 0.081, "plugins": 0.002,
+   "regions": 0.001, "credentials": 0.012, "sign": 0.0001, "child": 1.52},
+   "total": 1.63}
+
+Phases are measured with a monotonic clock, in seconds, and phases we didn't
+reach are omitted. Tracing is disabled unless
+:func:`~git_remote_codecommit.trace.start` is called with that environment
+variable set, so other callers of our library (such as the agent) are
+unaffected.
+"""
+
+import contextlib
+import os
+import time
+
+_path = None
+_start = None
+_phases = {}
+_fields = {}
+
+
+def start(**fields):
+  """
+  Begins tracing this invocation if GIT_REMOTE_CODECOMMIT_TRACE is set.
+
+  :param dict fields: attributes to include in our record
+  """
+
+  global _path, _start
+
+  _path = os.environ.get('GIT_REMOTE_CODECOMMIT_TRACE') or None
+  _start = time.monotonic()
+  _phases.clear()
+  _fields.clear()
+  _fields.update(fields)
+
+
+def enabled():
+  """
+  Checks if we're tracing this invocation.
+
+  :returns: **True** if we're tracing, **False** otherwise
+  """
+
+  return _path is not None
+
+
+@contextlib.contextmanager
+def phase(name):
+  """
+  Times a phase of this invocation. Phases that run more than once are summed.
+
+  :param str name: phase being timed
+  """
+
+  if _path is None:
+    yield
+    return
+
+  phase_start = time.monotonic()
+
+  try:
+    yield
+  finally:
+    _phases[name] = _phases.get(name, 0.0) + time.monotonic() - phase_start
+
+
+def record(**fields):
+  """
+  Includes attributes in our record. Values that are **None** are ignored, so
+  callers can provide what they know without clobbering prior values.
+
+  :param dict fields: attributes to include
+  """
+
+  if _path is not None:
+    _fields.update((key, value) for key, value in fields.items() if value is not None)
+
+
+def finish():
+  """
+  Appends our record to the trace file. Tracing is best effort, so failures to
+  write are ignored rather than failing git.
+  """
+
+  global _path
+
+  if _path is None:
+    return
+
+  import json
+
+  path, _path = _path, None
+
+  entry = dict(_fields)
+  entry['timestamp'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+  entry['pid'] = os.getpid()
+  entry['phases'] = dict((name, round(duration, 6)) for name, duration in _phases.items())
+  entry['total'] = round(time.monotonic() - _start, 6)
+
+  try:
+    # a single append of the whole line so concurrent hooks don't interleave
+
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+
+    try:
+      os.write(fd, (json.dumps(entry, sort_keys = True) + '\n').encode('utf-8'))
+    finally:
+      os.close(fd)
+  except (IOError, OSError):
+    pass
@@ -0,0 +1,126 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import os
+import stat
+import sys
+import threading
+
+import botocore.credentials
+import pytest
+
+import git_remote_codecommit
+
+from git_remote_codecommit import Context, ProfileNotFound, agent
+from mock import Mock, patch
+
+CREDENTIALS = botocore.credentials.Credentials('access', 'secret')
+
+
+def mock_context(remote_url):
+  if 'missing' in remote_url:
+    raise ProfileNotFound('The following profile was not found: missing')
+
+  return Context(Mock(), remote_url.split('@')[-1], 'v1', 'us-east-1', CREDENTIALS)
+
+
+@pytest.fixture
+def running_agent(tmp_path):
+  socket_path = str(tmp_path / 'agent' / 'agent.sock')
+
+  with patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_AGENT_SOCKET': socket_path}):
+    with patch('git_remote_codecommit.Context.from_url', Mock(side_effect = mock_context)) as from_url_mock:
+      server = agent.Agent(socket_path)
+      thread = threading.Thread(target = server.serve_forever, kwargs = {'poll_interval': 0.05})
+      thread.start()
+
+      try:
+        yield from_url_mock
+      finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def test_agent_signs_urls(running_agent):
+  url = agent.git_url('codecommit://profile@test_repo')
+  assert url.startswith('https://access:')
+  assert url.endswith('@git-codecommit.us-east-1.amazonaws.com/v1/repos/test_repo')
+
+  # sessions are reused for other repositories with the same profile
+
+  url = agent.git_url('codecommit://profile@other_repo')
+  assert url.endswith('/v1/repos/other_repo')
+  assert 1 == running_agent.call_count
+
+  agent.git_url('codecommit://other_profile@test_repo')
+  assert 2 == running_agent.call_count
+
+
+def test_agent_relays_errors(running_agent):
+  with pytest.raises(ProfileNotFound) as exc:
+    agent.git_url('codecommit://missing@test_repo')
+
+  assert 'The following profile was not found: missing' == str(exc.value)
+
+
+def test_agent_requires_matching_configuration(running_agent):
+  response = agent.request(agent.socket_path(), {'remote_url': 'codecommit://profile@test_repo', 'fingerprint': 'someone_else'})
+  assert {'error': 'ConfigurationMismatch'} == response
+  assert 0 == running_agent.call_count
+
+
+def test_socket_permissions(running_agent):
+  socket_path = agent.socket_path()
+  assert stat.S_ISSOCK(os.stat(socket_path).st_mode)
+  assert 0o600 == stat.S_IMODE(os.stat(socket_path).st_mode)
+  assert 0o700 == stat.S_IMODE(os.stat(os.path.dirname(socket_path)).st_mode)
+
+
+def test_without_agent(tmp_path):
+  socket_path = str(tmp_path / 'agent.sock')
+
+  with patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_AGENT_SOCKET': socket_path}):
+    assert agent.git_url('codecommit://profile@test_repo') is None
+
+    # stale sockets from agents that have exited are ignored, and replaced
+
+    server = agent.Agent(socket_path)
+    server.socket.close()
+
+    assert agent.git_url('codecommit://profile@test_repo') is None
+    agent.Agent(socket_path).server_close()
+
+
+def test_agent_already_running(running_agent):
+  with pytest.raises(IOError):
+    agent.Agent(agent.socket_path())
+
+
+def test_main_uses_agent(running_agent):
+  with patch.object(sys, 'argv', ['git-remote-codecommit', 'origin', 'codecommit://profile@test_repo']):
+    with patch('subprocess.call', Mock(return_value = 0)) as call_mock:
+      with patch('sys.exit', Mock()):
+        git_remote_codecommit.main()
+
+  assert call_mock.call_args[0][0][3].endswith('/v1/repos/test_repo')
+
+
+@patch.object(sys, 'argv', ['git-remote-codecommit', 'agent', '--socket', '/nonexistent/dir/agent.sock', '--idle-timeout', '1'])
+def test_agent_command():
+  with patch('git_remote_codecommit.agent.main', Mock(return_value = 0)) as main_mock:
+    with pytest.raises(SystemExit) as exc:
+      git_remote_codecommit.main()
+
+  main_mock.assert_called_with(['--socket', '/nonexistent/dir/agent.sock', '--idle-timeout', '1'])
+  assert 0 == exc.value.code
@@ -0,0 +1,48 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import os
+
+import pytest
+
+from mock import patch
+
+
+# Environment variables that would let the user's own AWS identity leak into
+# our tests.
+
+AWS_ENV = ('AWS_PROFILE', 'AWS_DEFAULT_PROFILE', 'AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN', 'AWS_SECURITY_TOKEN')
+
+
+@pytest.fixture(autouse = True)
+def isolated_cache(tmp_path):
+  """
+  Keeps our tests from reading or writing the user's cache directory, or
+  resolving their AWS configuration and credentials.
+  """
+
+  home = tmp_path / 'home'
+  home.mkdir()
+
+  env = {
+      'GIT_REMOTE_CODECOMMIT_CACHE_DIR': str(tmp_path / 'cache'),
+      'AWS_CONFIG_FILE': str(home / '.aws' / 'config'),
+      'AWS_SHARED_CREDENTIALS_FILE': str(home / '.aws' / 'credentials'),
+      'HOME': str(home),
+  }
+
+  with patch.dict(os.environ, env):
+    for name in AWS_ENV:
+      os.environ.pop(name, None)
+
+    yield tmp_path / 'cache'
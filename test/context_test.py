@@ -17,7 +17,7 @@ import functools
 import pytest
 
 
-from git_remote_codecommit import Context, FormatError, ProfileNotFound, RegionNotFound, RegionNotAvailable, CredentialsNotFound
+from git_remote_codecommit import Context, FormatError, ProfileNotFound, RegionNotFound, RegionNotAvailable, CredentialsNotFound, parse_options
 from mock import Mock, patch
 
 
@@ -163,6 +163,46 @@ def test_with_malformed_url():
       Context.from_url(url)
 
 
+@mock_session(region = 'us-west-2', available_profiles = ['profile'])
+def test_with_options():
+  context = Context.from_url('codecommit://profile@test_repo?filter=blob:none&depth=50&protocol=2')
+  assert 'test_repo' == context.repository
+  assert {'filter': 'blob:none', 'depth': 50, 'protocol': 2} == context.options
+
+  assert None is Context.from_url('codecommit://profile@test_repo').options
+  assert {'depth': 1} == Context.from_url('ca-central-1://test_repo#depth=1').options
+
+
+def test_parse_options():
+  assert None is parse_options('codecommit://profile@test_repo')
+  assert None is parse_options('codecommit://profile@test_repo?')
+  assert {'filter': 'tree:0', 'protocol': 0} == parse_options('codecommit://test_repo?filter=tree:0#protocol=0')
+  assert {'filter': 'blob:limit=1m'} == parse_options('codecommit://test_repo?filter=blob%3Alimit%3D1m')
+  assert {'filter': 'combine:blob:none+tree:3'} == parse_options('codecommit://test_repo?filter=combine:blob:none+tree:3')
+  assert {'push-batch': 500} == parse_options('codecommit://test_repo?push-batch=500')
+
+
+def test_with_invalid_options():
+  invalid_options = {
+      'bogus=1': 'unrecognized option: bogus',
+      'depth': 'invalid depth: ',
+      'depth=0': 'invalid depth: 0',
+      'depth=-5': 'invalid depth: -5',
+      'depth=ten': 'invalid depth: ten',
+      'protocol=3': 'invalid protocol: 3',
+      'push-batch=0': 'invalid push-batch: 0',
+      'filter=blob:some': 'invalid filter: blob:some',
+      'filter=combine:blob:none+bogus': 'invalid filter: combine:blob:none+bogus',
+      'depth=1&depth=2': 'depth option more than once',
+  }
+
+  for query, message in invalid_options.items():
+    with pytest.raises(FormatError) as exc:
+      Context.from_url('codecommit://profile@test_repo?' + query)
+
+    assert message in str(exc.value)
+
+
 @mock_session(available_profiles = [])
 def test_with_nonexistant_profile():
   with pytest.raises(ProfileNotFound):
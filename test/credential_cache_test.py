@@ -0,0 +1,326 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import datetime
+import glob
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import botocore.session
+import pytest
+
+try:
+  from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+except ImportError:
+  ThreadingHTTPServer = None
+
+from git_remote_codecommit import Context, credential_cache
+from mock import patch
+
+# Credential process that counts its invocations, printing credentials that
+# expire the given number of seconds from now.
+
+PROCESS = """
+import datetime, json, sys
+
+with open(sys.argv[1], 'a') as counter:
+  counter.write('.')
+
+credentials = {'Version': 1, 'AccessKeyId': 'PROCESSACCESSKEY', 'SecretAccessKey': 'secret', 'SessionToken': 'token'}
+
+if sys.argv[2] != 'never':
+  expiration = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds = int(sys.argv[2]))
+  credentials['Expiration'] = expiration.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+print(json.dumps(credentials))
+"""
+
+CONFIG = """
+[profile process]
+region = us-east-1
+credential_process = {python} {script} {counter} {lifetime}
+
+[profile sso]
+region = us-east-1
+sso_session = my-sso
+sso_account_id = 123456789012
+sso_role_name = demo
+
+[sso-session my-sso]
+sso_start_url = https://example.awsapps.com/start
+sso_region = us-east-1
+"""
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ROLE_CONFIG = """
+[profile source]
+region = us-east-1
+
+[profile role]
+region = us-east-1
+role_arn = arn:aws:iam::123456789012:role/demo
+source_profile = source
+"""
+
+ROLE_CREDENTIALS = """
+[source]
+aws_access_key_id = SOURCEACCESSKEY
+aws_secret_access_key = source-secret
+"""
+
+ASSUME_ROLE_RESPONSE = """<AssumeRoleResponse xmlns="https://sts.amazonaws.com/doc/2011-06-15/">
+  <AssumeRoleResult>
+    <Credentials>
+      <AccessKeyId>ROLEACCESSKEY</AccessKeyId>
+      <SecretAccessKey>role-secret</SecretAccessKey>
+      <SessionToken>role-token</SessionToken>
+      <Expiration>{expiration}</Expiration>
+    </Credentials>
+    <AssumedRoleUser>
+      <AssumedRoleId>AROAEXAMPLE:session</AssumedRoleId>
+      <Arn>arn:aws:sts::123456789012:assumed-role/demo/session</Arn>
+    </AssumedRoleUser>
+  </AssumeRoleResult>
+  <ResponseMetadata>
+    <RequestId>c6104cbe-af31-11e0-8154-cbc7ccf896c7</RequestId>
+  </ResponseMetadata>
+</AssumeRoleResponse>"""
+
+# Resolves a role's credentials, as each git invocation does.
+
+RESOLVE = """
+from git_remote_codecommit import Context
+print(Context.from_url('codecommit://role@test_repo').credentials.get_frozen_credentials().access_key)
+"""
+
+
+class FakeSTS(object):
+  """
+  STS endpoint that slowly assumes roles, counting its requests.
+  """
+
+  def __init__(self):
+    self.requests = 0
+    sts = self
+
+    class Handler(BaseHTTPRequestHandler):
+      def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        sts.requests += 1
+        time.sleep(0.5)
+
+        expiration = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours = 1)
+        body = ASSUME_ROLE_RESPONSE.format(expiration = expiration.strftime('%Y-%m-%dT%H:%M:%SZ')).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, *args):
+        pass
+
+    self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    self.url = 'http://127.0.0.1:%i' % self._server.server_address[1]
+
+  def __enter__(self):
+    threading.Thread(target = self._server.serve_forever, daemon = True).start()
+    return self
+
+  def __exit__(self, *args):
+    self._server.shutdown()
+    self._server.server_close()
+
+
+@pytest.fixture
+def aws_config(tmp_path):
+  (tmp_path / 'process.py').write_text(PROCESS)
+
+  def configure(lifetime = 3600):
+    (tmp_path / 'config').write_text(CONFIG.format(python = sys.executable, script = tmp_path / 'process.py', counter = tmp_path / 'counter', lifetime = lifetime))
+
+  configure()
+
+  with patch.dict(os.environ, {'AWS_CONFIG_FILE': str(tmp_path / 'config'), 'AWS_SHARED_CREDENTIALS_FILE': str(tmp_path / 'credentials')}):
+    yield configure
+
+
+def process_runs(tmp_path):
+  try:
+    return len((tmp_path / 'counter').read_text())
+  except IOError:
+    return 0
+
+
+def resolve(remote_url = 'codecommit://process@test_repo'):
+  credentials = Context.from_url(remote_url).credentials
+  return credentials.get_frozen_credentials()
+
+
+def test_caches_process_credentials(aws_config, tmp_path):
+  for _ in range(3):
+    assert 'PROCESSACCESSKEY' == resolve().access_key
+
+  assert 1 == process_runs(tmp_path)
+
+
+def test_configuration_changes_invalidate(aws_config, tmp_path):
+  resolve()
+  aws_config(lifetime = 7200)
+  resolve()
+  assert 2 == process_runs(tmp_path)
+
+  # environment variables that feed into a profile's identity also apply
+
+  with patch.dict(os.environ, {'AWS_ROLE_SESSION_NAME': 'other'}):
+    resolve()
+
+  assert 3 == process_runs(tmp_path)
+
+
+def test_expiring_credentials_are_refreshed(aws_config, tmp_path):
+  aws_config(lifetime = 800)  # within botocore's refresh window
+  resolve()
+  runs = process_runs(tmp_path)
+  resolve()
+  assert runs < process_runs(tmp_path)
+
+  aws_config(lifetime = 'never')
+  runs = process_runs(tmp_path)
+  resolve()
+  resolve()
+  assert runs + 2 == process_runs(tmp_path)
+
+
+def test_unreadable_entries_are_absent(isolated_cache):
+  cache = credential_cache.ProviderCache('sso', lambda: ['sso', {}, None])
+  assert 'key' not in cache
+
+  expiration = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours = 1)
+  cache['key'] = {'Credentials': {'AccessKeyId': 'access', 'Expiration': expiration.isoformat()}}
+  assert 'key' in cache
+  assert 'access' == cache['key']['Credentials']['AccessKeyId']
+
+  path = cache._convert_cache_key('key')
+
+  for content in ('{"Credentials": ', '[]', '{"Credentials": {"AccessKeyId": "access"}}', '{"Credentials": {"Expiration": "2001-01-01T00:00:00Z"}}'):
+    with open(path, 'w') as cache_file:
+      cache_file.write(content)
+
+    assert 'key' not in cache
+
+  # entries of other configurations are unaffected by ours
+
+  other_cache = credential_cache.ProviderCache('sso', lambda: ['sso', {'sso_role_name': 'other'}, None])
+  assert 'key' not in other_cache
+
+  # expired entries are evicted as others are written
+
+  other_cache['key'] = {'Credentials': {'Expiration': expiration.isoformat()}}
+  assert not os.path.exists(path)
+
+
+def test_installs_caches(aws_config):
+  session = botocore.session.Session(profile = 'sso')
+  credential_cache.install(session)
+  resolver = session.get_component('credential_provider')
+
+  for method in ('sso', 'assume-role-with-web-identity'):
+    assert isinstance(resolver.get_provider(method).cache, credential_cache.ProviderCache)
+
+  assert isinstance(resolver.get_provider('custom-process'), credential_cache.CachingProcessProvider)
+  assert 1 == len([provider for provider in resolver.providers if provider.METHOD == 'custom-process'])
+
+  # keyed on the profile's sso-session as well
+
+  cache_key = resolver.get_provider('sso').cache._convert_cache_key('key')
+
+  with open(os.environ['AWS_CONFIG_FILE'], 'a') as config_file:
+    config_file.write('registration_scopes = sso:account:access\n')
+
+  session = botocore.session.Session(profile = 'sso')
+  credential_cache.install(session)
+  assert cache_key != session.get_component('credential_provider').get_provider('sso').cache._convert_cache_key('key')
+
+
+def test_waits_on_refresh_in_progress(isolated_cache):
+  cache = credential_cache.ProviderCache('sso', lambda: ['sso', {}, None])
+  waiter = credential_cache.ProviderCache('sso', lambda: ['sso', {}, None])
+  expiration = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours = 1)
+
+  locked = threading.Event()
+
+  def refresh():
+    assert 'key' not in cache  # we now hold the lock to refresh this entry
+    locked.set()
+    time.sleep(0.3)
+    cache['key'] = {'Credentials': {'Expiration': expiration.isoformat()}}
+
+  thread = threading.Thread(target = refresh)
+  thread.start()
+  assert locked.wait(5)
+
+  start = time.time()
+  assert 'key' in waiter
+  assert time.time() - start >= 0.2
+  thread.join()
+
+  # others proceed on their own should a refresh stall
+
+  assert 'other_key' not in cache
+
+  with patch('git_remote_codecommit.credential_cache.LOCK_TIMEOUT', 0.2):
+    assert 'other_key' not in waiter
+
+  cache.release()
+  waiter.release()
+
+
+@pytest.mark.skipif(ThreadingHTTPServer is None, reason = 'requires python 3.7')
+def test_single_flight_refresh(tmp_path):
+  (tmp_path / 'config').write_text(ROLE_CONFIG)
+  (tmp_path / 'credentials').write_text(ROLE_CREDENTIALS)
+
+  with FakeSTS() as sts:
+    env = dict(
+        os.environ,
+        HOME = str(tmp_path),
+        PYTHONPATH = PROJECT_ROOT,
+        AWS_CONFIG_FILE = str(tmp_path / 'config'),
+        AWS_SHARED_CREDENTIALS_FILE = str(tmp_path / 'credentials'),
+        AWS_ENDPOINT_URL_STS = sts.url,
+        AWS_EC2_METADATA_DISABLED = 'true',
+    )
+
+    def run_helpers(count):
+      helpers = [subprocess.Popen([sys.executable, '-c', RESOLVE], env = env, stdout = subprocess.PIPE, universal_newlines = True) for _ in range(count)]
+      return [helper.communicate()[0].strip() for helper in helpers]
+
+    assert ['ROLEACCESSKEY'] * 12 == run_helpers(12)
+    assert 1 == sts.requests
+
+    # corrupted entries are refreshed once as well
+
+    cache_paths = glob.glob(str(tmp_path / '.aws' / 'boto' / 'cache' / '*.json'))
+    assert 1 == len(cache_paths)
+
+    with open(cache_paths[0], 'w') as cache_file:
+      cache_file.write('{"Credentials": {"AccessKeyId": ')
+
+    assert ['ROLEACCESSKEY'] * 6 == run_helpers(6)
+    assert 2 == sts.requests
@@ -0,0 +1,114 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import io
+import os
+
+import pytest
+
+import git_remote_codecommit
+
+from git_remote_codecommit import FormatError, credential
+from mock import patch
+
+REQUEST = 'protocol=https\nhost=git-codecommit.us-east-1.amazonaws.com\npath=v1/repos/test_repo\n\n'
+
+
+@pytest.fixture
+def aws_env(tmp_path):
+  env = {
+      'AWS_ACCESS_KEY_ID': 'AKIDEXAMPLE',
+      'AWS_SECRET_ACCESS_KEY': 'secret',
+      'AWS_SESSION_TOKEN': 'session/token',
+      'AWS_CONFIG_FILE': str(tmp_path / 'config'),
+      'AWS_SHARED_CREDENTIALS_FILE': str(tmp_path / 'credentials'),
+      'GIT_REMOTE_CODECOMMIT_URL_CACHE': '',
+  }
+
+  with patch.dict(os.environ, env):
+    yield
+
+
+def run(operation, request = REQUEST, *args):
+  with patch('sys.stdin', io.StringIO(request)), patch('sys.stdout', io.StringIO()) as stdout, patch('sys.stderr', io.StringIO()) as stderr:
+    exit_code = credential.main(list(args) + [operation])
+
+  return exit_code, stdout.getvalue(), stderr.getvalue()
+
+
+def test_read_attributes():
+  assert {'protocol': 'https', 'host': 'example.com', 'path': 'a=b'} == credential.read_attributes(io.StringIO('protocol=https\nhost=example.com\npath=a=b\n\nignored=1\n'))
+  assert {} == credential.read_attributes(io.StringIO(''))
+
+
+def test_remote_url():
+  assert 'us-east-1://test_repo' == credential.remote_url({'protocol': 'https', 'host': 'git-codecommit.us-east-1.amazonaws.com', 'path': 'v1/repos/test_repo'})
+  assert 'cn-north-1://profile@test_repo' == credential.remote_url({'protocol': 'https', 'host': 'git-codecommit.cn-north-1.amazonaws.com.cn', 'path': 'v1/repos/test_repo/'}, 'profile')
+
+  # requests for others are left to their own helpers
+
+  assert credential.remote_url({'protocol': 'https', 'host': 'github.com', 'path': 'v1/repos/test_repo'}) is None
+  assert credential.remote_url({'protocol': 'http', 'host': 'git-codecommit.us-east-1.amazonaws.com', 'path': 'v1/repos/test_repo'}) is None
+  assert credential.remote_url({'protocol': 'https', 'host': 'git-codecommit.us-east-1.example.com', 'path': 'v1/repos/test_repo'}) is None
+
+  with pytest.raises(FormatError) as exc:
+    credential.remote_url({'protocol': 'https', 'host': 'git-codecommit.us-east-1.amazonaws.com'})
+
+  assert 'credential.https://git-codecommit.us-east-1.amazonaws.com.useHttpPath true' in str(exc.value)
+
+
+def test_get(aws_env):
+  with patch('git_remote_codecommit.git_url', wraps = git_remote_codecommit.git_url) as git_url_mock:
+    exit_code, stdout, stderr = run('get')
+    assert (0, '') == (exit_code, stderr)
+
+    username, password = stdout.splitlines()
+    assert 'username=AKIDEXAMPLE%session/token' == username
+    assert password.startswith('password=')
+
+    # signatures are reused until they near expiry
+
+    assert (0, stdout, '') == run('get')
+    assert 1 == git_url_mock.call_count
+
+    # ... or are rejected
+
+    assert (0, '', '') == run('erase')
+    assert stdout.splitlines()[0] == run('get')[1].splitlines()[0]
+    assert 2 == git_url_mock.call_count
+
+
+def test_get_with_unwritable_cache(aws_env):
+  with patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_CACHE_DIR': os.path.join(os.devnull, 'cache')}):
+    exit_code, stdout, stderr = run('get')
+    assert (0, '') == (exit_code, stderr)
+    assert stdout.startswith('username=AKIDEXAMPLE%session/token\npassword=')
+
+    assert (0, '', '') == run('erase')
+
+
+def test_get_with_profile(aws_env, tmp_path):
+  (tmp_path / 'credentials').write_text(u'[demo]\naws_access_key_id = DEMOACCESSKEY\naws_secret_access_key = demo-secret\n')
+
+  exit_code, stdout, stderr = run('get', REQUEST, '--profile', 'demo')
+  assert (0, '') == (exit_code, stderr)
+  assert stdout.startswith('username=DEMOACCESSKEY\n')
+
+
+def test_other_requests(aws_env):
+  assert (0, '', '') == run('get', 'protocol=https\nhost=github.com\npath=org/repo.git\n\n')
+  assert (0, '', '') == run('store', REQUEST + 'username=AKIDEXAMPLE\npassword=signature\n')
+
+  exit_code, stdout, stderr = run('get', 'protocol=https\nhost=git-codecommit.us-east-1.amazonaws.com\n\n')
+  assert (1, '') == (exit_code, stdout)
+  assert 'useHttpPath' in stderr
@@ -0,0 +1,158 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import os
+import socket
+import stat
+import sys
+
+import pytest
+
+import git_server
+
+from git_remote_codecommit import endpoints
+from git_remote_codecommit.endpoints import Endpoint
+from mock import patch
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Our console script, for git to invoke for 'codecommit::' remotes.
+
+HELPER = """#!{python}
+import sys
+sys.path.insert(0, {root!r})
+import git_remote_codecommit
+git_remote_codecommit.main()
+"""
+
+
+@pytest.fixture
+def certificate(tmp_path):
+  certificate = git_server.create_certificate(str(tmp_path))
+
+  if not certificate or not git_server.available():
+    pytest.skip('requires openssl and git http-backend')
+
+  return certificate
+
+
+@pytest.fixture
+def servers(tmp_path, certificate):
+  """
+  Slow primary and fast replica, serving the same repositories.
+  """
+
+  git_server.create_repository(str(tmp_path), 'test_repo', commits = 2)
+
+  with git_server.GitServer(str(tmp_path), certificate = certificate, connect_latency = 0.3) as primary:
+    with git_server.GitServer(str(tmp_path), certificate = certificate) as replica:
+      with patch.dict(os.environ, {'CODE_COMMIT_ENDPOINT': primary.hostname, 'GIT_REMOTE_CODECOMMIT_READ_ENDPOINTS': replica.hostname}):
+        yield primary, replica
+
+
+def unused_port():
+  with socket.socket() as sock:
+    sock.bind(('127.0.0.1', 0))
+    return sock.getsockname()[1]
+
+
+@patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_READ_ENDPOINTS': ' us-west-2, vpce-1.git-codecommit.us-east-1.vpce.amazonaws.com,zz-nowhere-1,us-east-1,'})
+def test_candidates():
+  os.environ.pop('CODE_COMMIT_ENDPOINT', None)
+  assert endpoints.configured()
+
+  assert [
+      Endpoint('git-codecommit.us-east-1.amazonaws.com', 'us-east-1'),
+      Endpoint('git-codecommit.us-west-2.amazonaws.com', 'us-west-2'),
+      Endpoint('vpce-1.git-codecommit.us-east-1.vpce.amazonaws.com', 'us-east-1'),
+  ] == endpoints.candidates('us-east-1')
+
+
+def test_not_configured():
+  os.environ.pop('GIT_REMOTE_CODECOMMIT_READ_ENDPOINTS', None)
+  assert not endpoints.configured()
+
+  with patch('git_remote_codecommit.endpoints.measure') as measure_mock:
+    assert endpoints.primary('us-east-1') == endpoints.read_endpoint('us-east-1')
+
+  assert not measure_mock.called
+
+
+def test_selects_fastest(servers):
+  primary, replica = servers
+  assert Endpoint(replica.hostname, 'us-east-1') == endpoints.read_endpoint('us-east-1')
+
+  # measurements are cached until they expire
+
+  with patch('git_remote_codecommit.endpoints.measure') as measure_mock:
+    assert Endpoint(replica.hostname, 'us-east-1') == endpoints.read_endpoint('us-east-1')
+
+  assert not measure_mock.called
+  assert 0o600 == stat.S_IMODE(os.stat(endpoints.cache.cache_dir('endpoints.json')).st_mode)
+
+  with patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_ENDPOINT_TTL': '0'}):
+    with patch('git_remote_codecommit.endpoints.measure', side_effect = lambda hostname: 0.1 if hostname == primary.hostname else None) as measure_mock:
+      assert Endpoint(primary.hostname, 'us-east-1') == endpoints.read_endpoint('us-east-1')
+
+    assert 2 == measure_mock.call_count
+
+
+def test_unhealthy_endpoints(servers):
+  primary, replica = servers
+  endpoints.mark_unhealthy(replica.hostname)
+  assert Endpoint(primary.hostname, 'us-east-1') == endpoints.read_endpoint('us-east-1')
+
+  # nothing healthy falls back to our primary
+
+  with patch.dict(os.environ, {'CODE_COMMIT_ENDPOINT': '127.0.0.1:{}'.format(unused_port())}):
+    assert endpoints.primary('us-east-1') == endpoints.read_endpoint('us-east-1')
+
+
+def test_measure(servers):
+  primary, replica = servers
+
+  assert endpoints.measure(primary.hostname) >= 0.3
+  assert endpoints.measure(replica.hostname) < 0.3
+  assert endpoints.measure('127.0.0.1:{}'.format(unused_port())) is None
+
+
+def test_reads_from_fastest_endpoint(servers, tmp_path):
+  primary, replica = servers
+
+  bin_dir = tmp_path / 'bin'
+  bin_dir.mkdir()
+  helper_path = bin_dir / 'git-remote-codecommit'
+  helper_path.write_text(HELPER.format(python = sys.executable, root = PROJECT_ROOT))
+  helper_path.chmod(helper_path.stat().st_mode | stat.S_IEXEC)
+
+  (tmp_path / 'config').write_text('[profile demo]\nregion = us-east-1\n')
+  (tmp_path / 'credentials').write_text('[demo]\naws_access_key_id = access\naws_secret_access_key = secret\n')
+
+  env = {
+      'PATH': str(bin_dir) + os.pathsep + os.environ['PATH'],
+      'AWS_CONFIG_FILE': str(tmp_path / 'config'),
+      'AWS_SHARED_CREDENTIALS_FILE': str(tmp_path / 'credentials'),
+      'GIT_REMOTE_CODECOMMIT_NATIVE': 'true',
+      'GIT_SSL_NO_VERIFY': '1',
+  }
+
+  clone_path = str(tmp_path / 'clone')
+  git_server.git('clone', '-q', 'codecommit://demo@test_repo', clone_path, env = env)
+  git_server.git('-C', clone_path, 'commit', '-q', '--allow-empty', '-m', 'pushed commit', env = env)
+  git_server.git('-C', clone_path, 'push', '-q', 'origin', 'main', env = env)
+
+  assert any(path.endswith('/git-upload-pack') for _, path, _, _ in replica.requests)
+  assert not any(path.endswith('/git-receive-pack') for _, path, _, _ in replica.requests)
+  assert any(path.endswith('/git-receive-pack') for _, path, _, _ in primary.requests)
+  assert not any(path.endswith('/git-upload-pack') for _, path, _, _ in primary.requests)
+  assert 'pushed commit' == git_server.git('--git-dir', str(tmp_path / 'test_repo'), 'log', '-1', '--format=%s', 'main')
@@ -0,0 +1,288 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Local stand-in for CodeCommit's smart-HTTP endpoint, serving repositories
+through 'git http-backend' at the same /v1/repos/<repository> paths.
+"""
+
+import itertools
+import os
+import shutil
+import ssl
+import subprocess
+import threading
+import time
+
+try:
+  from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+except ImportError:
+  ThreadingHTTPServer = None
+
+GIT_ENV = {
+    'GIT_AUTHOR_NAME': 'Test Author',
+    'GIT_AUTHOR_EMAIL': 'author@example.com',
+    'GIT_COMMITTER_NAME': 'Test Committer',
+    'GIT_COMMITTER_EMAIL': 'committer@example.com',
+    'GIT_CONFIG_NOSYSTEM': '1',
+}
+
+
+def available():
+  """
+  Checks if git and its http-backend are available to serve repositories.
+  """
+
+  if ThreadingHTTPServer is None or not shutil.which('git'):
+    return False
+
+  exec_path = subprocess.check_output(['git', '--exec-path'], universal_newlines = True).strip()
+  return os.path.exists(os.path.join(exec_path, 'git-http-backend'))
+
+
+def git(*args, **kwargs):
+  """
+  Runs a git command, providing its stdout.
+  """
+
+  env = dict(os.environ, **GIT_ENV)
+  env.update(kwargs.pop('env', {}))
+  return subprocess.check_output(('git',) + args, env = env, universal_newlines = True, **kwargs).strip()
+
+
+def create_certificate(directory):
+  """
+  Creates a self-signed certificate for 127.0.0.1 with openssl.
+
+  :returns: **tuple** of the form (certificate path, key path), or **None** if
+    openssl is unavailable
+  """
+
+  if not shutil.which('openssl'):
+    return None
+
+  certificate, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+
+  try:
+    subprocess.check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=127.0.0.1', '-keyout', key, '-out', certificate], stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+  return certificate, key
+
+
+def create_repository(root, name, commits = 1):
+  """
+  Creates a bare repository with a main branch of the given number of commits.
+
+  :returns: **str** with the path of the repository
+  """
+
+  path = os.path.join(root, name)
+  work = path + '-work'
+  git('init', '-q', '--bare', '--initial-branch=main', path)
+  git('init', '-q', '--initial-branch=main', work)
+
+  for i in range(commits):
+    with open(os.path.join(work, 'file.txt'), 'a') as content:
+      content.write('line %i\n' % i)
+
+    git('-C', work, 'add', 'file.txt')
+    git('-C', work, 'commit', '-q', '-m', 'commit %i' % i)
+
+  if commits:
+    git('-C', work, 'push', '-q', path, 'main')
+
+  shutil.rmtree(work)
+  return path
+
+
+class GitServer(object):
+  """
+  Threaded HTTP server for the repositories within a directory.
+
+  :var str root: directory with bare repositories
+  :var int port: port we're listening on
+  :var list requests: (method, path, authorization, connection number) tuples
+    of the requests we've received
+  :var int sent: bytes of response content we've sent
+  :var int received: bytes of request content we've received
+  :var func authorize: callback that's provided each request handler, and
+    returns if it may proceed (or the status to reject it with). Requests
+    without credentials are challenged for them, as CodeCommit does.
+  :var float latency: seconds to delay each response by
+  :var float connect_latency: seconds to delay each connection by, ahead of
+    its TLS handshake
+  """
+
+  def __init__(self, root, latency = 0, certificate = None, connect_latency = 0):
+    self.root = root
+    self.latency = latency
+    self.connect_latency = connect_latency
+    self.requests = []
+    self.sent = 0
+    self.received = 0
+    self.authorize = None
+    self._connections = itertools.count()
+    self._server = _Server(('127.0.0.1', 0), _handler(self))
+    self._server.daemon_threads = True
+    self._server.owner = self
+    self._server.ssl_context = None
+    self.port = self._server.server_address[1]
+    self.scheme = 'https' if certificate else 'http'
+
+    if certificate:
+      self._server.ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+      self._server.ssl_context.load_cert_chain(*certificate)
+
+  @property
+  def hostname(self):
+    return '127.0.0.1:{}'.format(self.port)
+
+  def url(self, repository, username = 'access', password = 'secret'):
+    return '{}://{}:{}@127.0.0.1:{}/v1/repos/{}'.format(self.scheme, username, password, self.port, repository)
+
+  def __enter__(self):
+    thread = threading.Thread(target = self._server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return self
+
+  def __exit__(self, exit_type, value, traceback):
+    self._server.shutdown()
+    self._server.server_close()
+
+
+if ThreadingHTTPServer:
+  class _Server(ThreadingHTTPServer):
+    request_queue_size = 128  # many concurrent clients shouldn't be dropped
+
+    def get_request(self):
+      connection, address = self.socket.accept()
+
+      if self.owner.connect_latency:
+        time.sleep(self.owner.connect_latency)
+
+      if self.ssl_context:
+        connection.settimeout(5)
+        connection = self.ssl_context.wrap_socket(connection, server_side = True)
+        connection.settimeout(None)
+
+      return connection, address
+
+
+def _handler(server):
+  class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+      BaseHTTPRequestHandler.setup(self)
+      self.connection_number = next(server._connections)
+
+    def log_message(self, *args):
+      pass
+
+    def do_GET(self):
+      self._backend()
+
+    def do_POST(self):
+      self._backend()
+
+    def _backend(self):
+      path, _, query = self.path.partition('?')
+      server.requests.append((self.command, path, self.headers.get('Authorization'), self.connection_number))
+
+      if self.headers.get('Transfer-Encoding') == 'chunked':
+        body = self._read_chunked()
+      else:
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+      server.received += len(body)
+
+      if server.authorize and not self.headers.get('Authorization'):
+        self.send_response(401)
+        self.send_header('WWW-Authenticate', 'Basic realm="CodeCommit"')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        return
+
+      verdict = server.authorize(self) if server.authorize else True
+
+      if verdict is not True:
+        self.send_response(verdict or 403)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        return
+
+      if server.latency:
+        time.sleep(server.latency)
+
+      if not path.startswith('/v1/repos/'):
+        self.send_response(404)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        return
+
+      env = dict(os.environ, **GIT_ENV)
+      env.update({
+          'GIT_PROJECT_ROOT': server.root,
+          'GIT_HTTP_EXPORT_ALL': '1',
+          'GIT_CONFIG_COUNT': '1',
+          'GIT_CONFIG_KEY_0': 'http.receivepack',
+          'GIT_CONFIG_VALUE_0': 'true',
+          'REQUEST_METHOD': self.command,
+          'PATH_INFO': path[len('/v1/repos'):],
+          'QUERY_STRING': query,
+          'CONTENT_TYPE': self.headers.get('Content-Type', ''),
+          'CONTENT_LENGTH': str(len(body)),
+          'REMOTE_ADDR': '127.0.0.1',
+      })
+
+      if self.headers.get('Git-Protocol'):
+        env['GIT_PROTOCOL'] = self.headers['Git-Protocol']
+
+      output = subprocess.run(['git', 'http-backend'], input = body, stdout = subprocess.PIPE, env = env).stdout
+      headers, _, content = output.partition(b'\r\n\r\n')
+      status = 200
+
+      for header in headers.decode('utf-8').split('\r\n'):
+        if header.startswith('Status:'):
+          status = int(header.split()[1])
+
+      self.send_response(status)
+
+      for header in headers.decode('utf-8').split('\r\n'):
+        name, _, value = header.partition(':')
+
+        if name and name != 'Status':
+          self.send_header(name, value.strip())
+
+      self.send_header('Content-Length', str(len(content)))
+      self.end_headers()
+      self.wfile.write(content)
+      server.sent += len(content)
+
+    def _read_chunked(self):
+      chunks = []
+
+      while True:
+        size = int(self.rfile.readline().strip(), 16)
+
+        if not size:
+          self.rfile.readline()
+          return b''.join(chunks)
+
+        chunks.append(self.rfile.read(size))
+        self.rfile.readline()
+
+  return Handler
@@ -15,7 +15,7 @@ import botocore.credentials
 import datetime
 import os
 
-from git_remote_codecommit import git_url, sign
+from git_remote_codecommit import git_url, git_urls, sign, sign_many
 from mock import Mock, patch
 
 REGION = 'us-west-2'
@@ -52,3 +52,24 @@ def test_git_url_with_token(dt_mock):
 def test_sign(dt_mock):
   dt_mock.utcnow = Mock(return_value = TIMESTAMP)
   assert EXPECTED_SIG == sign('git-codecommit.us-west-2.amazonaws.com', '/v1/repos/test_repo', REGION, CREDENTIAL)
+
+
+@patch('git_remote_codecommit.datetime.datetime', create = True)
+def test_git_urls(dt_mock):
+  dt_mock.utcnow = Mock(return_value = TIMESTAMP)
+  urls = git_urls(['test_repo', 'other_repo'], 'v1', REGION, CREDENTIAL_WITH_TOKEN)
+
+  assert EXPECTED_URL_WITH_TOKEN == urls[0]
+  assert urls[1].startswith('https://access%25token:20171224T115320Z')
+  assert urls[1].endswith('@git-codecommit.us-west-2.amazonaws.com/v1/repos/other_repo')
+  assert 1 == dt_mock.utcnow.call_count  # signed under one timestamp
+
+
+@patch('git_remote_codecommit.datetime.datetime', create = True)
+def test_sign_many(dt_mock):
+  dt_mock.utcnow = Mock(return_value = TIMESTAMP)
+  signatures = sign_many('git-codecommit.us-west-2.amazonaws.com', ['/v1/repos/test_repo', '/v1/repos/other_repo'], REGION, CREDENTIAL)
+
+  assert EXPECTED_SIG == signatures[0]
+  assert EXPECTED_SIG != signatures[1]
+  assert [] == sign_many('git-codecommit.us-west-2.amazonaws.com', [], REGION, CREDENTIAL)
@@ -16,7 +16,7 @@ import sys
 
 import git_remote_codecommit
 
-from mock import Mock, patch
+from mock import ANY, Mock, patch
 
 try:
   from StringIO import StringIO
@@ -24,6 +24,16 @@ except ImportError:
   from io import StringIO
 
 
+@pytest.fixture(autouse = True)
+def no_exec():
+  """
+  Keeps the static fast path from replacing our test process with git.
+  """
+
+  with patch('os.execvp', Mock(side_effect = AssertionError('git-remote-codecommit replaced itself with git'))) as execvp_mock:
+    yield execvp_mock
+
+
 @patch('sys.stdout', new_callable = StringIO)
 @patch('sys.stderr', new_callable = StringIO)
 @patch('subprocess.call')
@@ -60,6 +70,27 @@ def test_main_with_too_few_arguments():
   assert_main(stderr = 'Too few arguments. This hook requires the git command and remote.\n')
 
 
+@patch('git_remote_codecommit.Context.from_url', Mock())
+@patch('git_remote_codecommit.git_url', Mock(return_value = 'https://test_url@codecommit/v1/repos/test_repo'))
+def test_main_with_subcommands():
+  for args in (['codecommit::us-east-1://demo@foo'], ['--', 'codecommit://demo@foo'], ['--', 'us-east-1://demo@foo'], ['--jobs', '2'], ['codecommit::us-east-1://demo@foo', 'us-east-1://demo@bar'], []):
+    with patch.object(sys, 'argv', ['git-remote-codecommit', 'mirror'] + args):
+      with patch('git_remote_codecommit.mirror.main', Mock(return_value = 0)) as mirror_mock:
+        assert_main()
+
+    mirror_mock.assert_called_once_with(args)
+
+  # git invokes us with a remote that can share a subcommand's name, and its
+  # url without our prefix, so a single such url is taken as git's
+
+  for url in ('us-east-1://demo@foo', 'codecommit://demo@foo'):
+    with patch.object(sys, 'argv', ['git-remote-codecommit', 'mirror', url]):
+      with patch('git_remote_codecommit.mirror.main', Mock(return_value = 0)) as mirror_mock:
+        assert_main(git_call = 'git remote-http mirror https://test_url@codecommit/v1/repos/test_repo')
+
+    assert not mirror_mock.called
+
+
 @patch.object(sys, 'argv', ['git-remote-codecommit', 'arg1', 'arg2', 'arg3'])
 def test_main_with_too_many_arguments():
   assert_main(stderr = "Too many arguments. Hook only accepts the git command and remote, but argv was: 'git-remote-codecommit', 'arg1', 'arg2', 'arg3'\n")
@@ -85,3 +116,101 @@ def test_main_with_exceptions():
   with patch('git_remote_codecommit.Context.from_url', Mock(side_effect = IOError('boom'))):
     with pytest.raises(IOError):
       assert_main()
+
+
+@patch.dict('os.environ', {'GIT_REMOTE_CODECOMMIT_NATIVE': '1'})
+@patch('git_remote_codecommit.Context.from_url', Mock())
+@patch('git_remote_codecommit.git_url', Mock(return_value = 'https://test_url@codecommit/v1/repos/test_repo'))
+@patch.object(sys, 'argv', ['git-remote-codecommit', 'origin', 'TestRepo'])
+def test_main_with_native_transport():
+  with patch('git_remote_codecommit.native.run', Mock(return_value = 0)) as run_mock:
+    assert_main()
+
+  run_mock.assert_called_with('https://test_url@codecommit/v1/repos/test_repo', read_url = None, options = {}, remote = 'origin', retry = None, resign = ANY, ref_cache = None)
+
+
+@patch('git_remote_codecommit.Context.from_url', Mock())
+@patch('git_remote_codecommit.git_url', Mock(return_value = 'https://test_url@codecommit/v1/repos/test_repo'))
+def test_main_with_options():
+  with patch.object(sys, 'argv', ['git-remote-codecommit', 'origin', 'codecommit://TestRepo?protocol=0']):
+    assert_main(git_call = 'git -c protocol.version=0 remote-http origin https://test_url@codecommit/v1/repos/test_repo')
+
+  # only our own transport can filter or shallow fetches
+
+  with patch.object(sys, 'argv', ['git-remote-codecommit', 'origin', 'codecommit://TestRepo?filter=blob:none&depth=5']):
+    with patch('git_remote_codecommit.native.run', Mock(return_value = 0)) as run_mock:
+      assert_main()
+
+  run_mock.assert_called_with('https://test_url@codecommit/v1/repos/test_repo', read_url = None, options = {'filter': 'blob:none', 'depth': 5}, remote = 'origin', retry = None, resign = ANY, ref_cache = None)
+
+  with patch.object(sys, 'argv', ['git-remote-codecommit', 'origin', 'codecommit://TestRepo?depth=none']):
+    assert_main(stderr = 'The following URL has an invalid depth: none. Depth must be a positive number of commits.\n')
+
+
+@patch.dict('os.environ', {'GIT_REMOTE_CODECOMMIT_RETRIES': '2', 'GIT_REMOTE_CODECOMMIT_RATE_LIMIT': '5'})
+@patch('git_remote_codecommit.Context.from_url', Mock())
+@patch('git_remote_codecommit.git_url', Mock(return_value = 'https://test_url@git-codecommit.us-east-1.amazonaws.com/v1/repos/test_repo'))
+@patch.object(sys, 'argv', ['git-remote-codecommit', 'origin', 'codecommit://profile@TestRepo'])
+def test_main_with_retries():
+  with patch('git_remote_codecommit.throttle.acquire', Mock(return_value = 0.0)) as acquire_mock:
+    with patch('git_remote_codecommit.throttle.relay', Mock(return_value = 0)) as relay_mock:
+      assert_main()
+
+  acquire_mock.assert_called_with('profile@us-east-1')
+
+  command, url, retry = relay_mock.call_args[0]
+  assert ['git', 'remote-http', 'origin', 'https://other_url'] == command('https://other_url')
+  assert ('profile@us-east-1', 2) == (retry.key, retry.limit)
+  assert 'https://test_url@git-codecommit.us-east-1.amazonaws.com/v1/repos/test_repo' == retry.resign()
+
+
+@patch.dict('os.environ', {'GIT_REMOTE_CODECOMMIT_REF_CACHE': '30'})
+@patch('git_remote_codecommit.Context.from_url', Mock())
+@patch('git_remote_codecommit.git_url', Mock(return_value = 'https://test_url@git-codecommit.us-east-1.amazonaws.com/v1/repos/test_repo'))
+def test_main_with_ref_cache():
+  caches = []
+
+  for remote_url in ('codecommit://profile@TestRepo', 'codecommit://profile@TestRepo', 'codecommit://profile@OtherRepo', 'codecommit://other@TestRepo'):
+    with patch.object(sys, 'argv', ['git-remote-codecommit', 'origin', remote_url]):
+      with patch('git_remote_codecommit.native.run', Mock(return_value = 0)) as run_mock:
+        assert_main()
+
+    caches.append(run_mock.call_args[1]['ref_cache'])
+
+  # cached per repository and identity
+
+  assert 30 == caches[0].ttl
+  assert caches[0].key == caches[1].key
+  assert 3 == len(set(cache.key for cache in caches))
+
+
+@patch('git_remote_codecommit.Context.from_url', Mock())
+@patch('git_remote_codecommit.git_url', Mock(return_value = 'https://test_url@codecommit/v1/repos/test_repo'))
+@patch.object(sys, 'argv', ['git-remote-codecommit', 'origin', 'TestRepo'])
+def test_main_with_push_batches():
+  with patch.dict('os.environ', {'GIT_REMOTE_CODECOMMIT_PUSH_BATCH': '100'}):
+    with patch('git_remote_codecommit.native.run', Mock(return_value = 0)) as run_mock:
+      assert_main()
+
+  assert run_mock.called
+
+  # disabled batches leave us on git's own transport
+
+  for value in ('0', 'never'):
+    with patch.dict('os.environ', {'GIT_REMOTE_CODECOMMIT_PUSH_BATCH': value}):
+      assert_main(git_call = 'git remote-http origin https://test_url@codecommit/v1/repos/test_repo')
+
+
+def test_env_flag():
+  for value, expected in (('1', True), ('TRUE', True), ('yes', True), (' on ', True), ('0', False), ('False', False), ('no', False), ('off', False)):
+    with patch.dict('os.environ', {'GIT_REMOTE_CODECOMMIT_TEST_FLAG': value}):
+      assert expected == git_remote_codecommit._env_flag('GIT_REMOTE_CODECOMMIT_TEST_FLAG', default = not expected)
+
+  # unset, empty, and unrecognized values provide the default
+
+  for value in ('', 'maybe'):
+    with patch.dict('os.environ', {'GIT_REMOTE_CODECOMMIT_TEST_FLAG': value}):
+      assert not git_remote_codecommit._env_flag('GIT_REMOTE_CODECOMMIT_TEST_FLAG')
+      assert git_remote_codecommit._env_flag('GIT_REMOTE_CODECOMMIT_TEST_FLAG', default = True)
+
+  assert not git_remote_codecommit._env_flag('GIT_REMOTE_CODECOMMIT_UNSET_FLAG')
@@ -0,0 +1,116 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import io
+import os
+
+import botocore.credentials
+import pytest
+
+import git_server
+
+from git_remote_codecommit import Context, ProfileNotFound, mirror
+from mock import Mock, patch
+
+CREDENTIALS = botocore.credentials.Credentials('access', 'secret')
+
+pytestmark = pytest.mark.skipif(not git_server.available(), reason = 'requires git http-backend')
+
+
+def mock_context(remote_url):
+  if 'missing@' in remote_url:
+    raise ProfileNotFound('The following profile was not found: missing')
+
+  region = remote_url.split(':', 1)[0]
+  return Context(Mock(), remote_url.split('@')[-1], 'v1', region if region != 'codecommit' else 'us-east-1', CREDENTIALS)
+
+
+@pytest.fixture
+def server(tmp_path):
+  repositories = tmp_path / 'repositories'
+  repositories.mkdir()
+
+  for name in ('repo1', 'repo2', 'repo3'):
+    git_server.create_repository(str(repositories), name, commits = 2)
+
+  with git_server.GitServer(str(repositories)) as server:
+    with patch('git_remote_codecommit.Context.from_url', Mock(side_effect = mock_context)) as from_url_mock:
+      with patch('git_remote_codecommit.git_url', Mock(side_effect = lambda repository, *args: server.url(repository))):
+        server.from_url = from_url_mock
+        yield server
+
+
+def test_mirror(server, tmp_path):
+  remotes = ['codecommit::us-east-1://profile@repo1', 'codecommit::us-east-1://profile@repo2', 'codecommit://other@repo3']
+  progress = []
+  results = mirror.mirror(remotes, str(tmp_path / 'mirrors'), 2, lambda *args: progress.append(args))
+
+  assert all(result.success for result in results)
+  assert [1, 2, 3] == [completed for _, completed, _ in progress]
+  assert 2 == server.from_url.call_count  # once per profile and region
+
+  for name, profile in (('repo1', 'profile'), ('repo2', 'profile'), ('repo3', 'other')):
+    path = str(tmp_path / 'mirrors' / 'us-east-1' / profile / (name + '.git'))
+    assert 'commit 1' == git_server.git('--git-dir', path, 'log', '-1', '--format=%s', 'main')
+    assert git_server.git('--git-dir', path, 'remote', 'get-url', 'origin').endswith('@' + name)
+
+
+def test_mirror_fetches_updates(server, tmp_path):
+  mirrors = str(tmp_path / 'mirrors')
+  mirror.mirror(['codecommit://repo1'], mirrors, 1)
+
+  work = str(tmp_path / 'work')
+  git_server.git('clone', '-q', os.path.join(server.root, 'repo1'), work)
+  git_server.git('-C', work, 'commit', '-q', '--allow-empty', '-m', 'new commit')
+  git_server.git('-C', work, 'push', '-q', 'origin', 'main', 'main:refs/heads/feature')
+
+  results = mirror.mirror(['codecommit://repo1'], mirrors, 1)
+  assert results[0].success
+  assert 'new commit' == git_server.git('--git-dir', os.path.join(mirrors, 'us-east-1', 'repo1.git'), 'log', '-1', '--format=%s', 'feature')
+
+
+def test_mirror_like_named_repositories(server, tmp_path):
+  mirrors = tmp_path / 'mirrors'
+  remotes = ['codecommit::us-east-1://a@repo1', 'codecommit::eu-west-1://b@repo1', 'codecommit::us-east-1://a@repo1', 'us-east-1://a@repo1']
+  results = mirror.mirror(remotes, str(mirrors), 4)
+
+  assert all(result.success for result in results)
+  assert set([str(mirrors / 'us-east-1' / 'a' / 'repo1.git'), str(mirrors / 'eu-west-1' / 'b' / 'repo1.git')]) == set(result.path for result in results)
+
+  for path in set(result.path for result in results):
+    assert 'commit 1' == git_server.git('--git-dir', path, 'log', '-1', '--format=%s', 'main')
+
+
+def test_mirror_failures(server, tmp_path):
+  results = dict((result.remote, result) for result in mirror.mirror(['codecommit://profile@repo1', 'codecommit://missing@repo2', 'codecommit://profile@nonexistent'], str(tmp_path), 3))
+
+  assert results['codecommit://profile@repo1'].success
+  assert 'The following profile was not found: missing' == results['codecommit://missing@repo2'].message
+  assert not results['codecommit://profile@nonexistent'].success
+  assert 'secret' not in results['codecommit://profile@nonexistent'].message
+
+
+def test_main(server, tmp_path):
+  manifest = tmp_path / 'manifest.txt'
+  manifest.write_text(u'# our repositories\ncodecommit://repo1\n\ncodecommit://repo2\n')
+
+  with patch('sys.stderr', new_callable = io.StringIO) as stderr_mock:
+    assert 0 == mirror.main(['--manifest', str(manifest), '--directory', str(tmp_path / 'mirrors'), '--jobs', '2', 'codecommit://repo3'])
+
+  lines = stderr_mock.getvalue().splitlines()
+  assert 4 == len(lines)
+  assert lines[-1].startswith('Mirrored 3 of 3 repositories in ')
+
+  with patch('sys.stderr', new_callable = io.StringIO):
+    assert 0 == mirror.main(['--directory', str(tmp_path / 'mirrors'), '--', 'codecommit://repo1'])
+    assert 1 == mirror.main(['--directory', str(tmp_path / 'mirrors'), 'codecommit://profile@nonexistent'])
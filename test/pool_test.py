@@ -0,0 +1,214 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import asyncio
+import datetime
+import threading
+import time
+
+import botocore.credentials
+import pytest
+
+import git_remote_codecommit
+
+from git_remote_codecommit import Context, FormatError, ProfileNotFound
+from git_remote_codecommit.pool import SessionPool
+from mock import Mock, patch
+
+CREDENTIALS = botocore.credentials.Credentials('access', 'secret')
+
+
+def mock_context(remote_url):
+  if 'missing@' in remote_url:
+    raise ProfileNotFound('The following profile was not found: missing')
+
+  return Context(Mock(), remote_url.split('@')[-1], 'v1', 'us-east-1', CREDENTIALS)
+
+
+def expiring_credentials(seconds, refresh_using):
+  expiry_time = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds = seconds)
+
+  return botocore.credentials.RefreshableCredentials.create_from_metadata({
+      'access_key': 'access',
+      'secret_key': 'secret',
+      'token': 'token',
+      'expiry_time': expiry_time.isoformat(),
+  }, refresh_using, 'assume-role')
+
+
+def refreshed_metadata():
+  expiry_time = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours = 1)
+  return {'access_key': 'refreshed', 'secret_key': 'secret', 'token': 'token', 'expiry_time': expiry_time.isoformat()}
+
+
+@pytest.fixture
+def from_url():
+  with patch('git_remote_codecommit.Context.from_url', Mock(side_effect = mock_context)) as from_url_mock:
+    yield from_url_mock
+
+
+def test_import():
+  # pools are imported from their own module, so the hook never loads them
+  # and python versions without module __getattr__ can import them
+
+  assert SessionPool is git_remote_codecommit.pool.SessionPool
+  assert not hasattr(git_remote_codecommit, 'SessionPool')
+
+
+def test_reuses_sessions(from_url):
+  sessions = SessionPool()
+
+  url = sessions.git_url('codecommit://profile@test_repo')
+  assert url.startswith('https://access:')
+  assert url.endswith('@git-codecommit.us-east-1.amazonaws.com/v1/repos/test_repo')
+
+  assert sessions.git_url('codecommit://profile@other_repo').endswith('/v1/repos/other_repo')
+  assert 'other_repo' == sessions.context('codecommit://profile@other_repo').repository
+  assert {'depth': 1} == sessions.context('codecommit://profile@other_repo?depth=1').options
+  assert None is sessions.context('codecommit://profile@other_repo').options
+  assert 1 == from_url.call_count
+
+  sessions.git_url('us-east-1://profile@test_repo')
+  sessions.git_url('codecommit://other_profile@test_repo')
+  assert 3 == from_url.call_count
+  assert 3 == len(sessions)
+
+  sessions.clear()
+  sessions.git_url('codecommit://profile@test_repo')
+  assert 4 == from_url.call_count
+
+
+def test_resolves_once_when_concurrent(from_url):
+  def slow_context(remote_url):
+    time.sleep(0.1)
+    return mock_context(remote_url)
+
+  from_url.side_effect = slow_context
+  sessions = SessionPool()
+  urls = []
+
+  threads = [threading.Thread(target = lambda: urls.append(sessions.git_url('codecommit://profile@test_repo'))) for _ in range(10)]
+
+  for thread in threads:
+    thread.start()
+
+  for thread in threads:
+    thread.join()
+
+  assert 10 == len(urls)
+  assert 1 == from_url.call_count
+
+
+def test_evicts_least_recently_used(from_url):
+  sessions = SessionPool(max_size = 2)
+
+  sessions.context('codecommit://first@test_repo')
+  sessions.context('codecommit://second@test_repo')
+  sessions.context('codecommit://first@test_repo')
+  sessions.context('codecommit://third@test_repo')
+  assert 3 == from_url.call_count
+
+  sessions.context('codecommit://first@test_repo')
+  assert 3 == from_url.call_count
+
+  sessions.context('codecommit://second@test_repo')
+  assert 4 == from_url.call_count
+
+
+def test_evicts_by_age(from_url):
+  sessions = SessionPool(max_age = 60)
+  sessions.context('codecommit://profile@test_repo')
+
+  with patch('time.time', Mock(return_value = time.time() + 30)):
+    sessions.context('codecommit://profile@test_repo')
+
+  assert 1 == from_url.call_count
+
+  with patch('time.time', Mock(return_value = time.time() + 90)):
+    sessions.context('codecommit://profile@test_repo')
+
+  assert 2 == from_url.call_count
+
+
+def test_errors_are_not_cached(from_url):
+  sessions = SessionPool()
+
+  for _ in range(2):
+    with pytest.raises(ProfileNotFound):
+      sessions.git_url('codecommit://missing@test_repo')
+
+  assert 2 == from_url.call_count
+  assert 0 == len(sessions)
+
+  for remote_url in ('codecommit://profile@', 'test_repo', None, 'codecommit://profile@test_repo?bogus=1'):
+    with pytest.raises(FormatError):
+      sessions.git_url(remote_url)
+
+
+def test_refreshes_in_background(from_url):
+  refreshed = threading.Event()
+
+  def refresh_using():
+    refreshed.set()
+    return refreshed_metadata()
+
+  credentials = expiring_credentials(600, refresh_using)
+  from_url.side_effect = lambda remote_url: Context(Mock(), 'test_repo', 'v1', 'us-east-1', credentials)
+
+  sessions = SessionPool()
+  sessions.git_url('codecommit://profile@test_repo')
+
+  assert refreshed.wait(5)
+
+  for _ in range(50):
+    if credentials.access_key == 'refreshed':
+      break
+
+    time.sleep(0.02)
+
+  assert sessions.git_url('codecommit://profile@test_repo').startswith('https://refreshed%25token:')
+  assert 1 == from_url.call_count
+
+
+def test_refreshes_nearly_expired_credentials(from_url):
+  credentials = expiring_credentials(10, refreshed_metadata)
+  from_url.side_effect = lambda remote_url: Context(Mock(), 'test_repo', 'v1', 'us-east-1', credentials)
+
+  with patch('git_remote_codecommit.pool.threading.Thread') as thread_mock:
+    assert SessionPool().git_url('codecommit://profile@test_repo').startswith('https://refreshed%25token:')
+
+  assert not thread_mock.called
+
+
+def test_git_url_async(from_url):
+  sessions = SessionPool()
+
+  async def request(remote_url):
+    return await sessions.git_url_async(remote_url)
+
+  loop = asyncio.new_event_loop()
+
+  try:
+    with patch.object(loop, 'run_in_executor', wraps = loop.run_in_executor) as executor_mock:
+      assert loop.run_until_complete(request('codecommit://profile@test_repo')).endswith('/v1/repos/test_repo')
+      assert 1 == executor_mock.call_count
+
+      # sessions we have are signed without an executor
+
+      assert loop.run_until_complete(request('codecommit://profile@other_repo')).endswith('/v1/repos/other_repo')
+      assert 1 == executor_mock.call_count
+
+    with pytest.raises(ProfileNotFound):
+      loop.run_until_complete(request('codecommit://missing@test_repo'))
+  finally:
+    loop.close()
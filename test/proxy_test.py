@@ -0,0 +1,208 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import itertools
+import os
+import signal
+import stat
+import sys
+import threading
+import time
+
+import botocore.credentials
+import pytest
+
+import git_server
+
+import git_remote_codecommit
+
+from git_remote_codecommit import Context, ProfileNotFound, cache, endpoints, proxy
+from mock import Mock, patch
+
+try:
+  import http.client as http_client
+except ImportError:
+  import httplib as http_client
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CREDENTIALS = botocore.credentials.Credentials('access', 'secret')
+
+pytestmark = pytest.mark.skipif(not git_server.available(), reason = 'requires git http-backend')
+
+
+def mock_context(remote_url):
+  if 'missing@' in remote_url:
+    raise ProfileNotFound('The following profile was not found: missing')
+
+  return Context(Mock(), remote_url.split('@')[-1], 'v1', 'us-east-1', CREDENTIALS)
+
+
+@pytest.fixture
+def server(tmp_path):
+  repositories = tmp_path / 'repositories'
+  repositories.mkdir()
+  git_server.create_repository(str(repositories), 'test_repo', commits = 3)
+  signatures = itertools.count()
+
+  def sign(repository, version, region, credentials, hostname = None):
+    url = server.url(repository, 'access', 'signature-%i' % next(signatures))
+    return url.replace(server.hostname, hostname) if hostname else url
+
+  with git_server.GitServer(str(repositories)) as server:
+    with patch('git_remote_codecommit.Context.from_url', Mock(side_effect = mock_context)) as from_url_mock:
+      with patch('git_remote_codecommit.git_url', Mock(side_effect = sign)):
+        signing_proxy = proxy.Proxy()
+        thread = threading.Thread(target = signing_proxy.serve_forever, kwargs = {'poll_interval': 0.05})
+        thread.start()
+
+        state = {'pid': os.getpid(), 'port': signing_proxy.server_address[1], 'token': signing_proxy.token}
+        cache.write_json(proxy.state_path(), state)
+
+        server.from_url = from_url_mock
+        server.proxy = signing_proxy
+
+        try:
+          yield server
+        finally:
+          signing_proxy.shutdown()
+          signing_proxy.server_close()
+          thread.join()
+
+
+def test_clone_fetch_and_push(server, tmp_path):
+  remote = proxy.git_url('us-east-1://profile@test_repo')
+  assert remote.startswith('http://127.0.0.1:{}/{}/'.format(server.proxy.server_address[1], proxy.remote_token(server.proxy.token, 'us-east-1://profile@test_repo')))
+  assert server.proxy.token not in remote
+
+  first_clone, second_clone = str(tmp_path / 'first'), str(tmp_path / 'second')
+  git_server.git('clone', '-q', remote, first_clone)
+  git_server.git('clone', '-q', remote, second_clone)
+
+  # large enough that git streams the push with chunked transfer encoding
+
+  with open(os.path.join(first_clone, 'large.bin'), 'wb') as large_file:
+    large_file.write(os.urandom(3 * 1024 * 1024))
+
+  git_server.git('-C', first_clone, 'add', 'large.bin')
+  git_server.git('-C', first_clone, 'commit', '-q', '-m', 'pushed commit')
+  git_server.git('-C', first_clone, '-c', 'http.postBuffer=65536', 'push', '-q', 'origin', 'main')
+
+  git_server.git('-C', second_clone, 'pull', '-q')
+  assert 'pushed commit' == git_server.git('-C', second_clone, 'log', '-1', '--format=%s')
+
+  with open(os.path.join(second_clone, 'large.bin'), 'rb') as large_file:
+    assert 3 * 1024 * 1024 == len(large_file.read())
+
+  # each request was signed anew, over connections pooled between git processes
+
+  authorizations = [request[2] for request in server.requests]
+  assert len(authorizations) == len(set(authorizations))
+  assert len(set(request[3] for request in server.requests)) < len(server.requests)
+  assert 1 == server.from_url.call_count
+
+
+def test_unreachable_read_endpoint(server, tmp_path):
+  unreachable = endpoints.Endpoint('127.0.0.1:1', 'us-east-1')
+
+  def read_endpoint(region):
+    measured = cache.read_json(cache.cache_dir('endpoints.json')) or {}
+    return endpoints.primary(region) if unreachable.hostname in measured else unreachable
+
+  with patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_READ_ENDPOINTS': unreachable.hostname}):
+    with patch('git_remote_codecommit.endpoints.read_endpoint', side_effect = read_endpoint):
+      git_server.git('clone', '-q', proxy.git_url('us-east-1://profile@test_repo'), str(tmp_path / 'clone'))
+
+  # reads fell back to the primary, and the failed endpoint is avoided until
+  # it's remeasured
+
+  assert 'commit 2' == git_server.git('-C', str(tmp_path / 'clone'), 'log', '-1', '--format=%s')
+  assert cache.read_json(cache.cache_dir('endpoints.json'))[unreachable.hostname]['latency'] is None
+
+
+def test_requires_token(server):
+  connection = http_client.HTTPConnection('127.0.0.1', server.proxy.server_address[1])
+  connection.request('GET', '/wrong-token/us-east-1%3A%2F%2Fprofile%40test_repo/info/refs?service=git-upload-pack')
+  assert 403 == connection.getresponse().status
+  connection.close()
+
+  # tokens only authorize requests for their own remote
+
+  token = proxy.remote_token(server.proxy.token, 'us-east-1://profile@test_repo')
+
+  for path in ('/{}/us-east-1%3A%2F%2Fprofile%40other_repo/info/refs?service=git-upload-pack', '/{}'):
+    connection = http_client.HTTPConnection('127.0.0.1', server.proxy.server_address[1])
+    connection.request('GET', path.format(token))
+    assert 403 == connection.getresponse().status
+    connection.close()
+
+  assert [] == server.requests
+
+
+def test_relays_errors(server):
+  with pytest.raises(ProfileNotFound) as exc:
+    proxy.git_url('us-east-1://missing@test_repo')
+
+  assert 'The following profile was not found: missing' == str(exc.value)
+
+
+@patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_PROXY': 'true'})
+def test_main_uses_proxy(server):
+  with patch.object(sys, 'argv', ['git-remote-codecommit', 'origin', 'us-east-1://profile@test_repo']):
+    with patch('subprocess.call', Mock(return_value = 0)) as call_mock:
+      with pytest.raises(SystemExit):
+        git_remote_codecommit.main()
+
+  assert call_mock.call_args[0][0][3] == 'http://127.0.0.1:{}/{}/us-east-1%3A%2F%2Fprofile%40test_repo'.format(server.proxy.server_address[1], proxy.remote_token(server.proxy.token, 'us-east-1://profile@test_repo'))
+
+
+def test_starts_proxy(tmp_path):
+  (tmp_path / 'config').write_text('[profile demo]\nregion = us-east-1\n')
+  (tmp_path / 'credentials').write_text('[demo]\naws_access_key_id = access\naws_secret_access_key = secret\n')
+
+  env = {
+      'AWS_CONFIG_FILE': str(tmp_path / 'config'),
+      'AWS_SHARED_CREDENTIALS_FILE': str(tmp_path / 'credentials'),
+      'PYTHONPATH': PROJECT_ROOT,
+  }
+
+  with patch.dict(os.environ, env):
+    url = proxy.git_url('codecommit://demo@test_repo')
+    state_path = proxy.state_path()
+    state = cache.read_json(state_path)
+
+    try:
+      assert url == 'http://127.0.0.1:{}/{}/codecommit%3A%2F%2Fdemo%40test_repo'.format(state['port'], proxy.remote_token(state['token'], 'codecommit://demo@test_repo'))
+      assert 0o600 == stat.S_IMODE(os.stat(state_path).st_mode)
+
+      # later hooks reuse the running proxy
+
+      assert 'http://127.0.0.1:{}/{}/codecommit%3A%2F%2Fdemo%40other_repo'.format(state['port'], proxy.remote_token(state['token'], 'codecommit://demo@other_repo')) == proxy.git_url('codecommit://demo@other_repo')
+      assert state == cache.read_json(state_path)
+    finally:
+      os.kill(state['pid'], signal.SIGINT)
+
+    for _ in range(100):
+      if not os.path.exists(state_path):
+        break
+
+      time.sleep(0.05)
+
+    assert not os.path.exists(state_path)
+
+
+@patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_PROXY': 'true'})
+def test_enabled():
+  assert proxy.enabled()
+
+  with patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_PROXY': '0'}):
+    assert not proxy.enabled()
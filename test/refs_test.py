@@ -0,0 +1,172 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import os
+import stat
+import sys
+
+import pytest
+
+import git_server
+
+from git_remote_codecommit import refs
+from mock import Mock, patch
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Remote helper that git invokes for 'testrefs::<url>' remotes, running our
+# native transport with a cache of references.
+
+HELPER = """#!{python}
+import sys
+sys.path.insert(0, {root!r})
+from git_remote_codecommit import native, refs
+sys.exit(native.run(sys.argv[2], remote = sys.argv[1], ref_cache = refs.RefCache('test', refs.ttl())))
+"""
+
+
+@pytest.fixture
+def server(tmp_path):
+  bin_dir = tmp_path / 'bin'
+  bin_dir.mkdir()
+  helper_path = bin_dir / 'git-remote-testrefs'
+  helper_path.write_text(HELPER.format(python = sys.executable, root = PROJECT_ROOT))
+  helper_path.chmod(helper_path.stat().st_mode | stat.S_IEXEC)
+
+  git_server.create_repository(str(tmp_path), 'test_repo', commits = 3)
+
+  with patch.dict(os.environ, {'PATH': str(bin_dir) + os.pathsep + os.environ['PATH'], 'GIT_REMOTE_CODECOMMIT_REF_CACHE': '60'}):
+    with git_server.GitServer(str(tmp_path)) as server:
+      yield server
+
+
+def test_ttl():
+  with patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_REF_CACHE': ''}):
+    assert 0 == refs.ttl()
+
+  for value, expected in (('30', 30), ('-1', 0), ('soon', 0)):
+    with patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_REF_CACHE': value}):
+      assert expected == refs.ttl()
+
+
+def test_cache(isolated_cache):
+  now = [1000.0]
+
+  with patch('git_remote_codecommit.refs.time.time', lambda: now[0]):
+    cache = refs.RefCache('key', 60)
+    assert cache.get('info/refs?service=git-upload-pack') is None
+
+    cache.put('info/refs?service=git-upload-pack', b'advertisement')
+    cache.put('git-upload-pack', b'listing', b'command=ls-refs', {'Git-Protocol': 'version=2'})
+
+    assert b'advertisement' == cache.get('info/refs?service=git-upload-pack')
+    assert b'listing' == cache.get('git-upload-pack', b'command=ls-refs', {'Git-Protocol': 'version=2'})
+    assert cache.get('git-upload-pack', b'command=ls-refs') is None
+    assert refs.RefCache('other_key', 60).get('info/refs?service=git-upload-pack') is None
+
+    # responses expire after our ttl
+
+    now[0] += 60
+    assert cache.get('info/refs?service=git-upload-pack') is None
+
+    cache.put('info/refs?service=git-upload-pack', b'advertisement')
+    cache.invalidate()
+    assert cache.get('info/refs?service=git-upload-pack') is None
+
+    with open(cache.path, 'w') as cache_file:
+      cache_file.write('{"responses": ')
+
+    assert cache.get('info/refs?service=git-upload-pack') is None
+
+
+@patch('git_remote_codecommit.refs.subprocess.Popen')
+def test_revalidate(popen_mock, isolated_cache):
+  now = [1000.0]
+
+  with patch('git_remote_codecommit.refs.time.time', lambda: now[0]):
+    cache = refs.RefCache('key', 60)
+    cache.put('info/refs?service=git-upload-pack', b'advertisement')
+
+    cache.get('info/refs?service=git-upload-pack')
+    cache.revalidate('https://signed')
+    assert not popen_mock.called
+
+    # once halfway to expiring a single invocation refreshes our responses
+
+    now[0] += 30
+
+    for _ in range(3):
+      assert b'advertisement' == refs.RefCache('key', 60).get('info/refs?service=git-upload-pack')
+
+      cache = refs.RefCache('key', 60)
+      cache.get('info/refs?service=git-upload-pack')
+      cache.revalidate('https://signed')
+
+  assert 1 == popen_mock.call_count
+  assert [sys.executable, '-m', 'git_remote_codecommit.refs', 'key'] == popen_mock.call_args[0][0]
+  popen_mock.return_value.stdin.write.assert_called_with(b'https://signed')
+
+
+@pytest.mark.skipif(not git_server.available(), reason = 'requires git http-backend')
+@pytest.mark.parametrize('protocol', ['0', '2'])
+def test_listing_is_cached(server, tmp_path, protocol):
+  remote = 'testrefs::' + server.url('test_repo')
+  listing = git_server.git('-c', 'protocol.version=' + protocol, 'ls-remote', remote)
+  requests = len(server.requests)
+
+  for _ in range(3):
+    assert listing == git_server.git('-c', 'protocol.version=' + protocol, 'ls-remote', remote)
+
+  assert requests == len(server.requests)
+
+  # pushing through us discards what we cached
+
+  clone_path = str(tmp_path / 'clone')
+  git_server.git('clone', '-q', remote, clone_path)
+  git_server.git('-C', clone_path, 'commit', '-q', '--allow-empty', '-m', 'pushed commit')
+  git_server.git('-C', clone_path, 'push', '-q', 'origin', 'main')
+
+  head = git_server.git('-C', clone_path, 'rev-parse', 'HEAD')
+  assert head in git_server.git('-c', 'protocol.version=' + protocol, 'ls-remote', remote, 'main')
+
+
+@pytest.mark.skipif(not git_server.available(), reason = 'requires git http-backend')
+def test_refresh(server, tmp_path):
+  remote = 'testrefs::' + server.url('test_repo')
+  repository = str(tmp_path / 'test_repo')
+
+  git_server.git('ls-remote', remote)
+  git_server.git('-C', repository, 'branch', 'feature')
+  assert 'refs/heads/feature' not in git_server.git('ls-remote', remote)
+
+  requests = len(server.requests)
+  assert 2 == refs.refresh('test', server.url('test_repo'))
+  assert requests + 2 == len(server.requests)
+  assert 'refs/heads/feature' in git_server.git('ls-remote', remote)
+
+  # invalidated repositories aren't repopulated
+
+  refs.RefCache('test', 60).invalidate()
+  assert 0 == refs.refresh('test', server.url('test_repo'))
+  assert not os.path.exists(refs.RefCache('test', 60).path)
+
+
+def test_main(isolated_cache):
+  assert 1 == refs.main([])
+
+  with patch('git_remote_codecommit.refs.refresh', Mock(return_value = 1)) as refresh_mock:
+    with patch('sys.stdin') as stdin_mock:
+      stdin_mock.readline.return_value = 'https://signed\n'
+      assert 0 == refs.main(['key'])
+
+  refresh_mock.assert_called_with('key', 'https://signed')
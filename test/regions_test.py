@@ -0,0 +1,74 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import botocore.session
+
+import pytest
+
+from git_remote_codecommit import cache, regions, website_domain_mapping
+from mock import Mock, patch
+
+
+@pytest.fixture(autouse = True)
+def fresh_index():
+  with patch('git_remote_codecommit.regions._index', None):
+    yield
+
+
+def test_matches_botocore():
+  session = botocore.session.Session()
+  expected = {}
+
+  for partition in session.get_available_partitions():
+    for region in session.get_available_regions('codecommit', partition):
+      expected[region] = partition
+
+  assert expected == dict((region, entry[0]) for region, entry in regions.generate().items())
+
+
+def test_lookup():
+  assert ('aws', 'amazonaws.com') == regions.lookup('us-west-2')
+  assert ('aws-us-gov', 'amazonaws.com') == regions.lookup('us-gov-west-1')
+  assert ('aws-cn', 'amazonaws.com.cn') == regions.lookup('cn-north-1')
+  assert regions.lookup('zz-west-2') is None
+
+
+def test_website_domain_mapping():
+  assert 'amazonaws.com' == website_domain_mapping('us-east-1')
+  assert 'amazonaws.com.cn' == website_domain_mapping('cn-northwest-1')
+
+
+def test_index_is_cached(isolated_cache):
+  regions.index()
+  assert 'us-west-2' in cache.read_json(cache.cache_dir('regions.json'))['regions']
+
+  with patch('git_remote_codecommit.regions._index', None):
+    with patch('git_remote_codecommit.regions.generate', Mock(side_effect = AssertionError('should be cached'))):
+      assert ('aws', 'amazonaws.com') == regions.lookup('us-west-2')
+
+
+def test_index_regenerates_with_botocore(isolated_cache):
+  cache.write_json(cache.cache_dir('regions.json'), {'key': [regions.INDEX_VERSION, '0.0.1', None], 'regions': {'zz-west-2': ['aws', 'amazonaws.com']}})
+  assert regions.lookup('zz-west-2') is None
+  assert regions.lookup('us-west-2')
+
+
+def test_corrupt_index(isolated_cache):
+  cache.write_json(cache.cache_dir('regions.json'), {'key': 'boom'})
+  assert regions.lookup('us-west-2')
+
+  with patch('git_remote_codecommit.regions._index', None):
+    with open(cache.cache_dir('regions.json'), 'w') as index_file:
+      index_file.write('{"key": ')
+
+    assert regions.lookup('us-west-2')
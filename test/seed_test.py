@@ -0,0 +1,197 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import fcntl
+import os
+import stat
+import sys
+import time
+
+import pytest
+
+import git_server
+
+from git_remote_codecommit import seed
+from mock import patch
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HELPER = """#!{python}
+import sys
+sys.path.insert(0, {root!r})
+import git_remote_codecommit
+git_remote_codecommit.main()
+"""
+
+
+@pytest.fixture
+def seed_cache(tmp_path):
+  with patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_SEED_CACHE': str(tmp_path / 'seeds')}):
+    yield tmp_path / 'seeds'
+
+
+def wait_for(path, timeout = 10):
+  deadline = time.time() + timeout
+
+  while not os.path.exists(path) and time.time() < deadline:
+    time.sleep(0.05)
+
+  return os.path.exists(path)
+
+
+def write_bundle(path, size, last_used):
+  path.parent.mkdir(parents = True, exist_ok = True)
+  path.write_bytes(b'x' * size)
+  os.utime(str(path), (last_used, last_used))
+
+
+def test_enabled():
+  for value in ('true', 'on', '1'):
+    with patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_SEED_CACHE': value}):
+      assert seed.enabled()
+      assert seed.cache.cache_dir('seeds') == seed.seed_dir()
+
+  with patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_SEED_CACHE': '/var/cache/seeds'}):
+    assert seed.enabled()
+    assert '/var/cache/seeds/us-east-1/MyRepo.bundle' == seed.bundle_path('us-east-1', 'MyRepo')
+
+  for value in ('', ' ', '0', 'false', 'off'):
+    with patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_SEED_CACHE': value}):
+      assert not seed.enabled()
+
+
+@pytest.mark.skipif(not git_server.available(), reason = 'requires git')
+def test_ignores_repositories_with_references(seed_cache, tmp_path):
+  git_dir = git_server.create_repository(str(tmp_path), 'existing')
+
+  with patch.dict(os.environ, {'GIT_DIR': git_dir}):
+    with patch('git_remote_codecommit.Context.from_url') as from_url_mock:
+      assert seed.prepare('codecommit://demo@existing') is None
+
+  assert not from_url_mock.called
+
+
+@pytest.mark.skipif(not git_server.available(), reason = 'requires git')
+def test_prepare_without_session(seed_cache, tmp_path):
+  git_dir = git_server.create_repository(str(tmp_path), 'empty', commits = 0)
+
+  with patch.dict(os.environ, {'GIT_DIR': git_dir}):
+    with patch('git_remote_codecommit.Context.from_url') as from_url_mock:
+      seeding = seed.prepare('codecommit://demo@MyRepo', 'us-east-1')
+
+      assert seed.bundle_path('us-east-1', 'MyRepo') == seeding.bundle
+      assert [] == seeding.refs
+      assert not from_url_mock.called
+
+      # the region of 'codecommit://' remotes can require their session
+
+      from_url_mock.return_value.region = 'us-west-2'
+      assert seed.bundle_path('us-west-2', 'MyRepo') == seed.prepare('codecommit://demo@MyRepo').bundle
+
+
+def test_evicts_least_recently_used(seed_cache):
+  now = time.time()
+  write_bundle(seed_cache / 'us-east-1' / 'oldest.bundle', 1024 * 1024, now - 300)
+  write_bundle(seed_cache / 'us-east-1' / 'newest.bundle', 1024 * 1024, now)
+  write_bundle(seed_cache / 'us-west-2' / 'older.bundle', 1024 * 1024, now - 200)
+
+  with patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_SEED_CACHE_SIZE': '2'}):
+    seed.evict()
+
+  assert not (seed_cache / 'us-east-1' / 'oldest.bundle').exists()
+  assert (seed_cache / 'us-east-1' / 'newest.bundle').exists()
+  assert (seed_cache / 'us-west-2' / 'older.bundle').exists()
+
+  # bundles we just refreshed are kept regardless of the limit
+
+  with patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_SEED_CACHE_SIZE': '0'}):
+    seed.evict(keep = str(seed_cache / 'us-west-2' / 'older.bundle'))
+
+  assert not (seed_cache / 'us-east-1' / 'newest.bundle').exists()
+  assert (seed_cache / 'us-west-2' / 'older.bundle').exists()
+
+
+@pytest.mark.skipif(not git_server.available(), reason = 'requires git')
+def test_concurrent_refresh(seed_cache, tmp_path):
+  git_dir = git_server.create_repository(str(tmp_path), 'test_repo', commits = 2)
+  bundle = seed.bundle_path('us-east-1', 'test_repo')
+  os.makedirs(os.path.dirname(bundle))
+
+  with open(bundle + '.lock', 'a') as lock_file:
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    assert not seed.create(git_dir, bundle)
+
+  assert not os.path.exists(bundle)
+  assert seed.create(git_dir, bundle)
+  assert 'refs/heads/main' in git_server.git('bundle', 'list-heads', bundle, cwd = str(tmp_path))
+
+  # fresh bundles aren't recreated
+
+  assert not seed.create(git_dir, bundle)
+
+
+def test_seeds_clones(seed_cache, tmp_path):
+  certificate = git_server.create_certificate(str(tmp_path))
+
+  if not certificate or not git_server.available():
+    pytest.skip('requires openssl and git http-backend')
+
+  repository = git_server.create_repository(str(tmp_path), 'test_repo', commits = 2)
+  work = str(tmp_path / 'work')
+  git_server.git('clone', '-q', repository, work)
+
+  with open(os.path.join(work, 'large.bin'), 'wb') as large_file:
+    large_file.write(os.urandom(2 * 1024 * 1024))
+
+  git_server.git('-C', work, 'add', 'large.bin')
+  git_server.git('-C', work, 'commit', '-q', '-m', 'large commit')
+  git_server.git('-C', work, 'push', '-q', 'origin', 'main')
+
+  bin_dir = tmp_path / 'bin'
+  bin_dir.mkdir()
+  helper_path = bin_dir / 'git-remote-codecommit'
+  helper_path.write_text(HELPER.format(python = sys.executable, root = PROJECT_ROOT))
+  helper_path.chmod(helper_path.stat().st_mode | stat.S_IEXEC)
+
+  (tmp_path / 'config').write_text('[profile demo]\nregion = us-east-1\n')
+  (tmp_path / 'credentials').write_text('[demo]\naws_access_key_id = access\naws_secret_access_key = secret\n')
+
+  with git_server.GitServer(str(tmp_path), certificate = certificate) as server:
+    env = {
+        'PATH': str(bin_dir) + os.pathsep + os.environ['PATH'],
+        'PYTHONPATH': PROJECT_ROOT,
+        'AWS_CONFIG_FILE': str(tmp_path / 'config'),
+        'AWS_SHARED_CREDENTIALS_FILE': str(tmp_path / 'credentials'),
+        'CODE_COMMIT_ENDPOINT': server.hostname,
+        'GIT_SSL_NO_VERIFY': '1',
+    }
+
+    # our first clone downloads everything, then populates our cache
+
+    git_server.git('clone', '-q', 'codecommit://demo@test_repo', str(tmp_path / 'first'), env = env)
+    assert server.sent > 2 * 1024 * 1024
+    assert wait_for(str(seed_cache / 'us-east-1' / 'test_repo.bundle'))
+
+    git_server.git('-C', work, 'commit', '-q', '--allow-empty', '-m', 'new commit')
+    git_server.git('-C', work, 'push', '-q', 'origin', 'main')
+
+    # ... and later clones only download what changed
+
+    server.sent = 0
+    second_clone = str(tmp_path / 'second')
+    git_server.git('clone', '-q', 'codecommit://demo@test_repo', second_clone, env = env)
+
+    assert server.sent < 64 * 1024
+    assert 'new commit' == git_server.git('-C', second_clone, 'log', '-1', '--format=%s')
+    assert '' == git_server.git('-C', second_clone, 'for-each-ref', seed.SEED_REFS)
+    git_server.git('-C', second_clone, 'fsck', '--connectivity-only')
@@ -0,0 +1,76 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import random
+import string
+
+import botocore.auth
+import botocore.awsrequest
+import botocore.credentials
+
+from git_remote_codecommit.signer import Signer
+from mock import patch
+
+
+def botocore_sign(hostname, path, region, credentials, timestamp):
+  """
+  Signature as produced by botocore's SigV4Auth, which our signer must match.
+  """
+
+  request = botocore.awsrequest.AWSRequest(method = 'GIT', url = 'https://{}{}'.format(hostname, path))
+  request.context['timestamp'] = timestamp
+
+  signer = botocore.auth.SigV4Auth(credentials, 'codecommit', region)
+  canonical_request = 'GIT\n{}\n\nhost:{}\n\nhost\n'.format(path, hostname)
+  string_to_sign = signer.string_to_sign(request, canonical_request)
+  return '{}Z{}'.format(timestamp, signer.signature(string_to_sign, request))
+
+
+def test_matches_botocore():
+  signer = Signer()
+  rand = random.Random(42)
+
+  for _ in range(200):
+    secret = ''.join(rand.choice(string.ascii_letters + string.digits + '/+') for _ in range(40))
+    credentials = botocore.credentials.Credentials('access', secret)
+    region = rand.choice(['us-east-1', 'us-west-2', 'eu-central-1', 'cn-north-1', 'us-gov-west-1'])
+    path = '/v1/repos/' + ''.join(rand.choice(string.ascii_letters + '-_.') for _ in range(rand.randint(1, 40)))
+    timestamp = '2017{:02d}{:02d}T{:02d}{:02d}{:02d}'.format(rand.randint(1, 12), rand.randint(1, 28), rand.randint(0, 23), rand.randint(0, 59), rand.randint(0, 59))
+    hostname = 'git-codecommit.{}.amazonaws.com'.format(region)
+
+    assert botocore_sign(hostname, path, region, credentials, timestamp) == signer.sign(hostname, path, region, secret, timestamp)
+
+
+def test_derived_keys_are_cached():
+  signer = Signer()
+
+  with patch('git_remote_codecommit.signer.hmac.new', wraps = __import__('hmac').new) as hmac_mock:
+    signer.sign('host', '/v1/repos/repo1', 'us-east-1', 'secret', '20171224T115320')
+    assert 5 == hmac_mock.call_count  # four to derive the key, and one to sign
+
+    signer.sign('host', '/v1/repos/repo2', 'us-east-1', 'secret', '20171224T235959')
+    assert 6 == hmac_mock.call_count
+
+    signer.sign('host', '/v1/repos/repo2', 'us-west-2', 'secret', '20171224T235959')
+    signer.sign('host', '/v1/repos/repo2', 'us-east-1', 'other_secret', '20171224T235959')
+    assert 16 == hmac_mock.call_count
+
+
+def test_keys_are_evicted_each_day():
+  signer = Signer()
+  first_key = signer.signing_key('secret', '20171224', 'us-east-1')
+  assert first_key is signer.signing_key('secret', '20171224', 'us-east-1')
+
+  second_key = signer.signing_key('secret', '20171225', 'us-east-1')
+  assert first_key != second_key
+  assert [second_key] == list(signer._keys.values())
@@ -0,0 +1,121 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+"""
+Startup regressions for our console script. Git invokes the hook for every
+operation so time spent importing modules is paid constantly.
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+# Cumulative microseconds 'python -X importtime' may attribute to importing
+# our package. Overridable for slow machines.
+
+IMPORT_BUDGET = int(os.environ.get('GIT_REMOTE_CODECOMMIT_IMPORT_BUDGET', 50000))
+
+# Milliseconds beyond the interpreter's own startup that the hook may take to
+# provide git a signed url from static credentials. Overridable for slow
+# machines.
+
+STARTUP_BUDGET = int(os.environ.get('GIT_REMOTE_CODECOMMIT_STARTUP_BUDGET', 150))
+
+ENTRY_POINT = 'import sys; sys.argv = %r; import git_remote_codecommit; git_remote_codecommit.main()'
+
+# Hook invocation by git for a remote with static credentials, with the 'git
+# remote-http' it hands off to replaced by a no-op.
+
+STATIC_ENTRY_POINT = 'import os, subprocess, sys; sys.argv = ["git-remote-codecommit", "origin", "us-east-1://static@MyRepo"]; subprocess.call = lambda *args, **kwargs: 0; os.execvp = lambda file, args: (print(" ".join(args[:3])), sys.exit(0)); import git_remote_codecommit; git_remote_codecommit.main()'
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(code):
+  """
+  Runs python with the given code, providing the cumulative import time of
+  each top level module it loaded.
+
+  :param str code: python code to run
+
+  :returns: **dict** mapping module names to microseconds
+  """
+
+  env = dict(os.environ, PYTHONPATH = os.pathsep.join(filter(None, [PROJECT_ROOT, os.environ.get('PYTHONPATH')])))
+  process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], env = env, stderr = subprocess.PIPE, universal_newlines = True)
+  results = {}
+
+  for line in process.stderr.splitlines():
+    if not line.startswith('import time:') or '|' not in line:
+      continue
+
+    _, cumulative, module = line.split('|')
+
+    try:
+      results[module.strip()] = int(cumulative)
+    except ValueError:
+      pass  # header line
+
+  return results
+
+
+def startup_time(code, env = None):
+  """
+  Runs python with the given code several times, providing its fastest run.
+
+  :param str code: python code to run
+  :param dict env: environment to run with
+
+  :returns: tuple of the form (seconds, stdout)
+  """
+
+  runs = []
+
+  for _ in range(3):
+    start = time.time()
+    stdout = subprocess.check_output([sys.executable, '-c', code], env = env, universal_newlines = True)
+    runs.append((time.time() - start, stdout))
+
+  return min(runs)
+
+
+def test_startup_budget(tmp_path):
+  (tmp_path / 'credentials').write_text(u'[static]\naws_access_key_id = STATICACCESSKEY\naws_secret_access_key = secret\n')
+
+  env = dict(os.environ, PYTHONPATH = PROJECT_ROOT, AWS_SHARED_CREDENTIALS_FILE = str(tmp_path / 'credentials'))
+  subprocess.check_output([sys.executable, '-c', STATIC_ENTRY_POINT], env = env)  # generates our region index
+
+  interpreter, _ = startup_time('pass')
+  hook, stdout = startup_time(STATIC_ENTRY_POINT, env)
+  elapsed = int((hook - interpreter) * 1000)
+
+  assert 'git remote-http origin' == stdout.strip()
+  assert elapsed < STARTUP_BUDGET, 'providing git a signed url took %ims beyond python startup, exceeding our budget of %ims' % (elapsed, STARTUP_BUDGET)
+
+
+def test_import_budget():
+  times = import_times('import git_remote_codecommit')
+  assert 'git_remote_codecommit' in times
+  assert times['git_remote_codecommit'] < IMPORT_BUDGET, 'importing git_remote_codecommit took %ius, exceeding our budget of %ius' % (times['git_remote_codecommit'], IMPORT_BUDGET)
+
+
+def test_import_is_lazy():
+  times = import_times('import git_remote_codecommit')
+  assert not [module for module in times if module.split('.')[0] in ('botocore', 'awscli')]
+
+
+def test_argument_errors_skip_botocore():
+  for argv in (['git-remote-codecommit'], ['git-remote-codecommit', 'arg1', 'arg2', 'arg3']):
+    times = import_times(ENTRY_POINT % argv)
+    assert 'git_remote_codecommit' in times
+    assert not [module for module in times if module.split('.')[0] in ('botocore', 'awscli')]
@@ -0,0 +1,263 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import datetime
+import os
+import subprocess
+import sys
+
+import pytest
+
+import git_remote_codecommit
+
+from git_remote_codecommit import Context, static
+from mock import Mock, patch
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIG = """
+[default]
+region = us-west-2
+
+[profile static]
+region = us-east-1
+
+[profile keys-in-config]
+region = eu-west-1
+aws_access_key_id = CONFIGACCESSKEY
+aws_secret_access_key = config/secret+key
+aws_session_token = config-session-token
+
+[profile overridden]
+region = us-east-1
+aws_access_key_id = CONFIGACCESSKEY
+aws_secret_access_key = config-secret
+
+[profile no-region]
+
+[profile role]
+region = us-east-1
+role_arn = arn:aws:iam::123456789012:role/demo
+source_profile = static
+
+[profile sso]
+region = us-east-1
+sso_session = my-sso
+sso_account_id = 123456789012
+sso_role_name = demo
+
+[profile process]
+region = us-east-1
+credential_process = /bin/false
+
+[profile web-identity]
+region = us-east-1
+role_arn = arn:aws:iam::123456789012:role/demo
+web_identity_token_file = /nonexistent
+
+[profile partial]
+region = us-east-1
+"""
+
+CREDENTIALS = """
+[default]
+aws_access_key_id = DEFAULTACCESSKEY
+aws_secret_access_key = default-secret
+
+[static]
+aws_access_key_id = STATICACCESSKEY
+aws_secret_access_key = static/secret+key
+
+[overridden]
+aws_access_key_id = FILEACCESSKEY
+aws_secret_access_key = file-secret
+aws_security_token = security-token
+aws_session_token = session-token
+
+[credentials-only]
+region = ap-northeast-1
+aws_access_key_id = ONLYACCESSKEY
+aws_secret_access_key = only-secret
+
+[no-region]
+aws_access_key_id = NOREGIONACCESSKEY
+aws_secret_access_key = no-region-secret
+
+[process]
+aws_access_key_id = PROCESSACCESSKEY
+aws_secret_access_key = process-secret
+
+[partial]
+aws_access_key_id = PARTIALACCESSKEY
+"""
+
+ENV_NAMES = ('AWS_PROFILE', 'AWS_DEFAULT_PROFILE', 'AWS_DEFAULT_REGION', 'AWS_REGION', 'AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN', 'AWS_SECURITY_TOKEN', 'AWS_CREDENTIAL_EXPIRATION', 'AWS_ROLE_ARN', 'AWS_WEB_IDENTITY_TOKEN_FILE', 'CODE_COMMIT_ENDPOINT', 'GIT_REMOTE_CODECOMMIT_FAST_PATH')
+
+FIXED_TIME = Mock()
+FIXED_TIME.datetime.utcnow.return_value = datetime.datetime(2018, 10, 17, 3, 48, 12)
+
+
+@pytest.fixture(autouse = True)
+def aws_config(tmp_path):
+  (tmp_path / 'config').write_text(CONFIG)
+  (tmp_path / 'credentials').write_text(CREDENTIALS)
+
+  with patch.dict(os.environ, {'AWS_CONFIG_FILE': str(tmp_path / 'config'), 'AWS_SHARED_CREDENTIALS_FILE': str(tmp_path / 'credentials')}):
+    for name in ENV_NAMES:
+      os.environ.pop(name, None)
+
+    yield tmp_path
+
+
+def signed(context):
+  with patch('git_remote_codecommit.datetime', FIXED_TIME):
+    return git_remote_codecommit.git_url(context.repository, context.version, context.region, context.credentials)
+
+
+def assert_identical(remote_url, **env):
+  """
+  Asserts that we resolve a remote without botocore, signing the same url it
+  would.
+  """
+
+  with patch.dict(os.environ, env):
+    context = static.context(remote_url)
+    assert context is not None, 'expected %s to resolve without botocore' % remote_url
+    assert context.session is None
+    assert signed(Context.from_url(remote_url)) == signed(context)
+
+  return context
+
+
+def assert_needs_botocore(remote_url, **env):
+  with patch.dict(os.environ, env):
+    assert static.context(remote_url) is None
+
+
+def test_shared_credentials_file():
+  context = assert_identical('codecommit://static@MyRepo')
+  assert ('MyRepo', 'us-east-1', 'shared-credentials-file') == (context.repository, context.region, context.credentials.method)
+
+  assert_identical('codecommit://credentials-only@MyRepo')
+  assert_identical('eu-central-1://no-region@MyRepo')
+
+  context = assert_identical('codecommit://static@MyRepo?filter=blob:none&depth=50')
+  assert ('MyRepo', {'filter': 'blob:none', 'depth': 50}) == (context.repository, context.options)
+
+
+def test_config_file():
+  context = assert_identical('codecommit://keys-in-config@MyRepo')
+  assert ('eu-west-1', 'config-file', 'config-session-token') == (context.region, context.credentials.method, context.credentials.token)
+
+
+def test_credentials_file_takes_precedence():
+  context = assert_identical('codecommit://overridden@MyRepo')
+  assert ('FILEACCESSKEY', 'security-token') == (context.credentials.access_key, context.credentials.token)
+
+
+def test_default_profile():
+  assert_identical('codecommit://MyRepo')
+  assert_identical('codecommit://MyRepo', AWS_PROFILE = 'static')
+  assert_identical('codecommit://MyRepo', AWS_PROFILE = 'static', AWS_DEFAULT_PROFILE = 'credentials-only')
+  assert_identical('codecommit://MyRepo', AWS_DEFAULT_REGION = 'ca-central-1')
+  assert_identical('us-gov-west-1://MyRepo')
+  assert_identical('cn-north-1://static@MyRepo')
+
+
+def test_environment_variables():
+  env = {'AWS_ACCESS_KEY_ID': 'ENVACCESSKEY', 'AWS_SECRET_ACCESS_KEY': 'env/secret+key'}
+
+  context = assert_identical('codecommit://MyRepo', **env)
+  assert ('ENVACCESSKEY', None, 'env') == (context.credentials.access_key, context.credentials.token, context.credentials.method)
+
+  context = assert_identical('codecommit://MyRepo', AWS_SESSION_TOKEN = 'env-session-token', **env)
+  assert 'env-session-token' == context.credentials.token
+
+  assert_identical('codecommit://MyRepo', AWS_SECURITY_TOKEN = 'env-security-token', AWS_SESSION_TOKEN = 'env-session-token', **env)
+
+  # environment variables even take precedence over roles, but not over
+  # profiles within the url
+
+  assert_identical('codecommit://MyRepo', AWS_PROFILE = 'role', **env)
+  context = assert_identical('codecommit://static@MyRepo', **env)
+  assert 'STATICACCESSKEY' == context.credentials.access_key
+
+
+def test_endpoint_override():
+  assert_identical('codecommit://static@MyRepo', CODE_COMMIT_ENDPOINT = 'vpce-1.git-codecommit.us-east-1.vpce.amazonaws.com')
+
+
+def test_falls_back_to_botocore(aws_config):
+  for profile in ('role', 'sso', 'process', 'web-identity', 'partial', 'missing'):
+    assert_needs_botocore('codecommit://{}@MyRepo'.format(profile))
+
+  assert_needs_botocore('codecommit://MyRepo', AWS_PROFILE = 'missing')
+  assert_needs_botocore('codecommit://MyRepo', AWS_WEB_IDENTITY_TOKEN_FILE = '/nonexistent', AWS_ROLE_ARN = 'arn:aws:iam::123456789012:role/demo')
+  assert_needs_botocore('codecommit://MyRepo', AWS_ACCESS_KEY_ID = 'ENVACCESSKEY')
+  assert_needs_botocore('codecommit://MyRepo', AWS_ACCESS_KEY_ID = 'ENVACCESSKEY', AWS_SECRET_ACCESS_KEY = 'secret', AWS_CREDENTIAL_EXPIRATION = '2030-01-01T00:00:00Z')
+
+  # regions that are absent, unavailable, or malformed are reported by
+  # botocore's path
+
+  assert_needs_botocore('codecommit://no-region@MyRepo')
+  assert_needs_botocore('codecommit://static@MyRepo', AWS_DEFAULT_REGION = '')
+  assert_needs_botocore('xx-nowhere-1://static@MyRepo')
+  assert_needs_botocore('invalid://static@MyRepo')
+  assert_needs_botocore('MyRepo')
+  assert_needs_botocore('codecommit://static@MyRepo?bogus=1')
+
+  with open(str(aws_config / 'config'), 'a') as config_file:
+    config_file.write('\n[plugins]\ncli_example = example.plugin\n')
+
+  assert_needs_botocore('codecommit://static@MyRepo')
+
+  with open(str(aws_config / 'config'), 'a') as config_file:
+    config_file.write('\nmalformed line\n')
+
+  assert_needs_botocore('codecommit://static@MyRepo')
+
+
+def test_disabled():
+  assert static.enabled()
+
+  for value in ('false', 'off', '0'):
+    with patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_FAST_PATH': value}):
+      assert not static.enabled()
+
+
+@pytest.mark.skipif(os.name != 'posix', reason = 'exec replaces our process on posix')
+def test_main_execs_transport():
+  with patch.object(sys, 'argv', ['git-remote-codecommit', 'origin', 'codecommit://static@MyRepo']):
+    with patch('os.execvp', Mock(side_effect = SystemExit(0))) as execvp_mock:
+      with patch('git_remote_codecommit.Context.from_url') as from_url_mock:
+        with pytest.raises(SystemExit):
+          git_remote_codecommit.main()
+
+  args = execvp_mock.call_args[0]
+  assert 'git' == args[0]
+  assert ['git', 'remote-http', 'origin'] == args[1][:3]
+  assert args[1][3].startswith('https://STATICACCESSKEY:')
+  assert args[1][3].endswith('@git-codecommit.us-east-1.amazonaws.com/v1/repos/MyRepo')
+  assert not from_url_mock.called
+
+
+@pytest.mark.skipif(os.name != 'posix', reason = 'exec replaces our process on posix')
+def test_main_skips_botocore(tmp_path):
+  code = 'import os, sys; sys.argv = ["git-remote-codecommit", "origin", "codecommit://static@MyRepo"]; os.execvp = lambda *args: (print(sorted(name for name in sys.modules if name.startswith("botocore"))), sys.exit(0)); import git_remote_codecommit; git_remote_codecommit.main()'
+  env = dict(os.environ, PYTHONPATH = PROJECT_ROOT, GIT_REMOTE_CODECOMMIT_CACHE_DIR = str(tmp_path / 'cache'))
+
+  # our region index is generated from botocore's endpoint data once, then
+  # read from disk
+
+  subprocess.check_output([sys.executable, '-c', code], env = env)
+  assert '[]' == subprocess.check_output([sys.executable, '-c', code], env = env, universal_newlines = True).strip()
@@ -0,0 +1,302 @@
+# Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"). You
+# may not use this file except in compliance with the License. A copy of
+# the License is located at
+#
+#     http://aws.amazon.com/apache2.0/
+#
+# or in the "license" file accompanying this file. This file is
+# distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF
+# ANY KIND, either express or implied. See the License for the specific
+# language governing permissions and limitations under the License.
+
+import io
+import os
+import stat
+import subprocess
+import sys
+import time
+
+import pytest
+
+import git_server
+
+from git_remote_codecommit import throttle
+from mock import Mock, patch
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Remote helper that git invokes for 'testrelay::<url>' remotes, relaying to
+# git's own https transport with retries.
+
+HELPER = """#!{python}
+import sys
+sys.path.insert(0, {root!r})
+from git_remote_codecommit import throttle
+retry = throttle.Retry('test@us-east-1', lambda: sys.argv[2])
+sys.exit(throttle.relay(lambda url: ['git', 'remote-http', sys.argv[1], url], sys.argv[2], retry))
+"""
+
+# Stand-in for git's transport that fails with a throttling error on the runs
+# listed by its first argument, counting its runs in a file.
+
+TRANSPORT = """
+import sys
+
+with open(sys.argv[2], 'a') as counter:
+  counter.write('.')
+
+with open(sys.argv[2]) as counter:
+  run = len(counter.read())
+
+for line in sys.stdin:
+  if line == 'capabilities\\n':
+    sys.stdout.write('fetch\\noption\\n\\n' if str(run) not in sys.argv[3].split(',') else 'something else\\n\\n')
+  elif line == 'list\\n':
+    if str(run) in sys.argv[1].split(','):
+      sys.stderr.write("fatal: unable to access 'https://example/': The requested URL returned error: 429\\n")
+      sys.exit(128)
+
+    sys.stdout.write('0123456789012345678901234567890123456789 refs/heads/main via %s\\n\\n' % sys.argv[4])
+
+  sys.stdout.flush()
+"""
+
+
+class Git(object):
+  """
+  Stand-in for git's side of the remote helper protocol, which sends each
+  command once the prior one is answered.
+  """
+
+  def __init__(self, commands):
+    self.stdout = io.BytesIO()
+    self._commands = list(commands)
+    self._sent = 0
+
+  def read1(self, size):
+    deadline = time.time() + 10
+
+    while self.stdout.getvalue().count(b'\n\n') < self._sent:
+      if time.time() > deadline:
+        return b''
+
+      time.sleep(0.01)
+
+    if self._sent == len(self._commands):
+      return b''
+
+    self._sent += 1
+    return self._commands[self._sent - 1]
+
+
+@pytest.fixture
+def no_sleep():
+  with patch('git_remote_codecommit.throttle.time.sleep') as sleep_mock:
+    yield sleep_mock
+
+
+def test_configuration():
+  with patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_RATE_LIMIT': '', 'GIT_REMOTE_CODECOMMIT_RETRIES': ''}):
+    assert throttle.rate_limit() is None
+    assert 0 == throttle.retries()
+
+  settings = {
+      ('2.5', ''): (2.5, 2.5),
+      ('0.2', ''): (0.2, 1.0),
+      ('10', '30'): (10.0, 30.0),
+      ('10', 'lots'): (10.0, 10.0),
+      ('0', '30'): None,
+      ('fast', ''): None,
+  }
+
+  for (rate, burst), expected in settings.items():
+    with patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_RATE_LIMIT': rate, 'GIT_REMOTE_CODECOMMIT_RATE_BURST': burst}):
+      assert expected == throttle.rate_limit()
+
+  for value, expected in (('3', 3), ('-1', 0), ('many', 0)):
+    with patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_RETRIES': value}):
+      assert expected == throttle.retries()
+
+
+def test_retryable():
+  assert throttle.retryable(429)
+  assert throttle.retryable(503, time.time())
+  assert not throttle.retryable(404)
+  assert not throttle.retryable(500)
+
+  # forbidden responses are only attributed to old signatures
+
+  assert not throttle.retryable(403)
+  assert not throttle.retryable(403, time.time() - 5)
+  assert throttle.retryable(403, time.time() - throttle.SIGNATURE_AGE)
+
+
+def test_backoff():
+  for attempt in range(1, 10):
+    delays = [throttle.backoff(attempt) for _ in range(50)]
+    assert all(0 <= delay <= min(throttle.BACKOFF_MAX, throttle.BACKOFF_BASE * 2 ** attempt) for delay in delays)
+    assert len(set(delays)) > 1  # jittered
+
+
+@patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_RATE_LIMIT': '10', 'GIT_REMOTE_CODECOMMIT_RATE_BURST': '2'})
+def test_acquire(no_sleep):
+  now = [1000.0]
+
+  with patch('git_remote_codecommit.throttle.time.time', lambda: now[0]):
+    assert [0.0, 0.0] == [throttle.acquire('profile@us-east-1') for _ in range(2)]
+
+    # once our burst is spent waits are reserved in turn
+
+    assert pytest.approx([0.1, 0.2, 0.3]) == [throttle.acquire('profile@us-east-1') for _ in range(3)]
+    assert 0.0 == throttle.acquire('other@us-east-1')
+
+    now[0] += 10
+    assert 0.0 == throttle.acquire('profile@us-east-1')
+
+  assert 3 == no_sleep.call_count
+
+  stats = throttle.stats()
+  assert {'profile@us-east-1', 'other@us-east-1'} == set(stats)
+  assert (6, 3) == (stats['profile@us-east-1']['invocations'], stats['profile@us-east-1']['waits'])
+  assert pytest.approx(0.6) == stats['profile@us-east-1']['wait_seconds']
+  assert pytest.approx(0.3) == stats['profile@us-east-1']['max_wait']
+
+  # unlimited invocations neither wait nor touch our state
+
+  with patch.dict(os.environ, {'GIT_REMOTE_CODECOMMIT_RATE_LIMIT': ''}):
+    assert 0.0 == throttle.acquire('profile@us-east-1')
+
+  assert 6 == throttle.stats()['profile@us-east-1']['invocations']
+
+
+def test_acquire_across_processes(isolated_cache):
+  code = 'import sys; sys.path.insert(0, {!r}); from git_remote_codecommit import throttle; print(throttle.acquire("profile@us-east-1"))'.format(PROJECT_ROOT)
+  env = dict(os.environ, GIT_REMOTE_CODECOMMIT_RATE_LIMIT = '5', GIT_REMOTE_CODECOMMIT_RATE_BURST = '1')
+
+  start = time.time()
+  processes = [subprocess.Popen([sys.executable, '-c', code], env = env, stdout = subprocess.PIPE, universal_newlines = True) for _ in range(5)]
+  waits = sorted(float(process.communicate()[0]) for process in processes)
+
+  assert time.time() - start >= 0.7
+  assert 0.0 == waits[0]
+  assert pytest.approx([0.2, 0.4, 0.6, 0.8], abs = 0.1) == waits[1:]
+  assert 5 == throttle.stats()['profile@us-east-1']['invocations']
+
+
+def test_retry_budget(no_sleep):
+  resign = Mock(side_effect = ['https://first', 'https://second'])
+  retry = throttle.Retry('profile@us-east-1', resign, limit = 2)
+
+  with patch('sys.stderr', io.StringIO()) as stderr:
+    assert 'https://first' == retry(429, 'https://old')
+    assert 'https://second' == retry(503, 'https://first')
+    assert retry(429, 'https://second') is None
+
+  assert 'CodeCommit responded with 429, retrying in' in stderr.getvalue()
+  assert 2 == retry.attempts
+  assert {'throttled': 3, 'retries': 2} == throttle.stats()['profile@us-east-1']
+
+  # other errors aren't retried
+
+  assert throttle.Retry('profile@us-east-1', resign, limit = 2)(404, 'https://old') is None
+
+
+def run_relay(tmp_path, failures = '', diverges = '', limit = 2):
+  (tmp_path / 'transport.py').write_text(TRANSPORT)
+  resign = Mock(side_effect = ['https://resigned-{}'.format(i) for i in range(5)])
+  retry = throttle.Retry('profile@us-east-1', resign, limit = limit)
+
+  git, stderr = Git([b'capabilities\n', b'list\n']), io.BytesIO()
+
+  with patch('sys.stderr', io.StringIO()):
+    exit_code = throttle.relay(
+        lambda url: [sys.executable, str(tmp_path / 'transport.py'), failures, str(tmp_path / 'counter'), diverges, url],
+        'https://signed',
+        retry,
+        stdin = git,
+        stdout = git.stdout,
+        stderr = stderr,
+    )
+
+  return exit_code, git.stdout.getvalue(), stderr.getvalue(), retry
+
+
+def test_relay_retries_throttled_transports(tmp_path, no_sleep):
+  exit_code, stdout, stderr, retry = run_relay(tmp_path, failures = '1,2')
+
+  # output git has already read isn't repeated
+
+  assert 0 == exit_code
+  assert b'fetch\noption\n\n0123456789012345678901234567890123456789 refs/heads/main via https://resigned-1\n\n' == stdout
+  assert b'' == stderr
+  assert 2 == retry.attempts
+
+
+def test_relay_exhausts_retries(tmp_path, no_sleep):
+  exit_code, stdout, stderr, retry = run_relay(tmp_path, failures = '1,2,3')
+
+  assert 128 == exit_code
+  assert b'fetch\noption\n\n' == stdout
+  assert b'returned error: 429' in stderr
+  assert 2 == retry.attempts
+
+
+def test_relay_stops_if_output_differs(tmp_path, no_sleep):
+  exit_code, stdout, stderr, retry = run_relay(tmp_path, failures = '1', diverges = '2')
+
+  assert 128 == exit_code
+  assert b'fetch\noption\n\n' == stdout
+  assert b'returned error: 429' in stderr
+  assert 1 == retry.attempts
+
+
+def test_relay_errors():
+  chunks = [b'Receiving objects:  50%\rReceiving', b' objects: 100%\r\nfatal: unable to access', b" 'x': The requested URL returned error: 429\n", b'partial']
+  source, destination = Mock(), io.BytesIO()
+  source.read1.side_effect = chunks + [b'']
+
+  errors = throttle._Errors(source, destination)
+  errors.run()
+
+  assert 429 == errors.status
+  assert [b"fatal: unable to access 'x': The requested URL returned error: 429\n"] == errors.held
+  assert b'Receiving objects:  50%\rReceiving objects: 100%\r\npartial' == destination.getvalue()
+
+
+@pytest.mark.skipif(not git_server.available(), reason = 'requires git http-backend')
+@pytest.mark.parametrize('protocol', ['0', '2'])
+def test_relay_with_git(tmp_path, no_sleep, protocol):
+  bin_dir = tmp_path / 'bin'
+  bin_dir.mkdir()
+  helper_path = bin_dir / 'git-remote-testrelay'
+  helper_path.write_text(HELPER.format(python = sys.executable, root = PROJECT_ROOT))
+  helper_path.chmod(helper_path.stat().st_mode | stat.S_IEXEC)
+
+  git_server.create_repository(str(tmp_path), 'test_repo', commits = 3)
+  signed = []
+
+  # git's transport can only be retried before it responds to git, which for
+  # protocol v2 is during its discovery
+
+  throttled = (1, 3) if protocol == '0' else (1, 2)
+
+  def throttle_some(handler):
+    signed.append(handler.path)
+    return 429 if len(signed) in throttled else True
+
+  with patch.dict(os.environ, {'PATH': str(bin_dir) + os.pathsep + os.environ['PATH'], 'GIT_REMOTE_CODECOMMIT_RETRIES': '3'}):
+    with git_server.GitServer(str(tmp_path)) as server:
+      server.authorize = throttle_some
+      clone_path = str(tmp_path / 'clone')
+      git_server.git('-c', 'protocol.version=' + protocol, 'clone', '-q', 'testrelay::' + server.url('test_repo'), clone_path)
+
+  assert 'commit 2\ncommit 1\ncommit 0' == git_server.git('-C', clone_path, 'log', '--format=%s')
+  assert 2 == throttle.stats()['test@us-east-1']['retries']
+
+
+def test_main(capsys):
+  throttle.record('profile@us-east-1', throttled = 2, retries = 1)
+  assert 0 == throttle.main([])
+  assert '"profile@us-east-1": {\n    "retries": 1,\n    "throttled": 2\n  }' in capsys.readouterr().out